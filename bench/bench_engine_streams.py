@@ -0,0 +1,190 @@
+"""Threads and memory for many concurrent streams: one thread per stream vs the network engine
+
+Starts a local SSE server that streams fake chat completion chunks, then,
+in a fresh process per run, opens 1 and N concurrent streams either with
+one blocking thread per stream (the old model) or as tasks on the
+network engine's single event loop. For each run it reports the peak
+number of threads and the resident memory growth over the idle process.
+
+Usage: python bench/bench_engine_streams.py [--streams 20] [--chunks 50] [--interval 0.04]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        chunk = {'id': 'bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'bench',
+                 'choices': [{'index': 0, 'delta': {'content': 'token '}}]}
+        for _ in range(self.server.chunks):
+            time.sleep(self.server.interval)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, chunks, interval):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StreamHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 128
+    server.chunks = chunks
+    server.interval = interval
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Sampler:
+    """Peak thread count and RSS while the streams run (the sampler's own thread is not counted)"""
+
+    def __init__(self):
+        self.peak_threads = threading.active_count()
+        self.peak_rss = rss_kb()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(0.02):
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+            self.peak_rss = max(self.peak_rss, rss_kb())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_threads(base_url, streams):
+    from routstr.conversation import create_client, iter_stream
+
+    client = create_client('bench', base_url=base_url)
+    messages = [{"role": "user", "content": "hi"}]
+
+    def worker():
+        stream = client.chat.completions.create(model='bench', messages=messages, stream=True)
+        for _ in iter_stream(stream):
+            pass
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(streams)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+
+def run_engine(base_url, streams):
+    import asyncio
+    from routstr.conversation import aiter_stream, create_async_client
+    from routstr.engine import engine
+
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def one(client):
+        stream = await client.chat.completions.create(model='bench', messages=messages, stream=True)
+        async for _ in aiter_stream(stream):
+            pass
+
+    async def all_streams():
+        client = create_async_client('bench', base_url=base_url)
+        await asyncio.gather(*(one(client) for _ in range(streams)))
+
+    engine.submit(all_streams()).result()
+    engine.close()
+
+
+def child(mode, base_url, streams):
+    # Import the SDK first so its memory is part of the baseline
+    from routstr.conversation import load_sdk
+    from routstr.transport import connection_manager
+    load_sdk()
+    import openai  # noqa: F401
+    connection_manager.max_connections = connection_manager.max_keepalive = max(streams, 20)
+
+    baseline_threads = threading.active_count()
+    baseline_rss = rss_kb()
+    started = time.perf_counter()
+    with Sampler() as sampler:
+        (run_threads if mode == 'threads' else run_engine)(base_url, streams)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        'threads': sampler.peak_threads,
+        'extra_threads': sampler.peak_threads - baseline_threads,
+        'rss_growth_kb': sampler.peak_rss - baseline_rss,
+        'seconds': round(elapsed, 2)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=20)
+    parser.add_argument('--chunks', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.04, help="seconds between chunks")
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve, args.chunks, args.interval)
+        return
+    if args.child:
+        child(args.child, args.base_url, args.streams)
+        return
+
+    server = subprocess.Popen(
+        [sys.executable, __file__, '--serve', '0', '--chunks', str(args.chunks), '--interval', str(args.interval)],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        base_url = f"http://127.0.0.1:{server.stdout.readline().strip()}/v1"
+        print(f"{args.chunks} chunks per stream, {args.interval * 1000:.0f} ms apart\n")
+        print(f"{'model':<10}{'streams':>8}{'threads':>9}{'extra':>7}{'RSS +KB':>10}{'seconds':>9}")
+        for mode in ('threads', 'engine'):
+            for streams in sorted({1, args.streams}):
+                output = subprocess.run(
+                    [sys.executable, __file__, '--child', mode, '--base-url', base_url, '--streams', str(streams)],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{mode:<10}{streams:>8}{result['threads']:>9}{result['extra_threads']:>7}"
+                      f"{result['rss_growth_kb']:>10,}{result['seconds']:>9}")
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Per-delta cost of the incremental Markdown renderer as a reply grows
+
+Streams a synthetic reply (prose, lists, headings and fenced code, one
+token per delta) through MarkdownStream and reports the mean cost of a
+delta at several points of the reply. For comparison, the naive approach
+of re-rendering the whole reply on every delta is measured on a shorter
+reply; its cost per delta grows with the reply.
+
+Usage: python bench/bench_markdown_stream.py [--tokens 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routstr.markdown import MarkdownStream, render
+
+BLOCK = """## Step {n}
+Here is **why** this works: the *cache* keeps `state` between calls, see [docs](https://example.com/{n}).
+- first point with `inline` code
+- second point, **bold** again
+```python
+def step_{n}(items):  # process one batch
+    total = sum(x * 2 for x in items if x > {n})
+    return {{"step": {n}, "total": total, "label": 'done'}}
+```
+> Note: quoted text with *emphasis* and numbers like 3.14.
+
+"""
+
+
+def build_deltas(tokens):
+    deltas = []
+    n = 0
+    while len(deltas) < tokens:
+        text = BLOCK.format(n=n)
+        # Roughly one word (with its leading space or newline) per delta
+        word = ""
+        for char in text:
+            word += char
+            if char in " \n":
+                deltas.append(word)
+                word = ""
+        if word:
+            deltas.append(word)
+        n += 1
+    return deltas[:tokens]
+
+
+def incremental(deltas, windows):
+    stream = MarkdownStream()
+    times = []
+    for delta in deltas:
+        started = time.perf_counter()
+        stream.feed(delta)
+        times.append(time.perf_counter() - started)
+    stream.finish()
+    return {at: sum(times[max(0, at - 1000):at]) / min(at, 1000) for at in windows}
+
+
+def naive(deltas, windows):
+    text = ""
+    times = []
+    for delta in deltas:
+        text += delta
+        started = time.perf_counter()
+        render(text)
+        times.append(time.perf_counter() - started)
+    return {at: sum(times[max(0, at - 100):at]) / min(at, 100) for at in windows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=20000)
+    parser.add_argument('--naive-tokens', type=int, default=2000)
+    args = parser.parse_args()
+
+    deltas = build_deltas(args.tokens)
+    windows = [at for at in (1000, 5000, 10000, 20000, 50000) if at <= args.tokens] or [args.tokens]
+    results = incremental(deltas, windows)
+    print(f"incremental, {args.tokens:,} deltas ({sum(map(len, deltas)) / 1024:.0f} KB)")
+    for at, cost in results.items():
+        print(f"  deltas {max(0, at - 1000):>6,}-{at:<6,} {cost * 1e6:8.2f} us/delta")
+
+    naive_windows = [at for at in (500, 1000, 2000, 5000) if at <= args.naive_tokens] or [args.naive_tokens]
+    print(f"\nnaive full re-render, {args.naive_tokens:,} deltas")
+    for at, cost in naive(deltas[:args.naive_tokens], naive_windows).items():
+        print(f"  deltas {max(0, at - 100):>6,}-{at:<6,} {cost * 1e6:8.2f} us/delta")
+
+
+if __name__ == '__main__':
+    main()
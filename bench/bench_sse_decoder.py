@@ -0,0 +1,108 @@
+"""Streaming decode cost: the OpenAI SDK's chunk models vs the raw SSE decoder
+
+Serves a synthetic chat completion stream (one token per chunk, then a
+usage chunk) from memory through httpx.MockTransport, so only client-side
+work is measured: request building, SSE parsing, JSON decoding and, on
+the SDK path, building a ChatCompletionChunk per token. Reports chunks
+per second and CPU milliseconds per 1,000 tokens for both paths.
+
+Usage: python bench/bench_sse_decoder.py [--tokens 20000] [--rounds 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from routstr.conversation import iter_stream
+from routstr.sse import open_raw_stream
+
+BASE_URL = "http://bench.invalid/v1"
+MESSAGES = [{"role": "user", "content": "Count to a big number"}]
+
+
+def build_body(tokens):
+    events = []
+    for i in range(tokens):
+        chunk = {
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 1700000000,
+            "model": "bench/model", "system_fingerprint": "fp_bench",
+            "choices": [{"index": 0, "delta": {"content": f" tok{i % 97}"}, "logprobs": None, "finish_reason": None}]
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n")
+    usage = {
+        "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 1700000000, "model": "bench/model",
+        "choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": tokens, "total_tokens": tokens + 12}
+    }
+    events.append(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n")
+    return "".join(events).encode()
+
+
+def mock_client(body):
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body)
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def consume(stream):
+    chunks = 0
+    total = None
+    for content, total_tokens in iter_stream(stream):
+        if content is not None:
+            chunks += 1
+        if total_tokens is not None:
+            total = total_tokens
+    return chunks, total
+
+
+def run_sdk(http_client):
+    from openai import OpenAI
+    client = OpenAI(base_url=BASE_URL, api_key="bench", http_client=http_client)
+    return consume(client.chat.completions.create(
+        model="bench/model", messages=MESSAGES, stream=True, stream_options={"include_usage": True}
+    ))
+
+
+def run_raw(http_client):
+    return consume(open_raw_stream(http_client, BASE_URL, "bench", "bench/model", MESSAGES))
+
+
+def measure(run, http_client, rounds):
+    best_wall = best_cpu = None
+    for _ in range(rounds):
+        wall, cpu = time.perf_counter(), time.process_time()
+        chunks, total = run(http_client)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    return chunks, total, best_wall, best_cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    body = build_body(args.tokens)
+    http_client = mock_client(body)
+    print(f"{args.tokens:,} chunks, {len(body) / 1024 / 1024:.1f} MB of SSE, best of {args.rounds}\n")
+    print(f"{'decoder':<8}{'chunks/s':>12}{'CPU ms/1k tokens':>18}")
+
+    results = {}
+    for name, run in (('sdk', run_sdk), ('raw', run_raw)):
+        run(http_client)  # warm up imports and the connection
+        chunks, total, wall, cpu = measure(run, http_client, args.rounds)
+        assert chunks == args.tokens and total == args.tokens + 12, (name, chunks, total)
+        results[name] = cpu
+        print(f"{name:<8}{chunks / wall:>12,.0f}{cpu / chunks * 1e6:>18.2f}")
+
+    print(f"\nraw decoder uses {results['sdk'] / results['raw']:.1f}x less CPU per token")
+
+
+if __name__ == '__main__':
+    main()
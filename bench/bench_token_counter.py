@@ -0,0 +1,85 @@
+"""Micro-benchmark for the offline token counter
+
+Builds a synthetic multi-megabyte transcript and measures:
+  - cold counting throughput (every message tokenized once)
+  - memoized re-counting (what the context budget does on each request)
+  - the running prompt total kept by Conversation.append
+
+Usage: python bench/bench_token_counter.py [--megabytes 8] [--tokenizer estimate|tiktoken]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routstr import tokens
+from routstr.tokens import TokenCounter, message_tokens
+
+PROSE = (
+    "The quick brown fox jumps over the lazy dog while the lightning network settles "
+    "payments instantly. Cashu tokens are bearer ecash, and Tor hides the client's IP. "
+)
+CODE = (
+    "```python\ndef fibonacci(n):\n    a, b = 0, 1\n    for _ in range(n):\n"
+    "        a, b = b, a + b\n    return a\n```\n"
+)
+NUMBERS = "Invoice 20251017: 1,234,567 sats at 0.000123 BTC/kWh (ref #A7F3-99). "
+UNICODE = "Übersetzung: 你好，世界！ Привет, мир. "
+
+
+def build_transcript(megabytes, seed=0):
+    rng = random.Random(seed)
+    pieces = [PROSE, CODE, NUMBERS, UNICODE]
+    weights = [6, 2, 1, 1]
+    target = int(megabytes * 1024 * 1024)
+    messages = []
+    size = 0
+    role = 'user'
+    while size < target:
+        content = "".join(rng.choices(pieces, weights, k=rng.randint(1, 40)))
+        messages.append({"role": role, "content": content})
+        size += len(content.encode())
+        role = 'assistant' if role == 'user' else 'user'
+    return messages, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megabytes', type=float, default=8)
+    parser.add_argument('--tokenizer', default='estimate', choices=['estimate', 'tiktoken'])
+    args = parser.parse_args()
+
+    tokens.token_counter = TokenCounter(backend=args.tokenizer)
+    tokens.token_counter.load()
+
+    messages, size = build_transcript(args.megabytes)
+    print(f"Transcript: {len(messages):,} messages, {size / 1024 / 1024:.1f} MB, "
+          f"backend={tokens.token_counter.backend}")
+
+    start = time.perf_counter()
+    total = sum(message_tokens(m) for m in messages)
+    cold = time.perf_counter() - start
+    print(f"Cold count:     {total:,} tokens in {cold * 1000:.0f} ms "
+          f"({size / 1024 / 1024 / cold:.1f} MB/s, {total / cold:,.0f} tokens/s)")
+
+    start = time.perf_counter()
+    again = sum(message_tokens(m) for m in messages)
+    warm = time.perf_counter() - start
+    assert again == total
+    print(f"Memoized count: {warm * 1000:.2f} ms ({warm / len(messages) * 1e9:.0f} ns/message)")
+
+    # Running total as kept by Conversation: one addition per appended message
+    running = 0
+    start = time.perf_counter()
+    for m in messages:
+        running += message_tokens(m)
+    incremental = time.perf_counter() - start
+    assert running == total
+    print(f"Running total:  {incremental / len(messages) * 1e9:.0f} ns per append")
+
+
+if __name__ == '__main__':
+    main()
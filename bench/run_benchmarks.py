@@ -0,0 +1,354 @@
+"""End-to-end benchmarks against the bundled mock server, comparable across commits
+
+Starts `python -m routstr mock` on a free port, points the app at it with
+ROUTSTR_BASE_URL and a throwaway PYROUTSTR_DATA_DIR, then measures:
+
+  e2e     TTFT and tokens/s through Conversation on the network engine
+          (GUI path) and the blocking path (CLI), minus the mock's own delay
+  render  cost of inserting streamed replies into the GUI's chat_display
+          (skipped without a display)
+  memory  RSS growth over a long conversation with journal and history store
+  batch   requests and tokens per second of BatchRunner
+
+The mock's model mock/model is paced (--ttft-ms, --tokens-per-second);
+mock/fast streams without delays, so client cost dominates. The report is
+written as JSON to bench/results/<commit>.json; --compare prints the
+change against an earlier report.
+
+Usage: python bench/run_benchmarks.py [--only e2e,memory] [--compare bench/results/<old>.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SUITES = ('e2e', 'render', 'memory', 'batch')
+API_KEY = "sk-bench"
+
+
+def git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        # Peak rather than current outside Linux
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def start_mock(args):
+    command = [sys.executable, '-m', 'routstr', 'mock', '--port', '0', '--ttft-ms', str(args.ttft_ms),
+               '--tokens-per-second', str(args.tokens_per_second), '--reply-tokens', str(args.reply_tokens),
+               '--jitter', str(args.jitter), '--seed', '0', '--balance', '1e12']
+    process = subprocess.Popen(command, cwd=ROOT, stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline()
+    if ' on ' not in line:
+        process.kill()
+        raise SystemExit(f"mock server did not start: {line.strip()}")
+    return process, line.split(' on ')[1].split()[0]
+
+
+def summarize(telemetry, model):
+    summary = telemetry.summary(model=model)
+    return {
+        'requests': summary['requests'],
+        'ttft_ms_p50': summary['ttft_ms_p50'],
+        'ttft_ms_p90': summary['ttft_ms_p90'],
+        'ttft_ms_p99': summary['ttft_ms_p99'],
+        'tokens_per_second_p50': summary['tokens_per_second_p50']
+    }
+
+
+def bench_e2e(args):
+    from routstr.conversation import Conversation, aiter_stream, iter_stream
+    from routstr.engine import engine
+    from routstr.telemetry import LatencyTelemetry
+
+    telemetry = LatencyTelemetry(capacity=args.requests * 4)
+
+    async def engine_turn(conversation):
+        with telemetry.request(conversation.model) as timer:
+            stream, _, _ = await conversation.open_stream_async()
+            parts = []
+            total = 0
+            async for content, total_tokens in aiter_stream(stream):
+                if content is not None:
+                    parts.append(content)
+                    timer.delta(content)
+                if total_tokens is not None:
+                    total = total_tokens
+        conversation.end_reply("".join(parts), total)
+
+    def sync_turn(conversation):
+        with telemetry.request(conversation.model) as timer:
+            stream, _, _ = conversation.open_stream()
+            parts = []
+            total = 0
+            for content, total_tokens in iter_stream(stream):
+                if content is not None:
+                    parts.append(content)
+                    timer.delta(content)
+                if total_tokens is not None:
+                    total = total_tokens
+        conversation.end_reply("".join(parts), total)
+
+    results = {}
+    for path in ('engine', 'sync'):
+        for model in ('mock/model', 'mock/fast'):
+            conversation = Conversation(API_KEY, model)
+            conversation.append({"role": "system", "content": "You are a benchmark."}, record=False)
+            for i in range(args.requests + 1):
+                conversation.add_user_message(f"Question {i}")
+                if path == 'engine':
+                    engine.submit(engine_turn(conversation)).result()
+                else:
+                    sync_turn(conversation)
+                if i == 0:
+                    # Warm-up: SDK import, connection set-up
+                    telemetry.records.clear()
+            result = summarize(telemetry, model)
+            telemetry.records.clear()
+            if model == 'mock/model' and result['ttft_ms_p50'] is not None:
+                result['overhead_ms_p50'] = round(result['ttft_ms_p50'] - args.ttft_ms, 1)
+            results[f"{path}.{model.split('/')[1]}"] = result
+            conversation.close()
+    return results
+
+
+def bench_render(args):
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return {'skipped': f"no display ({e})"}
+
+    import pyroutstr
+
+    app = pyroutstr.ChatGUI(root)
+    flush_times = []
+    flush = app.flush_stream_queue
+
+    def timed_flush():
+        started = time.perf_counter()
+        flush()
+        flush_times.append(time.perf_counter() - started)
+
+    # render_tick looks the method up on the instance
+    app.flush_stream_queue = timed_flush
+
+    results = {}
+    try:
+        for model in ('mock/model', 'mock/fast'):
+            app.api_key.set(API_KEY)
+            app.current_model.set(model)
+            app.initialize_conversation()
+            flush_times.clear()
+            max_update = 0.0
+            chars = 0
+            started = time.perf_counter()
+            for i in range(args.render_turns):
+                app.input_text.delete(1.0, tk.END)
+                app.input_text.insert(1.0, f"Question {i}")
+                before = len(app.chat_display.get(1.0, tk.END))
+                app.send_message()
+                while app.stream_token is not None:
+                    tick = time.perf_counter()
+                    root.update()
+                    max_update = max(max_update, time.perf_counter() - tick)
+                    time.sleep(0.001)
+                chars += len(app.chat_display.get(1.0, tk.END)) - before
+            elapsed = time.perf_counter() - started
+            tokens = args.render_turns * args.reply_tokens
+            results[model.split('/')[1]] = {
+                'turns': args.render_turns,
+                'rendered_chars_per_second': round(chars / elapsed),
+                'insert_ms_per_1k_tokens': round(sum(flush_times) / tokens * 1e6, 2),
+                'max_flush_ms': round(max(flush_times, default=0) * 1000, 2),
+                'max_update_ms': round(max_update * 1000, 2),
+                'frames': len(flush_times)
+            }
+            app.close_conversation()
+    finally:
+        root.destroy()
+    return results
+
+
+def bench_memory(args):
+    from routstr.conversation import Conversation, iter_stream
+    from routstr.history import ConversationStore
+
+    store = ConversationStore()
+    conversation = Conversation.start(API_KEY, 'mock/fast', store=store)
+    samples = []
+    turn_times = []
+    start = rss_mb()
+    every = max(1, args.turns // 10)
+    for i in range(args.turns):
+        started = time.perf_counter()
+        conversation.add_user_message(f"Tell me more about item {i}")
+        stream, _, _ = conversation.open_stream()
+        parts = []
+        total = 0
+        for content, total_tokens in iter_stream(stream):
+            if content is not None:
+                conversation.record_delta(content)
+                parts.append(content)
+            if total_tokens is not None:
+                total = total_tokens
+        conversation.end_reply("".join(parts), total)
+        turn_times.append(time.perf_counter() - started)
+        if (i + 1) % every == 0:
+            samples.append([i + 1, round(rss_mb() - start, 2)])
+    conversation.close()
+    store.close()
+
+    tail = max(1, args.turns // 10)
+    growth = rss_mb() - start
+    return {
+        'turns': args.turns,
+        'rss_start_mb': round(start, 1),
+        'rss_growth_mb': round(growth, 2),
+        'rss_growth_kb_per_turn': round(growth * 1024 / args.turns, 2),
+        'turn_ms_first': round(sum(turn_times[:tail]) / tail * 1000, 2),
+        'turn_ms_last': round(sum(turn_times[-tail:]) / tail * 1000, 2),
+        'samples': samples
+    }
+
+
+def bench_batch(args, data_dir):
+    from routstr.batch import BatchRunner, read_requests
+    from routstr.config import ROUTSTR_BASE_URL
+
+    input_path = os.path.join(data_dir, 'batch_input.jsonl')
+    results = {}
+    for model in ('mock/model', 'mock/fast'):
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for i in range(args.batch):
+                f.write(json.dumps({"id": f"q{i}", "prompt": f"Question {i}", "model": model}) + "\n")
+        output_path = os.path.join(data_dir, f"batch_{model.split('/')[1]}.jsonl")
+        runner = BatchRunner(API_KEY, output_path, concurrency=args.concurrency, base_url=ROUTSTR_BASE_URL,
+                             progress=None)
+        started = time.perf_counter()
+        stats = runner.run(read_requests(input_path, model))
+        elapsed = time.perf_counter() - started
+        results[model.split('/')[1]] = {
+            'requests': args.batch,
+            'concurrency': args.concurrency,
+            'failed': stats['failed'],
+            'requests_per_second': round(stats['done'] / elapsed, 2),
+            'tokens_per_second': round(stats['tokens'] / elapsed)
+        }
+    return results
+
+
+def flatten(data, prefix=''):
+    values = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(old, new):
+    old_values, new_values = flatten(old['results']), flatten(new['results'])
+    if old.get('settings') != new['settings']:
+        print("\nWarning: the reports were run with different settings", file=sys.stderr)
+    print(f"\n{'metric':<48}{old.get('commit') or 'old':>12}{new.get('commit') or 'new':>12}{'change':>10}")
+    for name, value in new_values.items():
+        if name not in old_values:
+            continue
+        before = old_values[name]
+        change = f"{(value - before) / before * 100:+.1f}%" if before else ""
+        print(f"{name:<48}{before:>12g}{value:>12g}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help=f"comma-separated suites ({', '.join(SUITES)})")
+    parser.add_argument('--requests', type=int, default=20, help="e2e requests per path and model")
+    parser.add_argument('--render-turns', type=int, default=10)
+    parser.add_argument('--turns', type=int, default=200, help="conversation length for the memory suite")
+    parser.add_argument('--batch', type=int, default=100, help="batch requests per model")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--ttft-ms', type=float, default=100)
+    parser.add_argument('--tokens-per-second', type=float, default=200)
+    parser.add_argument('--reply-tokens', type=int, default=100)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--output', help="report path (default: bench/results/<commit>.json)")
+    parser.add_argument('--compare', help="earlier report to compare against")
+    args = parser.parse_args()
+    suites = args.only.split(',') if args.only else SUITES
+
+    data_dir = tempfile.mkdtemp(prefix='pyroutstr-bench-')
+    mock, base_url = start_mock(args)
+    # Read by routstr.config, so set before the first import
+    os.environ.update({
+        'ROUTSTR_BASE_URL': base_url,
+        'ROUTSTR_API_KEY': API_KEY,
+        'PYROUTSTR_DATA_DIR': data_dir,
+        'RESPONSE_CACHE': '0'
+    })
+    for name in ('HEDGE_FALLBACK_MODEL', 'TELEMETRY_CSV', 'TELEMETRY_PROMETHEUS'):
+        os.environ.pop(name, None)
+
+    commit = git('rev-parse', '--short', 'HEAD')
+    report = {
+        'commit': commit,
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'only')},
+        'results': {}
+    }
+    try:
+        for suite in suites:
+            print(f"Running {suite}...", file=sys.stderr)
+            if suite == 'e2e':
+                report['results']['e2e'] = bench_e2e(args)
+            elif suite == 'render':
+                report['results']['render'] = bench_render(args)
+            elif suite == 'memory':
+                report['results']['memory'] = bench_memory(args)
+            elif suite == 'batch':
+                report['results']['batch'] = bench_batch(args, data_dir)
+            else:
+                parser.error(f"unknown suite {suite}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    output = args.output or os.path.join(ROOT, 'bench', 'results', f"{commit or 'report'}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report['results'], indent=2))
+    print(f"\nReport written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
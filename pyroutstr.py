@@ -1,45 +1,33 @@
+import time
+
+# Reference point for --startup-trace, taken before any other import
+STARTUP_STARTED = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, filedialog, font
+from tkinter import ttk, scrolledtext, messagebox, font
 import threading
 import queue
-from openai import OpenAI
-import json
 from datetime import datetime
 import os
-from dotenv import load_dotenv, set_key
+import sqlite3
+from dotenv import set_key
 import sys
 
-# Load environment variables
-load_dotenv()
-
-# Popular models dictionary
-POPULAR_MODELS = {
-    "OpenAI": [
-        "openai/o3",
-        "openai/o4-mini",
-        "openai/o4-mini-high",
-        "openai/gpt-4.5-preview",
-        "openai/gpt-4.1"
-    ],
-    "Anthropic": [
-        "anthropic/claude-opus-4",
-        "anthropic/claude-sonnet-4",
-        "anthropic/claude-3.7-sonnet",
-        "anthropic/claude-3.7-sonnet:thinking"
-    ],
-    "Google": [
-        "google/gemini-2.5-pro-preview",
-        "google/gemini-2.5-flash-preview-05-20"
-    ],
-    "Deepseek": [
-        "deepseek/deepseek-r1-0528",
-        "deepseek/deepseek-prover-v2"
-    ],
-    "Qwen": [
-        "qwen/qwen-max",
-        "qwen/qwen3-32b"
-    ]
-}
+from routstr.cache import CachedStream, response_cache
+from routstr.catalog import ModelCatalog
+from routstr.compare import ModelComparison
+from routstr.config import DATA_DIR, DEFAULT_SYSTEM_PROMPT
+from routstr.engine import CallbackBridge, engine
+from routstr.conversation import Conversation, aiter_stream, load_sdk
+from routstr.history import ConversationJournal, ConversationStore
+from routstr.markdown import MarkdownStream, render as render_markdown
+from routstr.telemetry import telemetry
+from routstr.tokens import token_counter
+from routstr.transport import CancelToken, connection_manager
+from routstr.wallet import WalletError, WalletService
+
+# Number of hidden messages restored each time the chat view is scrolled to the top
+SCROLLBACK_CHUNK = 50
 
 class ChatGUI:
     def __init__(self, root):
@@ -66,13 +54,42 @@ class ChatGUI:
         self.use_tor = tk.BooleanVar(value=False)
         self.font_size = tk.IntVar(value=11)
         self.theme = tk.StringVar(value='dark')
+        self.render_fps = tk.IntVar(value=int(os.getenv('RENDER_FPS', '30')))
 
         # State
-        self.client = None
-        self.messages = []
-        self.total_tokens = 0
+        self.conversation = None
+        self.stream_token = None
+        self.draft_tokens = 0
+        self.last_tokens = None
+        self.estimate_job = None
         self.conversation_active = False
+        self.loading = False
         self.stream_queue = queue.Queue()
+        self.render_job = None
+        self.render_stats = {'frames': 0, 'deltas': 0, 'max_batch': 0}
+        self.render_markdown = os.getenv('RENDER_MARKDOWN', '1').lower() not in ('0', 'false', 'no')
+        self.markdown = None
+
+        # Transcript model backing the windowed chat display
+        self.transcript = []
+        self.visible_start = 0
+        self.streaming_entry = None
+        self.max_visible_messages = max(1, int(os.getenv('MAX_VISIBLE_MESSAGES', '200')))
+
+        # Searchable history of all conversations
+        try:
+            self.store = ConversationStore()
+        except sqlite3.Error as e:
+            print(f"Warning: conversation history disabled: {e}")
+            self.store = None
+
+        # Live model listing, loaded in the background
+        self.model_catalog = ModelCatalog()
+        self.model_catalog_listeners = []
+
+        # Network work runs on the engine's event loop; results come back through the bridge
+        self.bridge = CallbackBridge(lambda drain: self.root.after(0, drain))
+        self.wallet = WalletService(self.bridge.post, balance_ttl=float(os.getenv('WALLET_BALANCE_TTL', '60')))
 
         # Apply initial theme
         self.themes = {
@@ -87,7 +104,9 @@ class ChatGUI:
                 'success': '#4caf50',
                 'error': '#f44336',
                 'warning': '#ff9800',
-                'tor': '#9c27b0'
+                'tor': '#9c27b0',
+                'code_bg': '#333333',
+                'muted': '#808080'
             },
             'light': {
                 'bg': '#ffffff',
@@ -100,7 +119,9 @@ class ChatGUI:
                 'success': '#4caf50',
                 'error': '#f44336',
                 'warning': '#ff9800',
-                'tor': '#9c27b0'
+                'tor': '#9c27b0',
+                'code_bg': '#ececec',
+                'muted': '#999999'
             }
         }
 
@@ -111,6 +132,41 @@ class ChatGUI:
         if not self.api_key.get():
             self.root.after(100, self.show_settings)
 
+        threading.Thread(target=token_counter.load, daemon=True).start()
+        self.root.after(300, self.offer_recovery)
+        self.root.after(
+            200,
+            self.model_catalog.load_async,
+            self.bridge.post,
+            self.on_model_catalog_loaded
+        )
+
+    def offer_recovery(self):
+        """Offer to restore the most recent conversation that did not shut down cleanly"""
+        unfinished = ConversationJournal.find_unfinished()
+        if not unfinished or not self.api_key.get():
+            return
+
+        state = unfinished[0]
+        if messagebox.askyesno(
+            "Restore Conversation",
+            f"A conversation with {state['model']} was not closed properly.\nDo you want to restore it?"
+        ):
+            self.current_model.set(state['model'])
+            self.use_tor.set(state['used_tor'])
+            self.initialize_conversation(restored=state)
+            others = unfinished[1:]
+        else:
+            others = unfinished
+
+        # Older leftovers stay on disk for export but are not offered again
+        for other in others:
+            ConversationJournal.mark_closed(other['path'])
+
+    def on_model_catalog_loaded(self):
+        for listener in list(self.model_catalog_listeners):
+            listener()
+
     def setup_ui(self):
         # Menu bar
         menubar = tk.Menu(self.root)
@@ -120,6 +176,12 @@ class ChatGUI:
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="New Conversation", command=self.new_conversation)
         file_menu.add_command(label="Save Conversation", command=self.save_conversation)
+        file_menu.add_command(label="Load Conversation", command=self.load_conversation)
+        file_menu.add_command(label="Search History", command=self.show_search_history)
+        file_menu.add_command(label="Import Saved Conversations", command=self.import_conversations)
+        file_menu.add_command(label="Compare Models", command=self.show_compare_models)
+        file_menu.add_command(label="Response Cache", command=self.show_response_cache)
+        file_menu.add_command(label="Export Latency Metrics", command=self.export_latency_metrics)
         file_menu.add_separator()
         file_menu.add_command(label="Settings", command=self.show_settings)
         file_menu.add_command(label="Get Credits", command=self.show_get_credits)
@@ -144,6 +206,13 @@ class ChatGUI:
         self.token_label = ttk.Label(self.status_frame, text="")
         self.token_label.pack(side=tk.RIGHT)
 
+        self.context_label = ttk.Label(self.status_frame, text="")
+        self.context_label.pack(side=tk.RIGHT, padx=(0, 15))
+
+        # Rolling latency of the current model and route
+        self.latency_label = ttk.Label(self.status_frame, text="")
+        self.latency_label.pack(side=tk.RIGHT, padx=(0, 15))
+
         # Chat display
         chat_frame = ttk.Frame(main_frame)
         chat_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -157,6 +226,7 @@ class ChatGUI:
             pady=10
         )
         self.chat_display.pack(fill=tk.BOTH, expand=True)
+        self.chat_display.configure(yscrollcommand=self.on_chat_scroll)
 
         # Configure tags for formatting (font size will be updated later)
         self.configure_tags()
@@ -176,6 +246,7 @@ class ChatGUI:
         # Bind Enter key to send message (Shift+Enter for new line)
         self.input_text.bind('<Return>', self.handle_return)
         self.input_text.bind('<Shift-Return>', lambda e: None)
+        self.input_text.bind('<KeyRelease>', self.schedule_estimate)
 
         button_frame = ttk.Frame(input_frame)
         button_frame.pack(side=tk.RIGHT, padx=(5, 0))
@@ -183,6 +254,11 @@ class ChatGUI:
         self.send_button = ttk.Button(button_frame, text="Send", command=self.send_message)
         self.send_button.pack(pady=(0, 2))
 
+        # Enabled only while a reply is streaming
+        self.stop_button = ttk.Button(button_frame, text="Stop", command=self.stop_response, state=tk.DISABLED)
+        self.stop_button.pack(pady=(0, 2))
+        self.root.bind('<Escape>', lambda e: self.stop_response())
+
         self.clear_button = ttk.Button(button_frame, text="Clear", command=self.clear_input)
         self.clear_button.pack()
 
@@ -241,6 +317,23 @@ class ChatGUI:
         self.chat_display.tag_config('tor', foreground=theme['tor'], font=('Consolas', size, 'bold'))
         self.chat_display.tag_config('separator', foreground='#666666' if self.theme.get() == 'dark' else '#cccccc', font=('Consolas', size - 2))
 
+        # Markdown in replies; tags configured later take precedence
+        self.chat_display.tag_config('md_code', background=theme['code_bg'], lmargin1=20, lmargin2=20)
+        self.chat_display.tag_config('md_quote', foreground=theme['muted'], lmargin1=20, lmargin2=20)
+        self.chat_display.tag_config('md_h3', font=('Consolas', size + 1, 'bold'))
+        self.chat_display.tag_config('md_h2', font=('Consolas', size + 3, 'bold'))
+        self.chat_display.tag_config('md_h1', font=('Consolas', size + 5, 'bold'))
+        self.chat_display.tag_config('md_bold', font=('Consolas', size, 'bold'))
+        self.chat_display.tag_config('md_italic', font=('Consolas', size, 'italic'))
+        self.chat_display.tag_config('md_bullet', foreground=theme['highlight'])
+        self.chat_display.tag_config('md_link', foreground=theme['highlight'], underline=True)
+        self.chat_display.tag_config('md_code_inline', background=theme['code_bg'], foreground=theme['warning'])
+        self.chat_display.tag_config('md_keyword', foreground=theme['highlight'])
+        self.chat_display.tag_config('md_string', foreground=theme['success'])
+        self.chat_display.tag_config('md_number', foreground=theme['warning'])
+        self.chat_display.tag_config('md_comment', foreground=theme['muted'], font=('Consolas', size, 'italic'))
+        self.chat_display.tag_config('md_marker', foreground=theme['muted'])
+
     def apply_theme(self):
         theme = self.themes[self.theme.get()]
 
@@ -300,38 +393,49 @@ class ChatGUI:
         balance_label = ttk.Label(api_frame, text="", font=('Consolas', 11))
         balance_label.grid(row=1, column=1, sticky=tk.W, pady=5, padx=5)
         
-        def check_balance():
+        def show_balance(balance):
+            if balance_label.winfo_exists():
+                balance_label.config(text=f"Balance: {balance:,} credits", foreground=theme['success'])
+
+        def on_balance(data):
+            if check_btn.winfo_exists():
+                check_btn.config(state='normal')
+            show_balance(data.get('balance', 0))
+
+        def on_balance_error(error):
+            if not balance_label.winfo_exists():
+                return
+            check_btn.config(state='normal')
+            if isinstance(error, WalletError):
+                balance_label.config(text=f"Error: {error.status_code}", foreground=theme['error'])
+            else:
+                balance_label.config(text=f"Error: {str(error)[:50]}...", foreground=theme['error'])
+
+        def check_balance(quiet=False):
             api_key = temp_api_key.get().strip()
             if not api_key:
-                messagebox.showerror("Error", "Please enter an API key")
+                if not quiet:
+                    messagebox.showerror("Error", "Please enter an API key")
                 return
-                
-            try:
-                import httpx
-                
-                headers = {
-                    "Authorization": f"Bearer {api_key}"
-                }
-                
+
+            if not quiet:
                 balance_label.config(text="Checking...")
-                settings_window.update()
-                
-                with httpx.Client(timeout=30.0) as client:
-                    response = client.get("https://api.routstr.com/v1/wallet/info", headers=headers)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        balance = data.get('balance', 0)
-                        balance_label.config(text=f"Balance: {balance:,} credits", foreground=theme['success'])
-                    else:
-                        balance_label.config(text=f"Error: {response.status_code}", foreground=theme['error'])
-                        
-            except Exception as e:
-                balance_label.config(text=f"Error: {str(e)[:50]}...", foreground=theme['error'])
+            check_btn.config(state='disabled')
+            self.wallet.get_info(api_key, self.use_tor.get(), on_balance, on_balance_error)
         
         check_btn = ttk.Button(api_frame, text="Check Credits Balance", command=check_balance)
         check_btn.grid(row=1, column=0, sticky=tk.W, pady=5)
 
+        # Show the last known balance right away and refresh it if it has expired
+        cached = self.wallet.cached_balance(temp_api_key.get().strip())
+        if cached is not None:
+            balance, fresh = cached
+            show_balance(balance)
+            if not fresh:
+                check_balance(quiet=True)
+        elif temp_api_key.get().strip():
+            check_balance()
+
         # Default Model section
         model_frame = ttk.LabelFrame(settings_window, text="Default Model", padding=10)
         model_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -339,11 +443,7 @@ class ChatGUI:
         ttk.Label(model_frame, text="Model:").grid(row=0, column=0, sticky=tk.W, pady=5)
         model_combo = ttk.Combobox(model_frame, textvariable=temp_default_model, width=37)
 
-        # Flatten models for combobox
-        all_models = []
-        for provider, models in POPULAR_MODELS.items():
-            all_models.extend(models)
-        model_combo['values'] = all_models
+        model_combo['values'] = self.model_catalog.model_ids()
         model_combo.grid(row=0, column=1, pady=5, padx=5)
 
         # Appearance section
@@ -372,6 +472,10 @@ class ChatGUI:
         # Update button appearance based on current theme
         self.update_theme_buttons()
 
+        ttk.Label(appearance_frame, text="Render Rate (FPS):").grid(row=2, column=0, sticky=tk.W, pady=5)
+        fps_spinbox = ttk.Spinbox(appearance_frame, from_=10, to=120, textvariable=self.render_fps, width=10)
+        fps_spinbox.grid(row=2, column=1, sticky=tk.W, pady=5, padx=5)
+
         # Buttons
         button_frame = ttk.Frame(settings_window)
         button_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -385,6 +489,7 @@ class ChatGUI:
             env_path = '.env'
             set_key(env_path, 'ROUTSTR_API_KEY', self.api_key.get())
             set_key(env_path, 'DEFAULT_MODEL', self.default_model.get())
+            set_key(env_path, 'RENDER_FPS', str(self.get_render_fps()))
 
             # Update font for chat display only (not input field)
             new_font = font.Font(family='Consolas', size=self.font_size.get())
@@ -483,53 +588,83 @@ class ChatGUI:
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, padx=10, pady=10)
         
+        def on_credits(data):
+            if not dialog.winfo_exists():
+                return
+            api_key_var.set(data.get('api_key', ''))
+            balance = data.get('balance', 0)
+            balance_var.set(f"Balance: {balance:,} credits")
+            
+            # Show result frame and ensure all elements are visible
+            result_frame.pack(fill=tk.X, padx=10, pady=10)
+            api_frame.pack(fill=tk.X, pady=5)
+            balance_label.pack(pady=5)
+            top_up_label.pack(pady=5)
+            confirm_check.pack(pady=10)
+            
+            # Clear any previous top up message
+            top_up_result_var.set("")
+            
+            # Keep get credits button disabled
+            token_entry.config(state='disabled')
+            top_up_btn.config(state='normal')
+
+        def on_credits_error(error):
+            if not dialog.winfo_exists():
+                return
+            get_btn.config(state='normal')
+            top_up_btn.config(state='normal')
+            if isinstance(error, ImportError):
+                messagebox.showerror("Error", "httpx is required. Install with: pip install httpx[socks]")
+            else:
+                messagebox.showerror("Error", f"Failed to get credits: {str(error)}")
+
         def get_credits():
             token = token_entry.get().strip()
             if not token:
                 messagebox.showerror("Error", "Please enter a cashu token")
                 return
             
-            try:
-                import httpx
-                
-                # Make API call
-                headers = {
-                    "Authorization": f"Bearer {token}"
-                }
-                
-                with httpx.Client(timeout=30.0) as client:
-                    response = client.get("https://api.routstr.com/v1/wallet/info", headers=headers)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        api_key_var.set(data.get('api_key', ''))
-                        balance = data.get('balance', 0)
-                        balance_var.set(f"Balance: {balance:,} credits")
-                        
-                        # Show result frame and ensure all elements are visible
-                        result_frame.pack(fill=tk.X, padx=10, pady=10)
-                        api_frame.pack(fill=tk.X, pady=5)
-                        balance_label.pack(pady=5)
-                        top_up_label.pack(pady=5)
-                        confirm_check.pack(pady=10)
-                        
-                        # Clear any previous top up message
-                        top_up_result_var.set("")
-                        
-                        # Disable get credits button
-                        get_btn.config(state='disabled')
-                        token_entry.config(state='disabled')
-                    else:
-                        messagebox.showerror("Error", f"Failed to get credits: {response.text}")
-                    
-            except ImportError:
-                messagebox.showerror("Error", "httpx is required. Install with: pip install httpx[socks]")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to get credits: {str(e)}")
+            # Make API call in the background
+            get_btn.config(state='disabled')
+            top_up_btn.config(state='disabled')
+            self.wallet.get_info(token, self.use_tor.get(), on_credits, on_credits_error)
         
         get_btn = ttk.Button(button_frame, text="Get New API Key", command=get_credits)
         get_btn.pack(side=tk.LEFT, padx=5)
         
+        def on_top_up(data):
+            if not dialog.winfo_exists():
+                return
+            top_up_btn.config(state='normal')
+
+            # Show result frame if not already visible
+            if not result_frame.winfo_ismapped():
+                result_frame.pack(fill=tk.X, padx=10, pady=10)
+            
+            # Hide API key related fields for top up
+            api_frame.pack_forget()
+            balance_label.pack_forget()
+            confirm_check.pack_forget()
+            
+            # Update success message
+            top_up_result_var.set("✅ Top up successful!")
+            
+            # Enable finish button for top up
+            finish_btn.config(state='normal')
+            
+            # Clear the token entry
+            token_entry.delete(0, tk.END)
+
+        def on_top_up_error(error):
+            if not dialog.winfo_exists():
+                return
+            top_up_btn.config(state='normal')
+            if isinstance(error, ImportError):
+                messagebox.showerror("Error", "httpx is required. Install with: pip install httpx[socks]")
+            else:
+                messagebox.showerror("Error", f"Failed to top up: {str(error)}")
+
         def top_up():
             # Check if API key exists
             if not self.api_key.get():
@@ -541,45 +676,9 @@ class ChatGUI:
                 messagebox.showerror("Error", "Please enter a cashu token")
                 return
             
-            try:
-                import httpx
-                
-                # Make API call
-                headers = {
-                    "Authorization": f"Bearer {self.api_key.get()}"
-                }
-                
-                with httpx.Client(timeout=30.0) as client:
-                    response = client.post(
-                        f"https://api.routstr.com/v1/wallet/topup?cashu_token={token}", 
-                        headers=headers
-                    )
-                    
-                    if response.status_code == 200:
-                        # Show result frame if not already visible
-                        if not result_frame.winfo_ismapped():
-                            result_frame.pack(fill=tk.X, padx=10, pady=10)
-                        
-                        # Hide API key related fields for top up
-                        api_frame.pack_forget()
-                        balance_label.pack_forget()
-                        confirm_check.pack_forget()
-                        
-                        # Update success message
-                        top_up_result_var.set("✅ Top up successful!")
-                        
-                        # Enable finish button for top up
-                        finish_btn.config(state='normal')
-                        
-                        # Clear the token entry
-                        token_entry.delete(0, tk.END)
-                    else:
-                        messagebox.showerror("Error", f"Failed to top up: {response.text}")
-                    
-            except ImportError:
-                messagebox.showerror("Error", "httpx is required. Install with: pip install httpx[socks]")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to top up: {str(e)}")
+            # Make API call in the background
+            top_up_btn.config(state='disabled')
+            self.wallet.top_up(self.api_key.get(), token, self.use_tor.get(), on_top_up, on_top_up_error)
         
         top_up_btn = ttk.Button(button_frame, text="Top Up", command=top_up)
         top_up_btn.pack(side=tk.LEFT, padx=5)
@@ -603,24 +702,27 @@ class ChatGUI:
         dialog.minsize(600, dialog.winfo_height())
 
     def new_conversation(self):
-        if self.conversation_active and self.messages:
+        if self.loading:
+            return
+        self.stop_response()
+        if self.conversation_active and self.conversation.messages:
             if messagebox.askyesno("New Conversation", "Do you want to save the current conversation?"):
                 self.save_conversation()
 
+        self.close_conversation()
+
         # Reset state
-        self.messages = []
-        self.total_tokens = 0
+        self.draft_tokens = 0
+        self.last_tokens = None
         self.conversation_active = False
-        self.client = None
 
         # Clear display
-        self.chat_display.configure(state=tk.NORMAL)
-        self.chat_display.delete(1.0, tk.END)
-        self.chat_display.configure(state=tk.DISABLED)
+        self.clear_transcript()
 
         # Update status
         self.status_label.config(text="Not connected")
         self.token_label.config(text="")
+        self.context_label.config(text="")
 
         # Show model selection dialog
         self.show_model_selection()
@@ -645,24 +747,69 @@ class ChatGUI:
         model_frame = ttk.LabelFrame(dialog, text="Select Model", padding=10)
         model_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-        # Create notebook for provider tabs
-        notebook = ttk.Notebook(model_frame)
-        notebook.pack(fill=tk.BOTH, expand=True)
+        # Search box filtering the catalog
+        search_var = tk.StringVar()
+        search_entry = ttk.Entry(model_frame, textvariable=search_var)
+        search_entry.pack(fill=tk.X, pady=(0, 5))
+        search_entry.focus_set()
 
-        model_var = tk.StringVar(value=self.default_model.get())
+        # Treeview only draws visible rows, so hundreds of models open instantly
+        list_frame = ttk.Frame(model_frame)
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        model_tree = ttk.Treeview(
+            list_frame,
+            columns=('context', 'prompt', 'completion'),
+            selectmode='browse'
+        )
+        model_tree.heading('#0', text="Model")
+        model_tree.heading('context', text="Context")
+        model_tree.heading('prompt', text="Prompt (sats/1M)")
+        model_tree.heading('completion', text="Completion (sats/1M)")
+        model_tree.column('#0', width=330)
+        model_tree.column('context', width=90, anchor=tk.E)
+        model_tree.column('prompt', width=120, anchor=tk.E)
+        model_tree.column('completion', width=140, anchor=tk.E)
+
+        tree_scroll = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=model_tree.yview)
+        model_tree.configure(yscrollcommand=tree_scroll.set)
+        tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        model_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        # Add tabs for each provider
-        for provider, models in POPULAR_MODELS.items():
-            tab = ttk.Frame(notebook)
-            notebook.add(tab, text=provider)
+        model_var = tk.StringVar(value=self.default_model.get())
 
-            for i, model in enumerate(models):
-                ttk.Radiobutton(
-                    tab,
-                    text=model,
-                    variable=model_var,
-                    value=model
-                ).pack(anchor=tk.W, padx=10, pady=2)
+        def format_price(price):
+            return "" if price is None else f"{price * 1_000_000:,.0f}"
+
+        def populate(*args):
+            model_tree.delete(*model_tree.get_children())
+            for model in self.model_catalog.search(search_var.get()):
+                model_tree.insert('', tk.END, iid=model['id'], text=model['id'], values=(
+                    f"{model['context_length']:,}" if model['context_length'] else "",
+                    format_price(model['prompt_price']),
+                    format_price(model['completion_price'])
+                ))
+            if model_tree.exists(model_var.get()):
+                model_tree.selection_set(model_var.get())
+                model_tree.see(model_var.get())
+
+        def on_select(event):
+            selection = model_tree.selection()
+            if selection:
+                model_var.set(selection[0])
+
+        model_tree.bind('<<TreeviewSelect>>', on_select)
+        model_tree.bind('<Double-1>', lambda e: start_conversation())
+        search_var.trace_add('write', populate)
+        populate()
+
+        # Refresh the list if the catalog arrives while the dialog is open
+        self.model_catalog_listeners.append(populate)
+        def on_destroy(event):
+            if event.widget is dialog and populate in self.model_catalog_listeners:
+                self.model_catalog_listeners.remove(populate)
+
+        dialog.bind('<Destroy>', on_destroy)
 
         # Custom model entry
         custom_frame = ttk.Frame(model_frame)
@@ -703,54 +850,182 @@ class ChatGUI:
         ttk.Button(button_frame, text="Start", command=start_conversation).pack(side=tk.RIGHT, padx=5)
         ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT)
 
-    def initialize_conversation(self):
+    def initialize_conversation(self, restored=None, loaded=None):
         try:
-            # Create client
+            # Open the pool for this route first so Tor problems surface before anything is recorded
             if self.use_tor.get():
                 try:
-                    import httpx
-                    transport = httpx.HTTPTransport(proxy="socks5://localhost:9050")
-                    http_client = httpx.Client(transport=transport, timeout=30.0)
-
-                    self.client = OpenAI(
-                        base_url="https://api.routstr.com/v1",
-                        api_key=self.api_key.get(),
-                        http_client=http_client
-                    )
+                    connection_manager.client(use_tor=True)
 
                     status_text = f"Connected to {self.current_model.get()} [TOR]"
                     self.status_label.config(text=status_text, foreground=self.themes[self.theme.get()]['tor'])
 
                 except ImportError:
                     messagebox.showerror("Error", "httpx[socks] is required for Tor support!\nInstall with: pip install httpx[socks]")
+                    if loaded:
+                        loaded['conversation'].close()
                     return
                 except Exception as e:
                     messagebox.showerror("Error", f"Failed to connect via Tor: {e}\nEnsure Tor SOCKS5 proxy is running on localhost:9050")
+                    if loaded:
+                        loaded['conversation'].close()
                     return
             else:
-                self.client = OpenAI(
-                    base_url="https://api.routstr.com/v1",
-                    api_key=self.api_key.get()
-                )
                 status_text = f"Connected to {self.current_model.get()}"
                 self.status_label.config(text=status_text, foreground=self.themes[self.theme.get()]['success'])
 
+            # Load the OpenAI SDK while the user types; the client is created by the first request
+            if 'openai' not in sys.modules:
+                threading.Thread(target=load_sdk, daemon=True).start()
+
             # Initialize conversation
-            self.messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
-            self.total_tokens = 0
+            self.last_tokens = None
+            if loaded:
+                # History was already streamed into the transcript by the loader
+                self.conversation = loaded['conversation']
+            elif restored:
+                self.conversation = Conversation.restore(
+                    restored, self.api_key.get(), store=self.store, catalog=self.model_catalog
+                )
+            else:
+                self.conversation = Conversation.start(
+                    self.api_key.get(), self.current_model.get(), self.use_tor.get(),
+                    store=self.store, catalog=self.model_catalog
+                )
             self.conversation_active = True
+            self.refresh_token_label()
+            self.update_latency_display()
 
             # Enable input
             self.toggle_input_state(True)
 
             # Add welcome message
-            self.add_system_message(f"Conversation started with {self.current_model.get()}")
+            if loaded:
+                self.render_transcript_tail()
+                self.add_system_message(loaded['summary'])
+            elif restored:
+                self.render_history()
+                self.add_system_message(f"Conversation with {self.current_model.get()} restored")
+            else:
+                self.add_system_message(f"Conversation started with {self.current_model.get()}")
             if self.use_tor.get():
                 self.add_system_message("🧅 Traffic is being routed through Tor - Your IP address is now hidden", tag='tor')
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to initialize conversation: {e}")
 
+    @staticmethod
+    def history_entries(messages):
+        """Transcript entries for saved messages (system prompts are not shown)"""
+        entries = []
+        for message in messages:
+            if message['role'] == 'user':
+                entries.append({'kind': 'message', 'header': "You: ", 'tag': 'user', 'text': message['content']})
+            elif message['role'] == 'assistant':
+                entries.append({'kind': 'message', 'header': "Assistant: ", 'tag': 'assistant',
+                                'text': message['content']})
+                if message.get('truncated'):
+                    entries.append({'kind': 'system', 'tag': 'error', 'text': "Reply was interrupted"})
+        return entries
+
+    def render_history(self):
+        """Draw the conversation history into the (empty) chat display"""
+        self.transcript.extend(self.history_entries(self.conversation.messages))
+        self.render_transcript_tail()
+
+    def render_transcript_tail(self):
+        """Draw only the newest entries of the transcript model; older ones load on scroll"""
+        self.visible_start = max(len(self.transcript) - self.max_visible_messages, 0)
+        self.chat_display.configure(state=tk.NORMAL)
+        for index in range(self.visible_start, len(self.transcript)):
+            start = self.chat_display.index("end-1c")
+            self.chat_display.insert(tk.END, *self.entry_segments(index))
+            self.chat_display.mark_set(f"entry{index}", start)
+        self.chat_display.configure(state=tk.DISABLED)
+        self.chat_display.see(tk.END)
+
+    def load_conversation(self):
+        if self.loading:
+            return
+        self.stop_response()
+        if self.conversation_active and self.conversation.messages:
+            if messagebox.askyesno("Load Conversation", "Do you want to save the current conversation?"):
+                self.save_conversation()
+
+        from tkinter import filedialog
+
+        filename = filedialog.askopenfilename(
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+
+        self.close_conversation()
+
+        # Reset state; the loader fills the transcript progressively
+        self.draft_tokens = 0
+        self.last_tokens = None
+        self.conversation_active = False
+        self.loaded_count = 0
+        self.clear_transcript()
+        self.toggle_input_state(False)
+        self.token_label.config(text="")
+        self.context_label.config(text="")
+        self.status_label.config(text=f"Loading {os.path.basename(filename)}...",
+                                 foreground=self.themes[self.theme.get()]['warning'])
+
+        self.loading = True
+        self.load_started = time.perf_counter()
+        thread = threading.Thread(
+            target=self.load_conversation_worker,
+            args=(filename, self.api_key.get(), self.current_model.get(), self.use_tor.get()),
+            daemon=True
+        )
+        thread.start()
+
+    def load_conversation_worker(self, filename, api_key, model, use_tor):
+        """Parse a saved conversation and hand it to the main thread in batches
+
+        The new journal and history rows are written here so the main thread
+        only ever does O(batch) work per callback.
+        """
+        try:
+            conversation, meta = Conversation.load(
+                filename, api_key, use_tor, store=self.store, catalog=self.model_catalog,
+                default_model=model,
+                on_batch=lambda batch: self.bridge.post(self.receive_loaded_batch, batch)
+            )
+            self.bridge.post(self.finish_loading, filename, conversation)
+
+        except Exception as e:
+            self.bridge.post(self.fail_loading, f"Failed to load conversation: {e}")
+
+    def receive_loaded_batch(self, batch):
+        self.loaded_count += len(batch)
+        self.transcript.extend(self.history_entries(batch))
+        self.status_label.config(text=f"Loading... {self.loaded_count:,} messages")
+
+    def finish_loading(self, filename, conversation):
+        self.loading = False
+        self.current_model.set(conversation.model)
+        elapsed = (time.perf_counter() - self.load_started) * 1000
+
+        self.initialize_conversation(loaded={
+            'conversation': conversation,
+            'summary': f"Loaded {len(conversation.messages):,} messages from {os.path.basename(filename)} in {elapsed:.0f} ms"
+        })
+
+    def fail_loading(self, error_msg):
+        self.loading = False
+        self.status_label.config(text="Not connected", foreground=self.themes[self.theme.get()]['fg'])
+        self.clear_transcript()
+        self.add_system_message(error_msg, 'error')
+
+    def close_conversation(self):
+        if self.conversation is not None:
+            self.conversation.close()
+            self.conversation = None
+
     def toggle_input_state(self, enabled):
         state = tk.NORMAL if enabled else tk.DISABLED
         self.input_text.configure(state=state)
@@ -778,119 +1053,374 @@ class ChatGUI:
         self.add_message("You", message, 'user')
 
         # Add to conversation history
-        self.messages.append({"role": "user", "content": message})
+        self.conversation.add_user_message(message)
 
         # Disable input during processing
         self.toggle_input_state(False)
 
-        # Start streaming in thread
-        thread = threading.Thread(target=self.stream_response, daemon=True)
-        thread.start()
+        # Prepare the assistant block and start draining streamed deltas
+        self.stream_queue = queue.Queue()
+        self.begin_assistant_message()
+        self.start_render_loop()
+
+        # Stream on the network engine; the token lets Stop cancel the task
+        self.stream_token = CancelToken()
+        self.stop_button.configure(state=tk.NORMAL)
+        self.stream_token.attach(engine.submit(self.stream_response(self.stream_token, self.stream_queue)))
+
+    def schedule_estimate(self, event=None):
+        # Debounce so large pastes are only counted once
+        if self.estimate_job is not None:
+            self.root.after_cancel(self.estimate_job)
+        self.estimate_job = self.root.after(150, self.update_estimate)
+
+    def update_estimate(self):
+        self.estimate_job = None
+        draft = self.input_text.get(1.0, tk.END).strip()
+        self.draft_tokens = token_counter.count(draft) + 4 if draft else 0
+        self.refresh_token_label()
+
+    def begin_assistant_message(self):
+        # The reply is rendered as it streams; its text is collected in parts
+        entry = {'kind': 'message', 'header': "Assistant: ", 'tag': 'assistant', 'parts': [], 'text': None}
+        self.streaming_entry = entry
+        self.append_entry(entry)
+        self.conversation.begin_reply()
+        if self.render_markdown:
+            # The line being streamed runs from md_line to md_end; it is restyled once its newline arrives
+            self.markdown = MarkdownStream()
+            for mark in ('md_line', 'md_end'):
+                self.chat_display.mark_set(mark, "end-1c")
+                self.chat_display.mark_gravity(mark, tk.LEFT)
+
+    async def stream_response(self, token, deltas):
+        """Runs on the network engine; results reach the Tk thread through the bridge"""
+        try:
+            with telemetry.request(self.conversation.model, self.conversation.use_tor) as timer:
+                # Fit the history into the context window and start the request
+                stream, sent_tokens, saved_tokens = await self.conversation.open_stream_async()
+                self.bridge.post(self.update_context_display, sent_tokens, saved_tokens)
+
+                # Collect response
+                parts = []
+                last_chunk_tokens = 0
+
+                async for content, total_tokens in aiter_stream(stream):
+                    if content is not None:
+                        parts.append(content)
+                        timer.delta(content)
+
+                        # Hand the delta to the render loop on the main thread
+                        deltas.put(content)
+
+                    # Get token usage
+                    if total_tokens is not None:
+                        last_chunk_tokens = total_tokens
+
+                # Timings belong to the model that answered
+                timer.model = getattr(stream, 'model', timer.model)
+                if isinstance(stream, CachedStream):
+                    timer.outcome = 'cached'
+
+            self.bridge.post(self.finish_response, token, "".join(parts), last_chunk_tokens)
+            self.bridge.post(self.update_latency_display)
+
+            if isinstance(stream, CachedStream):
+                saved = stream.entry['cost']
+                self.bridge.post(self.add_system_message, "Replayed from the response cache" +
+                                 (f" (saved ~{saved:,.2f} sats)" if saved is not None else ""))
+
+            # A hedged request may have been answered by the fallback model
+            outcome = getattr(stream, 'outcome', None)
+            if outcome and outcome['winner'] != outcome['primary']:
+                self.bridge.post(self.add_system_message,
+                                 f"Answered by {outcome['winner']} ({outcome['primary']} sent nothing "
+                                 f"within {outcome['deadline_s']:g} s)")
+
+        except Exception as e:
+            # A Stop cancels the task instead, and stop_response has closed the reply
+            self.bridge.post(self.fail_response, token, f"Error: {e}")
 
-    def stream_response(self):
+    def finish_response(self, token, content, last_tokens):
+        """Flush the remaining deltas and close the assistant message"""
+        if token is not self.stream_token:
+            return
+        self.end_streaming()
+        self.stop_render_loop()
+        self.close_streaming_entry()
+        self.conversation.end_reply(content, last_tokens)
+        self.append_to_display("\n")
+        self.update_token_display(last_tokens)
+        self.toggle_input_state(True)
+
+    def fail_response(self, token, error_msg):
+        if token is not self.stream_token:
+            return
+        self.end_streaming()
+        self.stop_render_loop()
+        self.close_streaming_entry()
+
+        # Drop the failed user message along with the partial reply
+        self.conversation.abort_reply()
+        self.append_to_display("\n")
+        self.add_system_message(error_msg, 'error')
+        self.toggle_input_state(True)
+
+    def stop_response(self):
+        """Abort the streaming reply now, keeping the text shown so far as a truncated message"""
+        token = self.stream_token
+        if token is None:
+            return
+        self.end_streaming()
+        token.cancel()
+
+        # Whatever the worker queued before the abort is rendered and kept
+        self.stop_render_loop()
+        entry = self.streaming_entry
+        content = "".join(entry['parts']) if entry is not None else ""
+        self.close_streaming_entry()
+        if content:
+            self.conversation.end_reply(content, 0, truncated=True)
+        else:
+            self.conversation.abort_reply()
+        self.append_to_display("\n")
+        self.add_system_message("Reply was stopped", 'error')
+        self.toggle_input_state(True)
+        self.input_text.focus_set()
+
+    def end_streaming(self):
+        self.stream_token = None
+        self.stop_button.configure(state=tk.DISABLED)
+
+    def close_streaming_entry(self):
+        if self.markdown is not None:
+            self.append_markdown(self.markdown.finish())
+            self.markdown = None
+        entry = self.streaming_entry
+        if entry is not None:
+            entry['text'] = "".join(entry['parts'])
+            del entry['parts']
+            self.streaming_entry = None
+
+    def get_render_fps(self):
         try:
-            # Add separator and spacing before assistant message
-            self.chat_display.configure(state=tk.NORMAL)
-            self.chat_display.insert(tk.END, "\n")
-            self.chat_display.insert(tk.END, "─" * 80 + "\n", 'separator')
-            self.chat_display.insert(tk.END, "\n")
-            self.chat_display.insert(tk.END, "Assistant: ", 'assistant')
-            self.chat_display.configure(state=tk.DISABLED)
-            self.chat_display.see(tk.END)
+            fps = int(self.render_fps.get())
+        except (tk.TclError, ValueError):
+            fps = 30
+        return max(1, min(fps, 120))
+
+    def start_render_loop(self):
+        """Start draining stream_queue at the configured frame rate"""
+        self.render_stats = {'frames': 0, 'deltas': 0, 'max_batch': 0}
+        if self.render_job is None:
+            self.render_job = self.root.after(1000 // self.get_render_fps(), self.render_tick)
+
+    def stop_render_loop(self):
+        if self.render_job is not None:
+            self.root.after_cancel(self.render_job)
+            self.render_job = None
+        self.flush_stream_queue()
+
+    def render_tick(self):
+        self.flush_stream_queue()
+        self.render_job = self.root.after(1000 // self.get_render_fps(), self.render_tick)
+
+    def flush_stream_queue(self):
+        """Merge all pending deltas into a single insert"""
+        deltas = []
+        try:
+            while True:
+                deltas.append(self.stream_queue.get_nowait())
+        except queue.Empty:
+            pass
 
-            # Create streaming request
-            stream = self.client.chat.completions.create(
-                model=self.current_model.get(),
-                messages=self.messages,
-                stream=True,
-                stream_options={"include_usage": True}
-            )
+        if not deltas:
+            return
 
-            # Collect response
-            assistant_message = ""
-            last_chunk_tokens = 0
+        self.render_stats['frames'] += 1
+        self.render_stats['deltas'] += len(deltas)
+        self.render_stats['max_batch'] = max(self.render_stats['max_batch'], len(deltas))
+        text = "".join(deltas)
+        if self.streaming_entry is not None:
+            self.streaming_entry['parts'].append(text)
+        if self.conversation is not None:
+            self.conversation.record_delta(text)
+        if self.markdown is not None:
+            self.append_markdown(self.markdown.feed(text))
+        else:
+            self.append_to_display(text)
 
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    assistant_message += content
+    def append_to_display(self, content):
+        self.chat_display.configure(state=tk.NORMAL)
+        self.chat_display.insert(tk.END, content)
+        self.chat_display.configure(state=tk.DISABLED)
+        self.chat_display.see(tk.END)
 
-                    # Update display in main thread
-                    self.root.after(0, self.append_to_display, content)
+    def append_markdown(self, ops):
+        """Apply MarkdownStream operations: new text at the end, finished lines restyled in place"""
+        if not ops:
+            return
+        self.chat_display.configure(state=tk.NORMAL)
+        # md_end follows only the reply's own inserts, so a message appended meanwhile is never restyled away
+        self.chat_display.mark_gravity('md_end', tk.RIGHT)
+        for op in ops:
+            if op[0] == 'append':
+                self.chat_display.insert('md_end', op[1], op[2])
+            else:
+                self.chat_display.delete('md_line', 'md_end')
+                self.chat_display.insert('md_end', *op[1])
+                self.chat_display.mark_set('md_line', 'md_end')
+        self.chat_display.mark_gravity('md_end', tk.LEFT)
+        self.chat_display.configure(state=tk.DISABLED)
+        self.chat_display.see(tk.END)
 
-                # Get token usage
-                if hasattr(chunk, 'usage') and chunk.usage is not None:
-                    last_chunk_tokens = chunk.usage.total_tokens
+    def deltas_per_frame(self):
+        if not self.render_stats['frames']:
+            return 0.0
+        return self.render_stats['deltas'] / self.render_stats['frames']
 
-            # Add to conversation history
-            self.messages.append({"role": "assistant", "content": assistant_message})
+    def update_context_display(self, sent_tokens, saved_tokens):
+        text = f"Context: ~{sent_tokens:,} tokens"
+        if saved_tokens:
+            text += f" (saved ~{saved_tokens:,})"
+        self.context_label.config(text=text)
 
-            # Update tokens
-            self.total_tokens += last_chunk_tokens
-            self.root.after(0, self.update_token_display, last_chunk_tokens)
-            
-            # Add extra line after assistant message
-            self.root.after(0, self.append_to_display, "\n")
+    def update_latency_display(self):
+        if self.conversation is None:
+            return
+        summary = telemetry.summary(self.conversation.model, 'tor' if self.conversation.use_tor else 'clearnet')
+        parts = []
+        if summary['ttft_ms_p50'] is not None:
+            parts.append(f"TTFT p50 {summary['ttft_ms_p50'] / 1000:.1f}s p90 {summary['ttft_ms_p90'] / 1000:.1f}s")
+        if summary['tokens_per_second_p50'] is not None:
+            parts.append(f"{summary['tokens_per_second_p50']:.0f} tok/s")
+        text = " | ".join(parts)
+        self.latency_label.config(text=f"{text} (n={summary['requests']})" if text else "")
 
-            # Re-enable input
-            self.root.after(0, self.toggle_input_state, True)
+    def update_token_display(self, last_tokens):
+        self.last_tokens = last_tokens
+        self.refresh_token_label()
 
-        except Exception as e:
-            error_msg = f"Error: {e}"
-            self.root.after(0, self.add_system_message, error_msg, 'error')
-            self.root.after(0, self.toggle_input_state, True)
+    def refresh_token_label(self):
+        parts = []
+        if self.conversation_active:
+            prompt_tokens = self.conversation.prompt_estimate(self.draft_tokens)
+            next_text = f"Next: ~{prompt_tokens:,} tokens"
 
-            # Remove failed user message
-            if self.messages and self.messages[-1]['role'] == 'user':
-                self.messages.pop()
+            cost = self.conversation.prompt_cost(prompt_tokens)
+            if cost is not None:
+                next_text += f" (~{cost:,.1f} sats)"
+            parts.append(next_text)
 
-    def append_to_display(self, content):
-        self.chat_display.configure(state=tk.NORMAL)
-        self.chat_display.insert(tk.END, content)
-        self.chat_display.configure(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
+        if self.last_tokens is not None:
+            parts.append(f"Last: {self.last_tokens} tokens | Total: {self.conversation.total_tokens} tokens"
+                         f" | Render: {self.deltas_per_frame():.1f} deltas/frame")
 
-    def update_token_display(self, last_tokens):
-        self.token_label.config(text=f"Last: {last_tokens} tokens | Total: {self.total_tokens} tokens")
+        self.token_label.config(text=" | ".join(parts))
 
     def add_message(self, sender, message, tag):
-        self.chat_display.configure(state=tk.NORMAL)
-        
-        # Check if this is the first message to avoid separator at the beginning
-        if self.chat_display.get("1.0", "end-1c").strip():
-            # Add separator and spacing
-            self.chat_display.insert(tk.END, "\n")
-            self.chat_display.insert(tk.END, "─" * 80 + "\n", 'separator')
-            self.chat_display.insert(tk.END, "\n")
-
         # Add timestamp if tor
         if self.use_tor.get() and sender == "You":
-            self.chat_display.insert(tk.END, f"{sender} [TOR]: ", tag)
+            header = f"{sender} [TOR]: "
         else:
-            self.chat_display.insert(tk.END, f"{sender}: ", tag)
+            header = f"{sender}: "
 
-        self.chat_display.insert(tk.END, message)
-        self.chat_display.insert(tk.END, "\n")  # Add extra line after message
-        self.chat_display.configure(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
+        self.append_entry({'kind': 'message', 'header': header, 'tag': tag, 'text': message})
 
     def add_system_message(self, message, tag='system'):
+        self.append_entry({'kind': 'system', 'tag': tag, 'text': message})
+
+    def entry_segments(self, index):
+        """Return the text/tags arguments that render transcript entry `index`"""
+        entry = self.transcript[index]
+        segments = []
+
+        # Separator between messages, decided from the model rather than the widget
+        if index > 0:
+            segments += ["\n", "", "─" * 80 + "\n", 'separator', "\n", ""]
+
+        if entry['kind'] == 'system':
+            segments += [f"[{entry['text']}]\n", entry['tag'], "\n", ""]
+        elif entry['text'] is None:
+            # Assistant reply still streaming; deltas are appended as they arrive
+            segments += [entry['header'], entry['tag'], "".join(entry['parts']), ""]
+        elif entry['tag'] == 'assistant' and self.render_markdown:
+            segments += [entry['header'], entry['tag'], *render_markdown(entry['text']), "\n", ""]
+        else:
+            segments += [entry['header'], entry['tag'], entry['text'], "", "\n", ""]
+
+        return segments
+
+    def append_entry(self, entry):
+        self.transcript.append(entry)
+        index = len(self.transcript) - 1
+        at_bottom = self.chat_display.yview()[1] >= 1.0
+
         self.chat_display.configure(state=tk.NORMAL)
-        
-        # Check if this is the first message to avoid separator at the beginning
-        if self.chat_display.get("1.0", "end-1c").strip():
-            # Add separator and spacing
-            self.chat_display.insert(tk.END, "\n")
-            self.chat_display.insert(tk.END, "─" * 80 + "\n", 'separator')
-            self.chat_display.insert(tk.END, "\n")
-        
-        self.chat_display.insert(tk.END, f"[{message}]\n", tag)
-        self.chat_display.insert(tk.END, "\n")  # Add extra line after message
+        start = self.chat_display.index("end-1c")
+        self.chat_display.insert(tk.END, *self.entry_segments(index))
+        self.chat_display.mark_set(f"entry{index}", start)
         self.chat_display.configure(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
+
+        # Only drop old messages while the user is following the conversation
+        if at_bottom:
+            self.trim_transcript_view()
+            self.chat_display.see(tk.END)
+
+    def trim_transcript_view(self):
+        """Keep at most max_visible_messages entries in the widget"""
+        excess = len(self.transcript) - self.visible_start - self.max_visible_messages
+        if excess <= 0:
+            return
+
+        first_kept = self.visible_start + excess
+        self.chat_display.configure(state=tk.NORMAL)
+        self.chat_display.delete("1.0", f"entry{first_kept}")
+        for i in range(self.visible_start, first_kept):
+            self.chat_display.mark_unset(f"entry{i}")
+        self.chat_display.configure(state=tk.DISABLED)
+        self.visible_start = first_kept
+
+    def load_older_entries(self):
+        """Prepend a chunk of hidden messages when the user scrolls to the top"""
+        if self.visible_start == 0:
+            return
+
+        anchor = f"entry{self.visible_start}"
+        first = max(0, self.visible_start - SCROLLBACK_CHUNK)
+
+        self.chat_display.configure(state=tk.NORMAL)
+        for i in range(self.visible_start - 1, first - 1, -1):
+            self.chat_display.insert("1.0", *self.entry_segments(i))
+            self.chat_display.mark_set(f"entry{i}", "1.0")
+        self.chat_display.configure(state=tk.DISABLED)
+        self.visible_start = first
+
+        # Keep the user's reading position
+        self.chat_display.yview(anchor)
+
+    def on_chat_scroll(self, first, last):
+        self.chat_display.vbar.set(first, last)
+        if float(first) <= 0.0 and self.visible_start > 0:
+            self.root.after_idle(self.load_older_entries)
+        elif float(first) > 0.0 and float(last) >= 1.0 and len(self.transcript) - self.visible_start > self.max_visible_messages:
+            self.root.after_idle(self.trim_transcript_view)
+
+    def clear_transcript(self):
+        self.chat_display.configure(state=tk.NORMAL)
+        self.chat_display.delete(1.0, tk.END)
+        for i in range(self.visible_start, len(self.transcript)):
+            self.chat_display.mark_unset(f"entry{i}")
+        self.chat_display.configure(state=tk.DISABLED)
+
+        self.transcript = []
+        self.visible_start = 0
+        self.streaming_entry = None
 
     def clear_input(self):
         self.input_text.delete(1.0, tk.END)
+        self.draft_tokens = 0
+        self.refresh_token_label()
 
     def show_about(self):
         about_window = tk.Toplevel(self.root)
@@ -1158,7 +1688,7 @@ class ChatGUI:
         widget.bind("<Leave>", on_leave)
 
     def save_conversation(self):
-        if not self.messages:
+        if self.conversation is None or not self.conversation.messages:
             messagebox.showinfo("Info", "No conversation to save!")
             return
 
@@ -1166,6 +1696,8 @@ class ChatGUI:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         default_filename = f"chat_{self.current_model.get().replace('/', '_')}_{timestamp}.json"
 
+        from tkinter import filedialog
+
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
             filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
@@ -1174,35 +1706,632 @@ class ChatGUI:
 
         if filename:
             try:
-                conversation_data = {
-                    "model": self.current_model.get(),
-                    "timestamp": datetime.now().isoformat(),
-                    "messages": self.messages,
-                    "total_tokens": self.total_tokens,
-                    "used_tor": self.use_tor.get()
-                }
-
-                with open(filename, 'w') as f:
-                    json.dump(conversation_data, f, indent=2)
+                self.conversation.export(filename)
 
                 self.add_system_message(f"Conversation saved to {os.path.basename(filename)}")
 
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save conversation: {e}")
 
-def main():
-    # Check for httpx if planning to use Tor
-    try:
-        import httpx
-    except ImportError:
+    def show_search_history(self):
+        if self.store is None:
+            messagebox.showerror("Error", "Conversation history is not available")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Search History")
+        dialog.geometry("1000x700")
+        dialog.transient(self.root)
+
+        # Apply theme
+        theme = self.themes[self.theme.get()]
+        dialog.configure(bg=theme['bg'])
+
+        search_frame = ttk.Frame(dialog)
+        search_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        query_var = tk.StringVar()
+        query_entry = ttk.Entry(search_frame, textvariable=query_var)
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        query_entry.focus_set()
+
+        count_label = ttk.Label(search_frame, text="")
+        count_label.pack(side=tk.RIGHT, padx=(10, 0))
+
+        results = ttk.Treeview(dialog, columns=('model', 'date', 'role'), selectmode='browse', height=12)
+        results.heading('#0', text="Match")
+        results.heading('model', text="Model")
+        results.heading('date', text="Date")
+        results.heading('role', text="Role")
+        results.column('#0', width=560)
+        results.column('model', width=200)
+        results.column('date', width=140)
+        results.column('role', width=80)
+        results.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        preview = scrolledtext.ScrolledText(
+            dialog,
+            wrap=tk.WORD,
+            height=12,
+            font=('Consolas', self.font_size.get()),
+            bg=theme['entry_bg'],
+            fg=theme['fg']
+        )
+        preview.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        preview.configure(state=tk.DISABLED)
+
+        found = {}
+        search_job = [None]
+
+        def run_search():
+            search_job[0] = None
+            results.delete(*results.get_children())
+            found.clear()
+
+            start = time.perf_counter()
+            try:
+                rows = self.store.search(query_var.get())
+            except sqlite3.Error as e:
+                count_label.config(text=f"Error: {e}")
+                return
+            elapsed = (time.perf_counter() - start) * 1000
+
+            for row in rows:
+                iid = str(row['message_id'])
+                found[iid] = row
+                results.insert('', tk.END, iid=iid, text=row['snippet'].replace("\n", " "),
+                               values=(row['model'], row['started_at'][:16].replace("T", " "), row['role']))
+            count_label.config(text=f"{len(rows)} results in {elapsed:.1f} ms")
+
+        def schedule_search(*args):
+            if search_job[0] is not None:
+                dialog.after_cancel(search_job[0])
+            search_job[0] = dialog.after(200, run_search)
+
+        def show_conversation(event):
+            selection = results.selection()
+            if not selection:
+                return
+            row = found[selection[0]]
+
+            preview.configure(state=tk.NORMAL)
+            preview.delete(1.0, tk.END)
+            for message in self.store.messages(row['conversation_id']):
+                if message['role'] == 'system':
+                    continue
+                preview.insert(tk.END, f"{message['role'].capitalize()}: {message['content']}\n\n")
+            preview.configure(state=tk.DISABLED)
+
+        query_var.trace_add('write', schedule_search)
+        results.bind('<<TreeviewSelect>>', show_conversation)
+
+    def show_compare_models(self):
+        if not self.api_key.get():
+            messagebox.showerror("Error", "Please set your API key in Settings first!")
+            self.show_settings()
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Compare Models")
+        dialog.geometry("1300x850")
+        dialog.transient(self.root)
+
+        # Apply theme
+        theme = self.themes[self.theme.get()]
+        dialog.configure(bg=theme['bg'])
+
+        setup_frame = ttk.Frame(dialog)
+        setup_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        # Model picker (multi-select) with the same search as the New Conversation dialog
+        model_frame = ttk.LabelFrame(setup_frame, text="Models (Ctrl/Shift+click to select several)", padding=5)
+        model_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        search_var = tk.StringVar()
+        ttk.Entry(model_frame, textvariable=search_var).pack(fill=tk.X, pady=(0, 5))
+
+        model_tree = ttk.Treeview(model_frame, selectmode='extended', height=6, show='tree')
+        model_tree.pack(fill=tk.BOTH, expand=True)
+        selected = []
+
+        def populate(*args):
+            model_tree.delete(*model_tree.get_children())
+            for model in self.model_catalog.search(search_var.get()):
+                model_tree.insert('', tk.END, iid=model['id'], text=model['id'])
+            model_tree.selection_set([model for model in selected if model_tree.exists(model)])
+
+        def on_select(event):
+            visible = set(model_tree.get_children())
+            selected[:] = [model for model in selected if model not in visible] + list(model_tree.selection())
+
+        model_tree.bind('<<TreeviewSelect>>', on_select)
+        search_var.trace_add('write', populate)
+        populate()
+
+        custom_frame = ttk.Frame(model_frame)
+        custom_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(custom_frame, text="Custom model IDs (comma separated):").pack(side=tk.LEFT)
+        custom_entry = ttk.Entry(custom_frame)
+        custom_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+        # Prompt and controls
+        prompt_frame = ttk.LabelFrame(setup_frame, text="Prompt", padding=5)
+        prompt_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0))
+
+        prompt_text = tk.Text(prompt_frame, height=7, wrap=tk.WORD, font=('Consolas', 11),
+                              bg=theme['entry_bg'], fg=theme['entry_fg'], insertbackground=theme['fg'])
+        prompt_text.pack(fill=tk.BOTH, expand=True)
+        prompt_text.focus_set()
+
+        controls = ttk.Frame(prompt_frame)
+        controls.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(controls, text="Max parallel streams:").pack(side=tk.LEFT)
+        max_streams = tk.IntVar(value=int(os.getenv('COMPARE_MAX_STREAMS', '4')))
+        ttk.Spinbox(controls, from_=1, to=32, textvariable=max_streams, width=5).pack(side=tk.LEFT, padx=5)
+        run_button = ttk.Button(controls, text="Run")
+        run_button.pack(side=tk.RIGHT)
+
+        panes_frame = ttk.Frame(dialog)
+        panes_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+        state = {'comparison': None, 'panes': [], 'job': None, 'running': 0, 'run': 0}
+        events = queue.Queue()
+
+        def format_metrics(metrics):
+            text = f"TTFT {metrics['ttft_ms']:,.0f} ms" if metrics['ttft_ms'] is not None else "TTFT -"
+            if metrics['tokens_per_second'] is not None:
+                text += f" | {metrics['tokens_per_second']:,.1f} tok/s"
+            text += f" | {metrics['total_tokens']:,} tokens"
+            if metrics['estimated']:
+                text += " (est.)"
+            if metrics['cost'] is not None:
+                text += f" | ~{metrics['cost']:,.2f} sats"
+            return text
+
+        def drain():
+            """Apply all pending stream events in one pass per frame"""
+            pending = {}
+            try:
+                while True:
+                    run_id, index, kind, value = events.get_nowait()
+                    if run_id != state['run']:
+                        # Late event from a stopped run
+                        continue
+                    if kind == 'delta':
+                        pending.setdefault(index, []).append(value)
+                        continue
+                    flush(index, pending.pop(index, None))
+                    pane = state['panes'][index]
+                    if kind == 'start':
+                        pane['status'].config(text="Streaming...", foreground=theme['warning'])
+                    elif kind == 'done':
+                        pane['status'].config(text=format_metrics(value), foreground=theme['success'])
+                        state['running'] -= 1
+                    elif kind == 'error':
+                        pane['status'].config(text=value[:120], foreground=theme['error'])
+                        state['running'] -= 1
+            except queue.Empty:
+                pass
+            for index, parts in pending.items():
+                flush(index, parts)
+
+            if state['running'] > 0:
+                state['job'] = dialog.after(1000 // self.get_render_fps(), drain)
+            else:
+                state['job'] = None
+                run_button.config(text="Run")
+
+        def flush(index, parts):
+            if not parts:
+                return
+            text_widget = state['panes'][index]['text']
+            text_widget.configure(state=tk.NORMAL)
+            text_widget.insert(tk.END, "".join(parts))
+            text_widget.configure(state=tk.DISABLED)
+            text_widget.see(tk.END)
+
+        def build_panes(models):
+            for child in panes_frame.winfo_children():
+                child.destroy()
+            state['panes'] = []
+            columns = min(len(models), 3)
+            for index, model in enumerate(models):
+                frame = ttk.LabelFrame(panes_frame, text=model, padding=5)
+                frame.grid(row=index // columns, column=index % columns, sticky='nsew', padx=3, pady=3)
+                status = ttk.Label(frame, text="Queued")
+                status.pack(fill=tk.X)
+                text_widget = scrolledtext.ScrolledText(frame, wrap=tk.WORD, height=8,
+                                                        font=('Consolas', self.font_size.get()),
+                                                        bg=theme['entry_bg'], fg=theme['fg'])
+                text_widget.pack(fill=tk.BOTH, expand=True)
+                text_widget.configure(state=tk.DISABLED)
+                state['panes'].append({'text': text_widget, 'status': status})
+            for column in range(columns):
+                panes_frame.columnconfigure(column, weight=1, uniform='pane')
+            for row in range((len(models) + columns - 1) // columns):
+                panes_frame.rowconfigure(row, weight=1)
+
+        def stop():
+            if state['comparison'] is not None:
+                state['comparison'].cancel()
+            # Models that never started stay queued; count them as finished
+            state['running'] = 0
+            for pane in state['panes']:
+                if pane['status'].cget('text') in ("Queued", "Streaming..."):
+                    pane['status'].config(text="Cancelled", foreground=theme['error'])
+
+        def run():
+            if state['running'] > 0:
+                stop()
+                return
+
+            prompt = prompt_text.get(1.0, tk.END).strip()
+            custom = [model.strip() for model in custom_entry.get().split(',') if model.strip()]
+            models = list(dict.fromkeys(selected + custom))
+            if not prompt or not models:
+                messagebox.showerror("Error", "Enter a prompt and select at least one model!", parent=dialog)
+                return
+            try:
+                limit = max(1, int(max_streams.get()))
+            except (tk.TclError, ValueError):
+                limit = 4
+
+            build_panes(models)
+            state['run'] += 1
+            run_id = state['run']
+            state['running'] = len(models)
+            state['comparison'] = ModelComparison(
+                self.api_key.get(), models,
+                [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+                use_tor=self.use_tor.get(), catalog=self.model_catalog, max_streams=limit,
+                on_event=lambda index, kind, value: events.put((run_id, index, kind, value))
+            )
+            state['comparison'].start()
+            run_button.config(text="Stop")
+            if state['job'] is None:
+                state['job'] = dialog.after(1000 // self.get_render_fps(), drain)
+
+        run_button.config(command=run)
+
+        # Refresh the list if the catalog arrives while the window is open
+        self.model_catalog_listeners.append(populate)
+
+        def on_destroy(event):
+            if event.widget is not dialog:
+                return
+            if populate in self.model_catalog_listeners:
+                self.model_catalog_listeners.remove(populate)
+            if state['job'] is not None:
+                dialog.after_cancel(state['job'])
+            if state['comparison'] is not None:
+                state['comparison'].cancel()
+
+        dialog.bind('<Destroy>', on_destroy)
+
+    def show_response_cache(self):
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Response Cache")
+        dialog.geometry("520x360")
+        dialog.transient(self.root)
+
+        # Apply theme
+        theme = self.themes[self.theme.get()]
+        dialog.configure(bg=theme['bg'])
+
+        main_frame = ttk.Frame(dialog, padding=20)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        values = {}
+        rows = (('status', "Status"), ('entries', "Cached replies"), ('size', "Size"), ('requests', "Requests"),
+                ('hit_rate', "Hit rate"), ('tokens_saved', "Tokens saved"), ('sats_saved', "Credits saved"))
+        for row, (name, label) in enumerate(rows):
+            ttk.Label(main_frame, text=label + ":").grid(row=row, column=0, sticky=tk.W, pady=3)
+            values[name] = ttk.Label(main_frame, text="")
+            values[name].grid(row=row, column=1, sticky=tk.W, padx=(15, 0), pady=3)
+
+        def refresh():
+            stats = response_cache.stats()
+            values['status'].config(
+                text="On" if stats['enabled'] else "Off (set RESPONSE_CACHE=1 in .env)",
+                foreground=theme['success'] if stats['enabled'] else theme['warning']
+            )
+            values['entries'].config(text=f"{stats['entries']:,}")
+            values['size'].config(text=f"{stats['bytes'] / 1024:,.0f} KB of {stats['max_bytes'] / 1024 / 1024:,.0f} MB")
+            values['requests'].config(text=f"{stats['hits']:,} hits, {stats['misses']:,} misses")
+            values['hit_rate'].config(text=f"{stats['hit_rate']:.0%}" if stats['hit_rate'] is not None else "-")
+            values['tokens_saved'].config(text=f"{stats['tokens_saved']:,}")
+            values['sats_saved'].config(text=f"~{stats['sats_saved']:,.2f} sats")
+
+        def clear():
+            if messagebox.askyesno("Response Cache", "Remove all cached replies and reset the statistics?",
+                                   parent=dialog):
+                response_cache.clear()
+                refresh()
+
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=len(rows), column=0, columnspan=2, pady=(20, 0), sticky=tk.W)
+        ttk.Button(button_frame, text="Refresh", command=refresh).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Clear Cache", command=clear).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side=tk.LEFT, padx=(10, 0))
+
+        try:
+            refresh()
+        except sqlite3.Error as e:
+            dialog.destroy()
+            messagebox.showerror("Error", f"Response cache is not available: {e}")
+
+    def export_latency_metrics(self):
+        from tkinter import filedialog
+
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Prometheus text", "*.prom"), ("All files", "*.*")],
+            initialfile=f"latency_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        )
+        if not filename:
+            return
+        try:
+            if filename.endswith('.prom'):
+                telemetry.export_prometheus(filename)
+            else:
+                telemetry.export_csv(filename)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to export metrics: {e}")
+            return
+        self.add_system_message(f"Exported {len(telemetry.snapshot())} request timings to {filename}")
+
+    def import_conversations(self):
+        if self.store is None:
+            messagebox.showerror("Error", "Conversation history is not available")
+            return
+
+        from tkinter import filedialog
+
+        filenames = filedialog.askopenfilenames(
+            filetypes=[("Conversations", "*.json *.jsonl"), ("All files", "*.*")]
+        )
+        if not filenames:
+            return
+
+        def worker():
+            try:
+                count = self.store.import_files(filenames)
+                self.bridge.post(self.add_system_message, f"Imported {count} conversation(s) into history")
+            except Exception as e:
+                self.bridge.post(self.add_system_message, f"Import failed: {e}", 'error')
+
+        self.add_system_message(f"Importing {len(filenames)} file(s)...")
+        threading.Thread(target=worker, daemon=True).start()
+
+class StartupTrace:
+    """Cold-start timings printed by --startup-trace
+
+    Marks are measured from STARTUP_STARTED, before tkinter is imported.
+    The report flags heavy modules that were imported before the first
+    paint and exits with status 1 when first paint misses the budget.
+    """
+
+    HEAVY_MODULES = ('openai', 'pydantic', 'httpx', 'tiktoken')
+
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.marks = []
+        self.painted = False
+        self.heavy_before_paint = []
+        self.within_budget = None
+
+    def mark(self, name):
+        self.marks.append((name, (time.perf_counter() - STARTUP_STARTED) * 1000))
+
+    def first_paint(self):
+        self.painted = True
+        self.mark("first paint")
+        self.heavy_before_paint = [name for name in self.HEAVY_MODULES if name in sys.modules]
+
+    def elapsed(self, name):
+        return next(ms for mark, ms in self.marks if mark == name)
+
+    def report(self, out=sys.stderr):
+        previous = 0.0
+        print("Startup trace (ms since launch):", file=out)
+        for name, ms in self.marks:
+            print(f"  {name:<24}{ms:9.1f}  (+{ms - previous:.1f})", file=out)
+            previous = ms
+
+        if self.heavy_before_paint:
+            print(f"  heavy modules before first paint: {', '.join(self.heavy_before_paint)}", file=out)
+        paint = self.elapsed("first paint")
+        verdict = "OK" if paint <= self.budget_ms else "OVER BUDGET"
+        print(f"  first paint budget: {self.budget_ms:.0f} ms - {verdict}", file=out)
+        return paint <= self.budget_ms
+
+class LagWatchdog:
+    """Event-loop lag of the Tk main thread, enabled by --watchdog or UI_WATCHDOG=1
+
+    A heartbeat scheduled with after() every `interval_ms` measures how late
+    it runs. A sampler thread watches the heartbeat and, while it is
+    overdue by more than `threshold_ms`, samples the main thread's stack, so
+    every stall is recorded with the code that was running. The report is
+    written on exit; an overlay in the window corner shows the current lag.
+    """
+
+    MAX_STALLS = 200
+    MAX_SAMPLES = 20
+
+    def __init__(self, root, interval_ms=50, threshold_ms=200, report_path=None, overlay=True):
+        self.root = root
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.report_path = report_path or os.path.join(DATA_DIR, 'ui_lag_report.txt')
+        self.main_thread = threading.main_thread().ident
+        self.lags = []
+        self.stalls = []
+        self.current = None
+        self.expected = None
+        self.last_beat = None
+        self.started = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.overlay = tk.Label(root, text="", font=('Consolas', 9), bg='#000000', fg='#00ff00') if overlay else None
+
+    @classmethod
+    def from_env(cls, root):
+        return cls(
+            root,
+            interval_ms=float(os.getenv('UI_WATCHDOG_INTERVAL_MS', '50')),
+            threshold_ms=float(os.getenv('UI_LAG_THRESHOLD_MS', '200')),
+            overlay=os.getenv('UI_LAG_OVERLAY', '1').lower() in ('1', 'true', 'yes')
+        )
+
+    def start(self):
+        self.started = self.last_beat = time.perf_counter()
+        self.expected = self.started + self.interval
+        if self.overlay is not None:
+            self.overlay.place(relx=1.0, rely=1.0, anchor='se')
+        self.root.after(int(self.interval * 1000), self.beat)
+        threading.Thread(target=self.sample, name="lag-watchdog", daemon=True).start()
+
+    def beat(self):
+        now = time.perf_counter()
+        lag = max(now - self.expected, 0.0)
+        with self.lock:
+            self.lags.append(lag)
+            self.last_beat = now
+            if self.current is not None:
+                # The stall is over; its length is how late this beat ran
+                self.current['lag'] = lag
+                self.current = None
+        if self.overlay is not None and len(self.lags) % 5 == 0:
+            worst = max(self.lags[-100:])
+            self.overlay.config(text=f"lag {lag * 1000:.0f} ms | max {worst * 1000:.0f} ms | stalls {len(self.stalls)}",
+                                fg='#ff5050' if lag >= self.threshold else '#00ff00')
+        self.expected = now + self.interval
+        if not self.stopped.is_set():
+            self.root.after(int(self.interval * 1000), self.beat)
+
+    def sample(self):
+        """Sampler thread: stack samples of the main thread while a beat is overdue"""
+        import traceback
+
+        while not self.stopped.wait(self.threshold / 4):
+            with self.lock:
+                overdue = time.perf_counter() - self.last_beat - self.interval
+                if overdue < self.threshold:
+                    continue
+                if self.current is None:
+                    if len(self.stalls) >= self.MAX_STALLS:
+                        continue
+                    self.current = {'at': self.last_beat - self.started, 'lag': overdue, 'samples': {}}
+                    self.stalls.append(self.current)
+                stall = self.current
+            frame = sys._current_frames().get(self.main_thread)
+            if frame is None or sum(stall['samples'].values()) >= self.MAX_SAMPLES:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            with self.lock:
+                stall['samples'][stack] = stall['samples'].get(stack, 0) + 1
+                stall['lag'] = max(stall['lag'], overdue)
+
+    def stop(self):
+        self.stopped.set()
+
+    def report(self):
+        with self.lock:
+            lags = sorted(self.lags)
+            stalls = sorted(self.stalls, key=lambda stall: stall['lag'], reverse=True)
+
+        def lag_at(q):
+            return lags[min(len(lags) - 1, int(len(lags) * q))] * 1000 if lags else 0.0
+
+        lines = [
+            f"Tk event-loop lag report ({datetime.now().isoformat(timespec='seconds')})",
+            f"Heartbeat every {self.interval * 1000:.0f} ms, stall threshold {self.threshold * 1000:.0f} ms, "
+            f"{len(lags)} beats",
+            f"Lag p50 {lag_at(0.5):.1f} ms, p90 {lag_at(0.9):.1f} ms, p99 {lag_at(0.99):.1f} ms, "
+            f"max {lag_at(1.0):.1f} ms",
+            f"Stalls: {len(stalls)}",
+            ""
+        ]
+        for number, stall in enumerate(stalls, 1):
+            lines.append(f"#{number}: {stall['lag'] * 1000:.0f} ms at +{stall['at']:.1f} s")
+            # Most sampled stack first; that is where the time went
+            for stack, count in sorted(stall['samples'].items(), key=lambda item: item[1], reverse=True)[:3]:
+                lines.append(f"  {count} sample(s) in:")
+                lines.extend("    " + line for line in stack.rstrip().splitlines())
+            lines.append("")
+        return "\n".join(lines)
+
+    def write_report(self):
+        os.makedirs(os.path.dirname(self.report_path), exist_ok=True)
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        print(f"UI lag report ({len(self.stalls)} stalls) written to {self.report_path}", file=sys.stderr)
+
+def main(startup_trace=False, watchdog=False):
+    trace = StartupTrace(float(os.getenv('STARTUP_BUDGET_MS', '500'))) if startup_trace else None
+    if trace:
+        trace.mark("imports")
+
+    # Check for httpx if planning to use Tor (without paying for the import)
+    import importlib.util
+    if importlib.util.find_spec('httpx') is None:
         print("Warning: httpx[socks] not installed. Tor support will not be available.")
         print("Install with: pip install httpx[socks]")
 
     root = tk.Tk()
     root.tk.call('tk', 'scaling', float(os.getenv('UI_SCALING', '1')))
+    if trace:
+        trace.mark("tk root")
     app = ChatGUI(root)
+    if trace:
+        trace.mark("ui built")
+
+    lag_watchdog = None
+    if watchdog or os.getenv('UI_WATCHDOG', '0').lower() in ('1', 'true', 'yes'):
+        lag_watchdog = LagWatchdog.from_env(root)
+        lag_watchdog.start()
+
+        def on_map(event):
+            if event.widget is not root or trace.painted:
+                return
+            root.update_idletasks()
+            trace.first_paint()
+
+            # What the first conversation will pay, measured off the main thread
+            def preload():
+                load_sdk()
+                trace.mark("openai sdk (background)")
+                root.after(0, finish)
+
+            threading.Thread(target=preload, daemon=True).start()
+
+        def finish():
+            trace.within_budget = trace.report()
+            root.destroy()
+
+        root.bind('<Map>', on_map, add='+')
+
     root.mainloop()
+    if lag_watchdog:
+        lag_watchdog.stop()
+        lag_watchdog.write_report()
+    if app.stream_token is not None:
+        # The window may already be gone; just drop the upstream connection
+        app.stream_token.cancel()
+    app.close_conversation()
+    if app.store is not None:
+        app.store.close()
+    app.wallet.shutdown()
+    engine.close()
+    response_cache.close()
+    connection_manager.close()
+    if trace and not trace.within_budget:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ['--cli']:
+        # Terminal client without the GUI (same as python -m routstr)
+        from routstr.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[2:]))
 
+    main(startup_trace='--startup-trace' in sys.argv[1:], watchdog='--watchdog' in sys.argv[1:])
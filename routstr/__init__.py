@@ -0,0 +1,5 @@
+"""Core of pyRoutstr: conversations, wallet and transport without any UI
+
+The Tk client (pyroutstr.py) and the terminal client (python -m routstr)
+are both built on these modules.
+"""
@@ -0,0 +1,260 @@
+"""Bulk prompt runner: JSONL requests in, JSONL results out
+
+Each input line is one request:
+
+    {"id": "q1", "prompt": "Hello", "system": "Be brief", "model": "openai/o3"}
+    {"id": "q2", "messages": [{"role": "user", "content": "Hi"}], "max_tokens": 200}
+
+`id` defaults to the line number and `model` to --model. Each output line
+holds the id, model, reply content, usage, latency and, for failed items,
+the error. The output file doubles as the checkpoint: a rerun skips every
+id that already has a successful result, so a killed run resumes without
+paying for finished items again.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import ROUTSTR_BASE_URL
+from .conversation import create_client
+from .history import ConversationJournal
+from .transport import connection_manager
+
+# Request fields passed through to the completions API
+OPTIONS = ('temperature', 'top_p', 'max_tokens', 'stop', 'seed', 'presence_penalty', 'frequency_penalty')
+
+class RateLimiter:
+    """Spaces request starts at least 1/rps seconds apart across threads"""
+
+    def __init__(self, rps):
+        self.interval = 1.0 / rps if rps else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(self.next_slot, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+def read_requests(path, default_model):
+    """Parse the input JSONL into request dicts with an id, model and messages"""
+    requests = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON: {e}")
+
+            messages = item.get('messages')
+            if messages is None:
+                if 'prompt' not in item:
+                    raise ValueError(f"{path}:{line_number}: needs 'prompt' or 'messages'")
+                messages = [{"role": "user", "content": item['prompt']}]
+                if item.get('system'):
+                    messages.insert(0, {"role": "system", "content": item['system']})
+
+            requests.append({
+                'id': str(item.get('id', line_number)),
+                'model': item.get('model') or default_model,
+                'messages': messages,
+                'options': {key: item[key] for key in OPTIONS if key in item}
+            })
+    return requests
+
+def read_checkpoint(path):
+    """Ids that already have a successful result in the output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # Torn write left by a killed run
+                continue
+            if isinstance(result, dict) and 'error' not in result:
+                done.add(str(result.get('id')))
+    return done
+
+class BatchRunner:
+    """Streams many requests through one pooled client
+
+    Results are appended to `output_path` as each request finishes and
+    fsynced, so everything written survives a kill. Failed requests are
+    retried `retries` times with exponential backoff before an error
+    result is written; error results are retried again on the next run.
+    """
+
+    def __init__(self, api_key, output_path, use_tor=False, concurrency=4, rps=0.0, retries=2,
+                 base_url=ROUTSTR_BASE_URL, progress=sys.stderr):
+        # Retries are handled here, with backoff shared by the whole batch
+        self.client = create_client(api_key, use_tor, base_url).with_options(max_retries=0)
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rps)
+        self.retries = retries
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.stats = {'done': 0, 'failed': 0, 'tokens': 0}
+
+        if concurrency > connection_manager.max_connections:
+            print(f"Warning: {concurrency} concurrent streams but only {connection_manager.max_connections} "
+                  f"pooled connections; raise HTTP_MAX_CONNECTIONS", file=sys.stderr)
+
+    def complete(self, request):
+        """Run one streaming request; returns the result record"""
+        started = time.perf_counter()
+        first_token = None
+        parts = []
+        usage = None
+
+        stream = self.client.chat.completions.create(
+            model=request['model'],
+            messages=request['messages'],
+            stream=True,
+            stream_options={"include_usage": True},
+            **request['options']
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(chunk.choices[0].delta.content)
+            if getattr(chunk, 'usage', None) is not None:
+                usage = chunk.usage.model_dump(exclude_none=True)
+
+        finished = time.perf_counter()
+        return {
+            'id': request['id'],
+            'model': request['model'],
+            'content': "".join(parts),
+            'usage': usage,
+            'latency': {
+                'ttft_ms': round((first_token - started) * 1000, 1) if first_token else None,
+                'total_ms': round((finished - started) * 1000, 1)
+            }
+        }
+
+    def run_one(self, request):
+        if self.stopping.is_set():
+            return
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                result = self.complete(request)
+                break
+            except Exception as e:
+                result = {'id': request['id'], 'model': request['model'], 'error': str(e), 'attempts': attempt + 1}
+                # Bad requests, auth and payment errors will not succeed on retry
+                if getattr(e, 'status_code', None) in (400, 401, 402, 403, 404):
+                    break
+                if self.stopping.is_set() or attempt == self.retries:
+                    break
+                time.sleep(min(2 ** attempt, 30))
+        self.write(result)
+
+    def write(self, result):
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.output.write(line)
+            self.output.flush()
+            os.fsync(self.output.fileno())
+
+            if 'error' in result:
+                self.stats['failed'] += 1
+            else:
+                self.stats['done'] += 1
+                self.stats['tokens'] += (result['usage'] or {}).get('total_tokens') or 0
+            self.report()
+
+    def report(self, final=False):
+        if self.progress is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        finished = self.stats['done'] + self.stats['failed']
+        self.progress.write(
+            f"\r{finished}/{self.total} ({self.stats['failed']} failed) "
+            f"{finished / elapsed if elapsed else 0:.1f} req/s {self.stats['tokens']:,} tokens"
+            + ("\n" if final else "")
+        )
+        self.progress.flush()
+
+    def run(self, requests):
+        """Run every request without a successful result yet; returns the stats"""
+        done = read_checkpoint(self.output_path)
+        pending = [request for request in requests if request['id'] not in done]
+        if done and self.progress is not None:
+            print(f"Resuming: {len(requests) - len(pending)} of {len(requests)} already done", file=self.progress)
+
+        self.total = len(pending)
+        self.started = time.perf_counter()
+        self.output = open(self.output_path, 'a', encoding='utf-8')
+        ConversationJournal.terminate_torn_line(self.output)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch")
+        try:
+            for future in [executor.submit(self.run_one, request) for request in pending]:
+                future.result()
+        except KeyboardInterrupt:
+            # Requests already streaming are paid for; let them finish and be recorded
+            self.stopping.set()
+            print("\nStopping: finishing requests in flight...", file=sys.stderr)
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            self.output.close()
+            self.report(final=True)
+        return self.stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pyroutstr batch",
+        description="Run a JSONL file of prompts through Routstr",
+        epilog=__doc__.split("\n\n", 1)[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('input', help="requests, one JSON object per line")
+    parser.add_argument('output', help="results; also the checkpoint used to resume")
+    parser.add_argument('-m', '--model', default=os.getenv('DEFAULT_MODEL', 'openai/gpt-4.5-preview'))
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="concurrent streams (default 4)")
+    parser.add_argument('--rps', type=float, default=0, help="max requests started per second (default unlimited)")
+    parser.add_argument('--retries', type=int, default=2, help="retries per request before recording an error")
+    parser.add_argument('--tor', action='store_true', help="route traffic through Tor (localhost:9050)")
+    parser.add_argument('--api-key', default=os.getenv('ROUTSTR_API_KEY', ''),
+                        help="Routstr API key (default: ROUTSTR_API_KEY)")
+    parser.add_argument('--base-url', default=ROUTSTR_BASE_URL, help="API base URL, e.g. a local mock server")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("no API key; set ROUTSTR_API_KEY in .env or pass --api-key")
+
+    try:
+        requests = read_requests(args.input, args.model)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    runner = BatchRunner(
+        args.api_key, args.output, use_tor=args.tor, concurrency=max(1, args.concurrency),
+        rps=args.rps, retries=args.retries, base_url=args.base_url
+    )
+    try:
+        stats = runner.run(requests)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        connection_manager.close()
+    return 1 if stats['failed'] else 0
@@ -0,0 +1,195 @@
+"""Opt-in local cache of finished replies, keyed on the exact request"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .config import DATA_DIR
+
+class ResponseCache:
+    """SQLite cache of replies with LRU eviction by total size and age
+
+    The key is a SHA-256 of the canonical JSON of the model, the messages
+    actually sent and the sampling parameters, so only identical requests
+    hit. Lifetime hit and miss counts and the tokens and sats saved are kept
+    in the same database. The database is opened on first use.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS replies (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            cost REAL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS replies_by_use ON replies(last_used);
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, enabled=False, path=None, max_bytes=50 * 1024 * 1024, max_age=30 * 86400):
+        self.enabled = enabled
+        self.path = path or os.path.join(DATA_DIR, 'response_cache.db')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.db = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv('RESPONSE_CACHE', '0').lower() in ('1', 'true', 'yes'),
+            max_bytes=int(float(os.getenv('RESPONSE_CACHE_MB', '50')) * 1024 * 1024),
+            max_age=float(os.getenv('RESPONSE_CACHE_DAYS', '30')) * 86400
+        )
+
+    @staticmethod
+    def key(model, messages, params=None):
+        request = {
+            'model': model,
+            'messages': [{'role': m['role'], 'content': m['content']} for m in messages],
+            'params': params or {}
+        }
+        canonical = json.dumps(request, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def connect(self):
+        # Called with the lock held
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(self.SCHEMA)
+        return self.db
+
+    def count(self, db, name, amount=1):
+        db.execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+            (name, amount, amount)
+        )
+
+    def get(self, key):
+        """The cached reply {'model', 'content', 'tokens', 'cost'} for a key, counting the hit or miss"""
+        now = time.time()
+        with self.lock:
+            db = self.connect()
+            with db:
+                row = db.execute(
+                    "SELECT model, content, tokens, cost FROM replies WHERE key = ? AND created_at >= ?",
+                    (key, now - self.max_age)
+                ).fetchone()
+                if row is None:
+                    self.count(db, 'misses')
+                    return None
+                db.execute("UPDATE replies SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                self.count(db, 'hits')
+                self.count(db, 'tokens_saved', row[2])
+                if row[3] is not None:
+                    self.count(db, 'sats_saved', row[3])
+        return {'model': row[0], 'content': row[1], 'tokens': row[2], 'cost': row[3]}
+
+    def put(self, key, model, content, tokens, cost=None):
+        now = time.time()
+        size = len(content.encode()) + len(key) + len(model)
+        with self.lock:
+            db = self.connect()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO replies (key, model, content, tokens, cost, size, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, model, content, tokens, cost, size, now, now)
+                )
+                self.evict(db, now)
+
+    def evict(self, db, now):
+        """Drop expired replies, then the least recently used until the cache fits"""
+        db.execute("DELETE FROM replies WHERE created_at < ?", (now - self.max_age,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM replies ORDER BY last_used").fetchall():
+            db.execute("DELETE FROM replies WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.lock:
+            db = self.connect()
+            counters = dict(db.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM replies").fetchone()
+        hits = int(counters.get('hits', 0))
+        misses = int(counters.get('misses', 0))
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else None,
+            'tokens_saved': int(counters.get('tokens_saved', 0)),
+            'sats_saved': counters.get('sats_saved', 0.0)
+        }
+
+    def clear(self):
+        """Remove every cached reply and reset the statistics"""
+        with self.lock:
+            db = self.connect()
+            with db:
+                db.execute("DELETE FROM replies")
+                db.execute("DELETE FROM stats")
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+class CachedStream:
+    """Replays a cached reply in word-sized pieces through iter_stream() or aiter_stream()
+
+    No usage is reported, so the replay adds no tokens to the conversation.
+    """
+
+    PIECE = re.compile(r'\s*\S+\s*|\s+')
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.model = entry['model']
+        self.stopped = False
+
+    def pieces(self):
+        return self.PIECE.findall(self.entry['content'])
+
+    def __iter__(self):
+        for piece in self.pieces():
+            if self.stopped:
+                return
+            yield piece, None
+
+    async def __aiter__(self):
+        for piece in self.pieces():
+            yield piece, None
+            # Let other streams on the loop run between pieces
+            await asyncio.sleep(0)
+
+    def abort(self):
+        self.stopped = True
+
+    async def close(self):
+        self.stopped = True
+
+# Shared by every conversation in the process
+response_cache = ResponseCache.from_env()
@@ -0,0 +1,318 @@
+"""Record Routstr exchanges with their chunk timing and replay them offline
+
+Set CASSETTE to a file (gzip-compressed if it ends in .gz) to enable it for
+every client of the connection manager: the GUI, the CLI, batch, serve and
+the wallet calls.
+
+CASSETTE_MODE=record  passes traffic through and appends each exchange
+                      (status, headers and every body chunk with its
+                      arrival time) as one JSON line
+CASSETTE_MODE=replay  serves the recorded exchanges without network access
+
+Replay speed is CASSETTE_SPEED (1 = as recorded, 4 = four times faster,
+0 = no delays). CASSETTE_FAULTS injects faults into replayed chat
+completions, e.g. ``latency=2000,stall=5000@20,drop@50`` or ``status=503``:
+
+    latency=MS    extra wait before the response headers
+    stall=MS@N    pause before body chunk N (may be repeated)
+    drop@N        the connection is lost after N chunks
+    status=CODE   answer with this error status instead
+
+Neither API keys nor request bodies are stored; requests are matched on
+method, path and a hash of the body and query. A replayed request takes
+the next unused exchange with the same hash, else the next one for the
+same path, cycling once all have been used.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import httpx
+
+# Never stored
+SKIPPED_HEADERS = ('set-cookie',)
+
+def open_cassette(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def request_key(request):
+    """(method, path, hash of query and body) of an httpx request"""
+    digest = hashlib.sha256(request.url.query)
+    digest.update(request.read())
+    return request.method, request.url.path, digest.hexdigest()[:16]
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+class Faults:
+    """Parsed CASSETTE_FAULTS"""
+
+    def __init__(self, latency=0.0, stalls=None, drop_after=None, status=None):
+        self.latency = latency
+        self.stalls = stalls or {}
+        self.drop_after = drop_after
+        self.status = status
+
+    @classmethod
+    def parse(cls, spec):
+        faults = cls()
+        for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+            try:
+                if item.startswith('latency='):
+                    faults.latency = float(item[8:]) / 1000
+                elif item.startswith('stall='):
+                    ms, index = item[6:].split('@')
+                    faults.stalls[int(index)] = faults.stalls.get(int(index), 0) + float(ms) / 1000
+                elif item.startswith('drop@'):
+                    faults.drop_after = int(item[5:])
+                elif item.startswith('status='):
+                    faults.status = int(item[7:])
+                else:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(f"Invalid CASSETTE_FAULTS entry {item!r}")
+        return faults
+
+class Cassette:
+    """One cassette file shared by every client in the process"""
+
+    def __init__(self, path, mode='replay', speed=1.0, faults=None):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"CASSETTE_MODE must be record or replay, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.faults = faults or Faults()
+        self.exchanges = []
+        self.used = set()
+        self.turns = {}
+        self.lock = threading.Lock()
+        if mode == 'replay':
+            self.load()
+
+    @classmethod
+    def from_env(cls, path):
+        return cls(
+            path,
+            mode=os.getenv('CASSETTE_MODE', 'replay').lower(),
+            speed=float(os.getenv('CASSETTE_SPEED', '1')),
+            faults=Faults.parse(os.getenv('CASSETTE_FAULTS'))
+        )
+
+    def load(self):
+        with open_cassette(self.path, 'r') as f:
+            self.exchanges = [json.loads(line) for line in f if line.strip()]
+
+    def add(self, exchange):
+        """Append one finished exchange; written at once so a crash loses nothing recorded"""
+        line = json.dumps(exchange, separators=(',', ':')) + "\n"
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open_cassette(self.path, 'a') as f:
+                f.write(line)
+
+    def match(self, request):
+        method, path, digest = request_key(request)
+        with self.lock:
+            candidates = [i for i, exchange in enumerate(self.exchanges)
+                          if exchange['method'] == method and exchange['path'] == path]
+            if not candidates:
+                return None
+            unused = [i for i in candidates if i not in self.used]
+            exact = [i for i in unused if self.exchanges[i]['hash'] == digest]
+            if exact or unused:
+                index = (exact or unused)[0]
+            else:
+                turn = self.turns.get((method, path), 0)
+                index = candidates[turn % len(candidates)]
+                self.turns[(method, path)] = turn + 1
+            self.used.add(index)
+            return self.exchanges[index]
+
+    def wrap(self, transport, asynchronous=False):
+        """The transport to give a client: a recorder around `transport`, or a replayer instead of it"""
+        if self.mode == 'record':
+            return (AsyncRecordingTransport if asynchronous else RecordingTransport)(transport, self)
+        return (AsyncReplayTransport if asynchronous else ReplayTransport)(self)
+
+    def plan(self, request):
+        """(status, headers, header delay, [(seconds after the request, chunk bytes or None for a drop)])"""
+        exchange = self.match(request)
+        if exchange is None:
+            raise httpx.ConnectError(f"No recorded exchange for {request.method} {request.url.path} in {self.path}",
+                                     request=request)
+
+        speed = self.speed
+        scale = (lambda ms: ms / 1000 / speed) if speed > 0 else (lambda ms: 0.0)
+        faults = self.faults if request.url.path.endswith('/chat/completions') else Faults()
+        delay = scale(exchange['headers_ms']) + faults.latency
+
+        if faults.status:
+            body = json.dumps({"error": {"message": f"Injected fault: status {faults.status}",
+                                         "type": "cassette_fault"}}).encode()
+            return faults.status, [('content-type', 'application/json')], delay, [(delay, body)]
+
+        chunks = []
+        stalled = 0.0
+        for index, (ms, text) in enumerate(exchange['chunks']):
+            if index == faults.drop_after:
+                chunks.append((chunks[-1][0] if chunks else delay, None))
+                break
+            stalled += faults.stalls.get(index, 0.0)
+            chunks.append((max(scale(ms), delay) + stalled, text.encode('utf-8', 'surrogateescape')))
+        return exchange['status'], exchange['headers'], delay, chunks
+
+def new_exchange(request, response, started):
+    method, path, digest = request_key(request)
+    return {
+        'method': method,
+        'path': path,
+        'hash': digest,
+        'status': response.status_code,
+        'headers': [[name.decode('latin-1'), value.decode('latin-1')] for name, value in response.headers.raw
+                    if name.decode('latin-1').lower() not in SKIPPED_HEADERS],
+        'headers_ms': elapsed_ms(started),
+        'chunks': [],
+        'complete': False
+    }
+
+def chunk_text(chunk):
+    # Chunks may split a UTF-8 character; surrogateescape keeps the bytes exact
+    return chunk.decode('utf-8', 'surrogateescape')
+
+class RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream, cassette, exchange, started):
+        self.stream = stream
+        self.cassette = cassette
+        self.exchange = exchange
+        self.started = started
+        self.saved = False
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.exchange['chunks'].append([elapsed_ms(self.started), chunk_text(chunk)])
+            yield chunk
+        self.exchange['complete'] = True
+
+    def close(self):
+        self.stream.close()
+        if not self.saved:
+            self.saved = True
+            self.cassette.add(self.exchange)
+
+class AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, cassette, exchange, started):
+        self.stream = stream
+        self.cassette = cassette
+        self.exchange = exchange
+        self.started = started
+        self.saved = False
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.exchange['chunks'].append([elapsed_ms(self.started), chunk_text(chunk)])
+            yield chunk
+        self.exchange['complete'] = True
+
+    async def aclose(self):
+        await self.stream.aclose()
+        if not self.saved:
+            self.saved = True
+            self.cassette.add(self.exchange)
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, transport, cassette):
+        self.transport = transport
+        self.cassette = cassette
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        exchange = new_exchange(request, response, started)
+        # The original extensions keep abort_stream()'s socket shutdown working
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=RecordingStream(response.stream, self.cassette, exchange, started),
+                              extensions=response.extensions)
+
+    def close(self):
+        self.transport.close()
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, cassette):
+        self.transport = transport
+        self.cassette = cassette
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        exchange = new_exchange(request, response, started)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=AsyncRecordingStream(response.stream, self.cassette, exchange, started),
+                              extensions=response.extensions)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class ReplayStream(httpx.SyncByteStream):
+    """Yields recorded chunks on schedule; close() from another thread ends it at once"""
+
+    def __init__(self, chunks, started):
+        self.chunks = chunks
+        self.started = started
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        for at, chunk in self.chunks:
+            if self.closed.wait(max(0.0, self.started + at - time.perf_counter())):
+                return
+            if chunk is None:
+                raise httpx.ReadError("Connection dropped (injected fault)")
+            yield chunk
+
+    def close(self):
+        self.closed.set()
+
+class AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks, started):
+        self.chunks = chunks
+        self.started = started
+
+    async def __aiter__(self):
+        for at, chunk in self.chunks:
+            wait = self.started + at - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if chunk is None:
+                raise httpx.ReadError("Connection dropped (injected fault)")
+            yield chunk
+
+    async def aclose(self):
+        pass
+
+class ReplayTransport(httpx.BaseTransport):
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        status, headers, delay, chunks = self.cassette.plan(request)
+        time.sleep(delay)
+        return httpx.Response(status, headers=headers, stream=ReplayStream(chunks, started))
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        status, headers, delay, chunks = self.cassette.plan(request)
+        await asyncio.sleep(delay)
+        return httpx.Response(status, headers=headers, stream=AsyncReplayStream(chunks, started))
@@ -0,0 +1,153 @@
+"""Routstr model listing"""
+import json
+import os
+import threading
+
+from .config import DATA_DIR, ROUTSTR_BASE_URL
+from .transport import connection_manager
+
+# Popular models dictionary, used until the live catalog has been fetched
+POPULAR_MODELS = {
+    "OpenAI": [
+        "openai/o3",
+        "openai/o4-mini",
+        "openai/o4-mini-high",
+        "openai/gpt-4.5-preview",
+        "openai/gpt-4.1"
+    ],
+    "Anthropic": [
+        "anthropic/claude-opus-4",
+        "anthropic/claude-sonnet-4",
+        "anthropic/claude-3.7-sonnet",
+        "anthropic/claude-3.7-sonnet:thinking"
+    ],
+    "Google": [
+        "google/gemini-2.5-pro-preview",
+        "google/gemini-2.5-flash-preview-05-20"
+    ],
+    "Deepseek": [
+        "deepseek/deepseek-r1-0528",
+        "deepseek/deepseek-prover-v2"
+    ],
+    "Qwen": [
+        "qwen/qwen-max",
+        "qwen/qwen3-32b"
+    ]
+}
+
+class ModelCatalog:
+    """Routstr /models listing cached on disk and revalidated with ETag/Last-Modified"""
+
+    def __init__(self, cache_path=None, base_url=None):
+        self.cache_path = cache_path or os.path.join(DATA_DIR, 'models.json')
+        self.base_url = base_url or ROUTSTR_BASE_URL
+        self.models = []
+        self.etag = None
+        self.last_modified = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_model(item):
+        """Keep the fields the app needs; prices are sats per token when known"""
+        sats = item.get('sats_pricing') or {}
+        return {
+            'id': item['id'],
+            'name': item.get('name') or item['id'],
+            'context_length': item.get('context_length') or (item.get('top_provider') or {}).get('context_length'),
+            'prompt_price': float(sats['prompt']) if sats.get('prompt') is not None else None,
+            'completion_price': float(sats['completion']) if sats.get('completion') is not None else None,
+        }
+
+    def load_cached(self):
+        """Load the on-disk copy; returns False if there is none"""
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        with self.lock:
+            self.models = cached.get('models', [])
+            self.etag = cached.get('etag')
+            self.last_modified = cached.get('last_modified')
+        return True
+
+    def save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with self.lock:
+            cached = {
+                'etag': self.etag,
+                'last_modified': self.last_modified,
+                'models': self.models
+            }
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def refresh(self, use_tor=False):
+        """Revalidate against the server; returns True if the listing changed"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        client = connection_manager.client(use_tor)
+        response = client.get(f"{self.base_url}/models", headers=headers)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+
+        items = response.json().get('data', [])
+        models = [self.parse_model(item) for item in items if item.get('id')]
+        models.sort(key=lambda model: model['id'])
+
+        with self.lock:
+            self.models = models
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+        self.save_cache()
+        return True
+
+    def load_async(self, schedule, on_loaded, use_tor=False):
+        """Load the cache then revalidate in a daemon thread
+
+        `on_loaded` is scheduled on the UI thread whenever the listing changes.
+        """
+        def worker():
+            if self.load_cached():
+                schedule(on_loaded)
+            try:
+                if self.refresh(use_tor):
+                    schedule(on_loaded)
+            except Exception as e:
+                print(f"Warning: could not refresh model catalog: {e}")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def get(self, model_id):
+        with self.lock:
+            for model in self.models:
+                if model['id'] == model_id:
+                    return model
+        return None
+
+    def model_ids(self):
+        """All known model ids, falling back to POPULAR_MODELS before the first fetch"""
+        with self.lock:
+            if self.models:
+                return [model['id'] for model in self.models]
+        return [model for models in POPULAR_MODELS.values() for model in models]
+
+    def search(self, text):
+        """Models whose id or name contains every word of `text`"""
+        words = text.lower().split()
+        with self.lock:
+            models = list(self.models) or [{'id': model_id, 'name': model_id, 'context_length': None,
+                                            'prompt_price': None, 'completion_price': None}
+                                           for model_id in self.model_ids()]
+        if not words:
+            return models
+        return [model for model in models
+                if all(word in f"{model['id']} {model['name']}".lower() for word in words)]
@@ -0,0 +1,298 @@
+"""Terminal client: chat with Routstr models from a shell, streaming replies to stdout"""
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from .cache import CachedStream, response_cache
+from .catalog import ModelCatalog
+from .conversation import Conversation, iter_stream
+from .history import ConversationStore
+from .telemetry import telemetry
+from .transport import abort_stream, connection_manager
+from .wallet import WalletError, WalletService
+
+HELP = """Commands:
+  /new [model]     start a new conversation (optionally with another model)
+  /save [file]     save the conversation as JSON
+  /balance         show the wallet balance
+  /topup <token>   top up the balance with a cashu token
+  /tor on|off      route traffic through Tor (starts a new conversation)
+  /status          show token usage and the cost of the next prompt
+  /cache [clear]   show response cache statistics (or empty the cache)
+  /latency [file]  show latency percentiles per model (or export them to .csv or .prom)
+  /help            show this help
+  /quit            exit"""
+
+class TerminalChat:
+    def __init__(self, api_key, model, use_tor=False, out=sys.stdout):
+        self.api_key = api_key
+        self.model = model
+        self.use_tor = use_tor
+        self.out = out
+        self.conversation = None
+
+        # Searchable history of all conversations, shared with the GUI
+        try:
+            self.store = ConversationStore()
+        except sqlite3.Error as e:
+            print(f"Warning: conversation history disabled: {e}", file=sys.stderr)
+            self.store = None
+
+        # Prices and context sizes from the GUI's cache; no network at startup
+        self.model_catalog = ModelCatalog()
+        self.model_catalog.load_cached()
+
+        self.wallet = WalletService(None)
+
+    def start(self, model=None):
+        self.close_conversation()
+        if model:
+            self.model = model
+        self.conversation = Conversation.start(
+            self.api_key, self.model, self.use_tor, store=self.store, catalog=self.model_catalog
+        )
+
+    def close_conversation(self):
+        if self.conversation is not None:
+            self.conversation.close()
+            self.conversation = None
+
+    def send(self, text):
+        """Stream the reply to `text`; returns False if the request failed"""
+        if self.conversation is None:
+            self.start()
+
+        conversation = self.conversation
+        conversation.add_user_message(text)
+        conversation.begin_reply()
+        parts = []
+        tokens = 0
+        stream = None
+        try:
+            with telemetry.request(conversation.model, conversation.use_tor) as timer:
+                stream, _, saved_tokens = conversation.open_stream()
+                if saved_tokens:
+                    print(f"[context: saved ~{saved_tokens:,} tokens]", file=sys.stderr)
+
+                for content, total_tokens in iter_stream(stream):
+                    if content is not None:
+                        parts.append(content)
+                        timer.delta(content)
+                        conversation.record_delta(content)
+                        self.out.write(content)
+                        self.out.flush()
+                    if total_tokens is not None:
+                        tokens = total_tokens
+
+                timer.model = getattr(stream, 'model', timer.model)
+                if isinstance(stream, CachedStream):
+                    timer.outcome = 'cached'
+
+        except KeyboardInterrupt:
+            if stream is not None:
+                abort_stream(stream)
+            # Keep what was already streamed, marked as cut short
+            if parts:
+                conversation.end_reply("".join(parts), tokens, truncated=True)
+            else:
+                conversation.abort_reply()
+            self.out.write("\n")
+            print("[interrupted]", file=sys.stderr)
+            return False
+        except Exception as e:
+            conversation.abort_reply()
+            self.out.write("\n")
+            print(f"Error: {e}", file=sys.stderr)
+            return False
+
+        conversation.end_reply("".join(parts), tokens)
+        if isinstance(stream, CachedStream):
+            print("\n[replayed from cache]", file=sys.stderr, end="")
+        outcome = getattr(stream, 'outcome', None)
+        if outcome and outcome['winner'] != outcome['primary']:
+            print(f"\n[answered by {outcome['winner']}]", file=sys.stderr, end="")
+        self.out.write("\n")
+        self.out.flush()
+        return True
+
+    def save(self, filename=None):
+        if self.conversation is None or len(self.conversation.messages) <= 1:
+            print("No conversation to save!")
+            return
+
+        if not filename:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = f"chat_{self.model.replace('/', '_')}_{timestamp}.json"
+        self.conversation.export(filename)
+        print(f"Conversation saved to {filename}")
+
+    def balance(self):
+        data = self.wallet.fetch_info(self.api_key, self.use_tor)
+        print(f"Balance: {data.get('balance', 0):,} credits")
+
+    def top_up(self, token):
+        self.wallet.post_top_up(self.api_key, token, self.use_tor)
+        print("Top-up successful")
+        self.balance()
+
+    def status(self):
+        if self.conversation is None:
+            return ""
+        conversation = self.conversation
+        text = f"Total: {conversation.total_tokens} tokens"
+        cost = conversation.prompt_cost(conversation.prompt_estimate())
+        if cost is not None:
+            text += f" | Next prompt: ~{cost:,.1f} sats"
+        return text
+
+    def cache_stats(self):
+        stats = response_cache.stats()
+        lines = [
+            f"Response cache: {'on' if stats['enabled'] else 'off (set RESPONSE_CACHE=1)'}, "
+            f"{stats['entries']:,} replies, {stats['bytes'] / 1024:,.0f} KB",
+            f"Hits: {stats['hits']:,}  Misses: {stats['misses']:,}"
+            + (f"  Hit rate: {stats['hit_rate']:.0%}" if stats['hit_rate'] is not None else ""),
+            f"Saved: {stats['tokens_saved']:,} tokens, ~{stats['sats_saved']:,.2f} sats"
+        ]
+        return "\n".join(lines)
+
+    def latency(self):
+        groups = sorted({(r['model'], r['route']) for r in telemetry.snapshot()})
+        if not groups:
+            return "No requests timed yet"
+        def seconds(ms):
+            return f"{ms / 1000:.2f}s" if ms is not None else "-"
+
+        lines = [f"{'model':<36}{'route':<10}{'n':>4}{'TTFT p50':>10}{'p90':>8}{'tok/s':>7}{'gap p90':>9}"]
+        for model, route in groups:
+            summary = telemetry.summary(model, route)
+            tokens_per_second = summary['tokens_per_second_p50']
+            lines.append(
+                f"{model:<36}{route:<10}{summary['requests']:>4}{seconds(summary['ttft_ms_p50']):>10}"
+                f"{seconds(summary['ttft_ms_p90']):>8}{tokens_per_second if tokens_per_second is not None else '-':>7}"
+                f"{seconds(summary['max_gap_ms_p90']):>9}"
+            )
+        return "\n".join(lines)
+
+    def command(self, line):
+        """Run a slash command; returns False when the session should end"""
+        name, _, arg = line.partition(' ')
+        arg = arg.strip()
+
+        if name in ('/quit', '/exit'):
+            return False
+        elif name == '/help':
+            print(HELP)
+        elif name == '/new':
+            self.start(arg or None)
+            print(f"Conversation started with {self.model}")
+        elif name == '/save':
+            self.save(arg or None)
+        elif name == '/balance':
+            self.balance()
+        elif name == '/topup':
+            if not arg:
+                print("Usage: /topup <cashu token>")
+            else:
+                self.top_up(arg)
+        elif name == '/tor':
+            if arg not in ('on', 'off'):
+                print(f"Tor is {'on' if self.use_tor else 'off'}. Usage: /tor on|off")
+            else:
+                self.use_tor = arg == 'on'
+                self.start()
+                print(f"Conversation started with {self.model}" + (" [TOR]" if self.use_tor else ""))
+        elif name == '/status':
+            print(self.status() or "No conversation")
+        elif name == '/latency':
+            if arg:
+                if arg.endswith('.prom'):
+                    telemetry.export_prometheus(arg)
+                else:
+                    telemetry.export_csv(arg)
+                print(f"Exported {len(telemetry.snapshot())} request timings to {arg}")
+            else:
+                print(self.latency())
+        elif name == '/cache':
+            if arg == 'clear':
+                response_cache.clear()
+                print("Response cache cleared")
+            else:
+                print(self.cache_stats())
+        else:
+            print(f"Unknown command {name}, try /help")
+        return True
+
+    def repl(self):
+        print(f"pyRoutstr terminal - {self.model}" + (" [TOR]" if self.use_tor else "") + " - /help for commands")
+        while True:
+            try:
+                line = input("> ").strip()
+            except (EOFError, KeyboardInterrupt):
+                print()
+                break
+            if not line:
+                continue
+
+            if line.startswith('/'):
+                try:
+                    if not self.command(line):
+                        break
+                except WalletError as e:
+                    print(f"Error: {e.status_code} - {e.text}", file=sys.stderr)
+                except Exception as e:
+                    print(f"Error: {e}", file=sys.stderr)
+            else:
+                self.send(line)
+
+    def close(self):
+        self.close_conversation()
+        if self.store is not None:
+            self.store.close()
+        self.wallet.shutdown()
+        response_cache.close()
+        connection_manager.close()
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['batch']:
+        from .batch import main as batch_main
+        return batch_main(argv[1:])
+    if argv[:1] == ['serve']:
+        from .gateway import main as serve_main
+        return serve_main(argv[1:])
+    if argv[:1] == ['mock']:
+        from .mock_server import main as mock_main
+        return mock_main(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        prog="pyroutstr",
+        description="Chat with Routstr models from the terminal",
+        epilog="Run 'pyroutstr batch --help' for the bulk JSONL runner, "
+               "'pyroutstr serve --help' for the local OpenAI-compatible gateway and "
+               "'pyroutstr mock --help' for the mock Routstr API."
+    )
+    parser.add_argument('prompt', nargs='*', help="send one prompt, print the reply and exit (- reads stdin)")
+    parser.add_argument('-m', '--model', default=os.getenv('DEFAULT_MODEL', 'openai/gpt-4.5-preview'))
+    parser.add_argument('--tor', action='store_true', help="route traffic through Tor (localhost:9050)")
+    parser.add_argument('--api-key', default=os.getenv('ROUTSTR_API_KEY', ''),
+                        help="Routstr API key (default: ROUTSTR_API_KEY)")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("no API key; set ROUTSTR_API_KEY in .env or pass --api-key")
+
+    chat = TerminalChat(args.api_key, args.model, args.tor)
+    try:
+        if args.prompt:
+            prompt = sys.stdin.read() if args.prompt == ['-'] else " ".join(args.prompt)
+            return 0 if chat.send(prompt) else 1
+        chat.repl()
+        return 0
+    finally:
+        chat.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
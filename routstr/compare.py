@@ -0,0 +1,105 @@
+"""Send one prompt to several models at once and measure each reply"""
+import asyncio
+import time
+
+from .conversation import create_async_client, load_sdk
+from .engine import engine
+from .tokens import message_tokens, token_counter
+
+class ModelComparison:
+    """Streams the same messages to several models, at most `max_streams` at a time
+
+    The streams run as tasks on the network engine, so the number of models
+    costs no threads. `on_event(index, kind, value)` is called from the
+    engine thread with kind 'start', 'delta' (text), 'done' (metrics dict)
+    or 'error' (message); `index` is the model's position in `models`.
+    """
+
+    def __init__(self, api_key, models, messages, use_tor=False, catalog=None, max_streams=4, on_event=None):
+        self.api_key = api_key
+        self.models = models
+        self.messages = messages
+        self.use_tor = use_tor
+        self.catalog = catalog
+        self.max_streams = max(1, max_streams)
+        self.on_event = on_event
+        self.future = None
+
+    def start(self):
+        self.future = engine.submit(self.run())
+
+    def cancel(self):
+        """Stop every stream; queued models never start"""
+        if self.future is not None:
+            self.future.cancel()
+
+    async def run(self):
+        # The first SDK import is slow; keep it off the loop
+        await asyncio.to_thread(load_sdk)
+        # One client (one connection pool) for all models
+        client = create_async_client(self.api_key, self.use_tor)
+        slots = asyncio.Semaphore(self.max_streams)
+        await asyncio.gather(*(
+            self.run_model(client, slots, index, model) for index, model in enumerate(self.models)
+        ))
+
+    async def run_model(self, client, slots, index, model):
+        async with slots:
+            self.on_event(index, 'start', None)
+            try:
+                started = time.perf_counter()
+                first_token = None
+                parts = []
+                usage = None
+
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=self.messages,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            if first_token is None:
+                                first_token = time.perf_counter()
+                            parts.append(chunk.choices[0].delta.content)
+                            self.on_event(index, 'delta', chunk.choices[0].delta.content)
+                        if getattr(chunk, 'usage', None) is not None:
+                            usage = chunk.usage
+
+                finished = time.perf_counter()
+                self.on_event(index, 'done', self.metrics(model, "".join(parts), usage, started, first_token, finished))
+
+            except asyncio.CancelledError:
+                self.on_event(index, 'error', "Cancelled")
+                raise
+            except Exception as e:
+                self.on_event(index, 'error', str(e))
+
+    def metrics(self, model, text, usage, started, first_token, finished):
+        """TTFT, generation speed, token counts and cost (sats) of one reply"""
+        estimated = usage is None
+        if estimated:
+            prompt_tokens = sum(message_tokens(dict(message)) for message in self.messages)
+            completion_tokens = token_counter.count(text)
+        else:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+
+        generating = finished - first_token if first_token else 0
+        cost = None
+        model_info = self.catalog.get(model) if self.catalog else None
+        if model_info and model_info['prompt_price'] is not None and model_info['completion_price'] is not None:
+            cost = prompt_tokens * model_info['prompt_price'] + completion_tokens * model_info['completion_price']
+
+        return {
+            'ttft_ms': (first_token - started) * 1000 if first_token else None,
+            'total_ms': (finished - started) * 1000,
+            'tokens_per_second': completion_tokens / generating if generating > 0 else None,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'cost': cost,
+            'estimated': estimated
+        }
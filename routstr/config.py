@@ -0,0 +1,16 @@
+"""Settings shared by the GUI, the terminal client and other front ends"""
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Point at a local mock server (python -m routstr mock) to develop and benchmark without spending credits
+ROUTSTR_BASE_URL = os.getenv('ROUTSTR_BASE_URL', 'https://api.routstr.com/v1').rstrip('/')
+TOR_PROXY = "socks5://localhost:9050"
+
+# Local state (model cache, journals, history database) lives here
+DATA_DIR = os.getenv('PYROUTSTR_DATA_DIR', os.path.join(os.path.expanduser('~'), '.pyroutstr'))
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
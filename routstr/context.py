@@ -0,0 +1,80 @@
+"""Fitting conversation history into a model's context window"""
+import os
+
+from .tokens import message_tokens
+
+class ContextBudget:
+    """Fits a conversation into a model's context window before it is sent
+
+    Strategies:
+      drop     - drop the oldest turns only when the history would not fit
+      last_k   - send at most the last `keep_turns` turns (and still fit)
+      summary  - like drop, but fold dropped turns into a rolling summary
+                 produced by `summarize(text)`
+    """
+
+    def __init__(self, context_limit, reserve_tokens=4096, strategy='drop', keep_turns=0, summarize=None):
+        self.context_limit = context_limit
+        self.reserve_tokens = reserve_tokens
+        self.strategy = strategy
+        self.keep_turns = keep_turns
+        self.summarize = summarize
+        self.summary = None
+        self.summary_covers = 0
+
+    @classmethod
+    def from_env(cls, context_limit=None, summarize=None):
+        return cls(
+            context_limit=context_limit or int(os.getenv('DEFAULT_CONTEXT_LENGTH', '32000')),
+            reserve_tokens=int(os.getenv('CONTEXT_RESERVE', '4096')),
+            strategy=os.getenv('CONTEXT_STRATEGY', 'drop'),
+            keep_turns=int(os.getenv('CONTEXT_KEEP_TURNS', '0')),
+            summarize=summarize
+        )
+
+    def prepare(self, messages):
+        """Return (messages to send, tokens sent, tokens saved compared to the full history)"""
+        system = messages[:1] if messages and messages[0]['role'] == 'system' else []
+        history = messages[len(system):]
+        full_tokens = sum(message_tokens(m) for m in messages)
+        budget = max(self.context_limit - self.reserve_tokens, 0)
+
+        # Turns start at user messages; only cut on those boundaries
+        turn_starts = [i for i, m in enumerate(history) if m['role'] == 'user'] or [0]
+        start = 0
+        if self.strategy == 'last_k' and self.keep_turns > 0:
+            start = turn_starts[max(len(turn_starts) - self.keep_turns, 0)]
+
+        kept_tokens = sum(message_tokens(m) for m in system) + sum(message_tokens(m) for m in history[start:])
+        for turn_start in turn_starts:
+            if kept_tokens <= budget or turn_start == turn_starts[-1]:
+                break
+            if turn_start <= start:
+                continue
+            kept_tokens -= sum(message_tokens(m) for m in history[start:turn_start])
+            start = turn_start
+
+        outbound = [{'role': m['role'], 'content': m['content']} for m in system]
+        if self.strategy == 'summary' and start > 0 and self.summarize is not None:
+            try:
+                self.fold_into_summary(history, start)
+            except Exception as e:
+                # Fall back to plain dropping; the summary is retried next request
+                print(f"Warning: could not summarize history: {e}")
+            if self.summary:
+                summary_message = {'role': 'system', 'content': f"Summary of the earlier conversation:\n{self.summary}"}
+                kept_tokens += message_tokens(summary_message)
+                outbound.append({'role': 'system', 'content': summary_message['content']})
+        outbound.extend({'role': m['role'], 'content': m['content']} for m in history[start:])
+
+        return outbound, kept_tokens, max(full_tokens - kept_tokens, 0)
+
+    def fold_into_summary(self, history, start):
+        """Extend the rolling summary with turns dropped since the last request"""
+        if start <= self.summary_covers:
+            return
+
+        dropped = "\n\n".join(f"{m['role']}: {m['content']}" for m in history[self.summary_covers:start])
+        text = f"Previous summary:\n{self.summary}\n\nNew turns:\n{dropped}" if self.summary else dropped
+        self.summary = self.summarize(text)
+        self.summary_covers = start
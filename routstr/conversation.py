@@ -0,0 +1,378 @@
+"""Conversation state and streaming shared by the GUI and the terminal client"""
+import asyncio
+import json
+import os
+from datetime import datetime
+
+from .cache import CachedStream, response_cache
+from .config import DEFAULT_SYSTEM_PROMPT, ROUTSTR_BASE_URL
+from .context import ContextBudget
+from .engine import engine
+from .hedge import AsyncHedgedStream, HedgedStream, hedge_policy
+from .history import ConversationJournal, SavedConversationReader
+from .sse import AsyncRawStream, RawStream, open_raw_stream, open_raw_stream_async
+from .tokens import message_tokens, token_counter
+from .transport import connection_manager
+
+def load_sdk():
+    """Import the OpenAI SDK (slow: pydantic and friends); safe to call from any thread"""
+    from openai import OpenAI
+    return OpenAI
+
+def create_client(api_key, use_tor=False, base_url=ROUTSTR_BASE_URL):
+    """OpenAI client for Routstr on the shared connection pool for this route"""
+    OpenAI = load_sdk()
+    return OpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        http_client=connection_manager.client(use_tor)
+    )
+
+def raw_streaming():
+    """Whether plain streams skip the SDK's per-chunk models (STREAM_DECODER=raw, the default)"""
+    return os.getenv('STREAM_DECODER', 'raw').lower() != 'sdk'
+
+def create_async_client(api_key, use_tor=False, base_url=ROUTSTR_BASE_URL):
+    """AsyncOpenAI client on the network engine's pool; use it only from engine tasks"""
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        http_client=engine.http_client(use_tor)
+    )
+
+def iter_stream(stream):
+    """Yield (content, total_tokens) for each chunk of a chat completion stream
+
+    content is None for chunks without text and total_tokens is None until
+    the usage chunk arrives.
+    """
+    if isinstance(stream, (RawStream, CachedStream)):
+        yield from stream
+        return
+    for chunk in stream:
+        content = chunk.choices[0].delta.content if chunk.choices else None
+        usage = getattr(chunk, 'usage', None)
+        yield content, usage.total_tokens if usage is not None else None
+
+async def aiter_stream(stream):
+    """iter_stream() for an async stream; the stream is closed when iteration stops or is cancelled"""
+    try:
+        if isinstance(stream, (AsyncRawStream, CachedStream)):
+            async for event in stream:
+                yield event
+            return
+        async for chunk in stream:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            usage = getattr(chunk, 'usage', None)
+            yield content, usage.total_tokens if usage is not None else None
+    finally:
+        await stream.close()
+
+class Conversation:
+    """One chat with a model: history, token accounting, journal and history store
+
+    Replies are recorded in three steps so front ends can journal exactly
+    what they rendered: begin_reply(), record_delta() per rendered batch,
+    then end_reply() or abort_reply().
+    """
+
+    def __init__(self, api_key, model, use_tor=False, store=None, catalog=None):
+        self.api_key = api_key
+        self.model = model
+        self.use_tor = use_tor
+        self.store = store
+        self.catalog = catalog
+        self.client = None
+        self.async_client = None
+        self.journal = None
+        self.conversation_id = None
+        self.messages = []
+        self.history_tokens = 0
+        self.total_tokens = 0
+        self.cache_key = None
+        self.cache_prompt_tokens = 0
+
+        # Trim or compact the history to fit the model's context window
+        model_info = catalog.get(model) if catalog else None
+        self.context_budget = ContextBudget.from_env(
+            context_limit=model_info and model_info['context_length'],
+            summarize=self.summarize_history
+        )
+
+    @classmethod
+    def start(cls, api_key, model, use_tor=False, store=None, catalog=None, system_prompt=DEFAULT_SYSTEM_PROMPT):
+        """Begin a new conversation with its own journal and history row"""
+        conversation = cls(api_key, model, use_tor, store, catalog)
+        conversation.open_records()
+        conversation.append({"role": "system", "content": system_prompt})
+        return conversation
+
+    @classmethod
+    def restore(cls, state, api_key, store=None, catalog=None):
+        """Continue a conversation replayed from an interrupted journal"""
+        conversation = cls(api_key, state['model'], state['used_tor'], store, catalog)
+
+        # Keep appending to the journal that was interrupted
+        conversation.journal = ConversationJournal(state['path'])
+        source = os.path.abspath(state['path'])
+        if store:
+            conversation.conversation_id = store.find_by_source(source)
+            if conversation.conversation_id is None:
+                store.import_files([state['path']])
+                conversation.conversation_id = store.find_by_source(source)
+
+        for message in state['messages']:
+            conversation.append(message, record=False)
+        conversation.total_tokens = state['total_tokens']
+        return conversation
+
+    @classmethod
+    def load(cls, path, api_key, use_tor=False, store=None, catalog=None, default_model=None, on_batch=None):
+        """Build a conversation from a Save Conversation file without reading it whole
+
+        The file is parsed in batches; each batch is counted, written to a new
+        journal and history row, and passed to `on_batch(messages)` from the
+        calling thread. Returns (conversation, meta).
+        """
+        reader = SavedConversationReader(path)
+        conversation = None
+        try:
+            for batch in reader.batches():
+                batch = [
+                    {'role': m['role'], 'content': m['content']}
+                    for m in batch if isinstance(m, dict) and m.get('content') is not None
+                ]
+                for message in batch:
+                    message_tokens(message)
+
+                if conversation is None:
+                    model = reader.meta.get('model') or default_model
+                    conversation = cls(api_key, model, use_tor, store, catalog)
+                    conversation.open_records()
+                conversation.extend(batch)
+
+                if on_batch is not None:
+                    on_batch(batch)
+        except Exception:
+            if conversation is not None:
+                conversation.close()
+            raise
+
+        if conversation is None:
+            raise ValueError("The file contains no messages")
+        conversation.total_tokens = reader.meta.get('total_tokens', 0)
+        return conversation, reader.meta
+
+    def open_records(self):
+        self.journal = ConversationJournal.create(self.model, self.use_tor)
+        if self.store:
+            self.conversation_id = self.store.create_conversation(
+                self.model, self.use_tor, source=os.path.abspath(self.journal.path)
+            )
+
+    def connect(self):
+        self.client = create_client(self.api_key, self.use_tor)
+
+    def append(self, message, record=True):
+        """Append to the history, keeping the running prompt size up to date"""
+        self.messages.append(message)
+        self.history_tokens += message_tokens(message)
+        if record and self.journal is not None:
+            self.journal.message(message)
+        if record and self.conversation_id is not None:
+            self.store.add_message(self.conversation_id, message['role'], message['content'], message['tokens'])
+
+    def extend(self, messages):
+        """Append many messages with one journal write and one transaction"""
+        for message in messages:
+            self.messages.append(message)
+            self.history_tokens += message_tokens(message)
+        if self.journal is not None:
+            self.journal.messages(messages)
+        if self.conversation_id is not None:
+            self.store.add_messages(self.conversation_id, messages)
+
+    def pop(self):
+        message = self.messages.pop()
+        self.history_tokens -= message_tokens(message)
+        if self.journal is not None:
+            self.journal.pop()
+        if self.conversation_id is not None:
+            self.store.delete_last_message(self.conversation_id)
+        return message
+
+    def add_user_message(self, text):
+        self.append({"role": "user", "content": text})
+
+    def summarize_history(self, text):
+        """Condense old turns with a cheap model for the rolling context summary"""
+        response = self.client.chat.completions.create(
+            model=os.getenv('SUMMARY_MODEL', 'openai/gpt-4.1-mini'),
+            messages=[
+                {"role": "system", "content": "Summarize this conversation so it can replace the original turns. "
+                                              "Keep facts, decisions, names and open questions. Be concise."},
+                {"role": "user", "content": text}
+            ]
+        )
+        return response.choices[0].message.content
+
+    def prepare_request(self):
+        """Fit the history into the context window and look it up in the response cache
+
+        Returns (messages, tokens sent, tokens saved, CachedStream or None).
+        """
+        if self.client is None:
+            self.connect()
+        messages, sent_tokens, saved_tokens = self.context_budget.prepare(self.messages)
+
+        self.cache_key = None
+        if not response_cache.enabled:
+            return messages, sent_tokens, saved_tokens, None
+        key = response_cache.key(self.model, messages)
+        entry = response_cache.get(key)
+        if entry is not None:
+            return messages, sent_tokens, saved_tokens, CachedStream(entry)
+        # Stored by end_reply; a hedged reply may come from another model, so it is not
+        if not hedge_policy.applies(self.model):
+            self.cache_key, self.cache_prompt_tokens = key, sent_tokens
+        return messages, sent_tokens, saved_tokens, None
+
+    def open_stream(self):
+        """Start a streaming completion for the history
+
+        Returns (stream, tokens sent, tokens saved by the context budget);
+        read the stream with iter_stream(). A cache hit is a CachedStream.
+        With hedging enabled it is a HedgedStream, whose `model` names the
+        model that answered; plain streams are decoded by routstr.sse
+        unless STREAM_DECODER=sdk.
+        """
+        messages, sent_tokens, saved_tokens, cached = self.prepare_request()
+        if cached is not None:
+            return cached, sent_tokens, saved_tokens
+
+        def create(model):
+            return self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+        # Race a fallback model if the first token is slow (opt-in)
+        if hedge_policy.applies(self.model):
+            stream = HedgedStream(create, self.model, hedge_policy, sent_tokens, self.catalog)
+        else:
+            stream = None
+            if raw_streaming():
+                stream = open_raw_stream(connection_manager.client(self.use_tor), ROUTSTR_BASE_URL,
+                                         self.api_key, self.model, messages)
+            if stream is None:
+                stream = create(self.model)
+        return stream, sent_tokens, saved_tokens
+
+    async def open_stream_async(self):
+        """open_stream() for a task on the network engine"""
+        # The first SDK import, token counting, any summary request and the cache stay off the loop
+        messages, sent_tokens, saved_tokens, cached = await asyncio.to_thread(self.prepare_request)
+        if cached is not None:
+            return cached, sent_tokens, saved_tokens
+        if self.async_client is None:
+            self.async_client = create_async_client(self.api_key, self.use_tor)
+
+        async def create(model):
+            return await self.async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+        if hedge_policy.applies(self.model):
+            stream = AsyncHedgedStream(create, self.model, hedge_policy, sent_tokens, self.catalog)
+        else:
+            stream = None
+            if raw_streaming():
+                stream = await open_raw_stream_async(engine.http_client(self.use_tor), ROUTSTR_BASE_URL,
+                                                     self.api_key, self.model, messages)
+            if stream is None:
+                stream = await create(self.model)
+        return stream, sent_tokens, saved_tokens
+
+    def begin_reply(self):
+        if self.journal is not None:
+            self.journal.reply_start()
+
+    def record_delta(self, text):
+        if self.journal is not None:
+            self.journal.delta(text)
+
+    def end_reply(self, content, tokens, truncated=False):
+        """Commit a reply (the journal already holds its text as deltas)
+
+        A reply stopped by the user is kept with `truncated` set.
+        """
+        reply = {"role": "assistant", "content": content}
+        if truncated:
+            reply['truncated'] = True
+        self.append(reply, record=False)
+        self.total_tokens += tokens
+
+        if self.journal is not None:
+            self.journal.reply_end(tokens, self.total_tokens, truncated)
+        if self.conversation_id is not None:
+            self.store.add_message(self.conversation_id, reply['role'], reply['content'], reply['tokens'])
+            self.store.set_total_tokens(self.conversation_id, self.total_tokens)
+
+        if self.cache_key is not None and not truncated:
+            response_cache.put(self.cache_key, self.model, content, tokens, self.reply_cost(content, tokens))
+        self.cache_key = None
+
+    def abort_reply(self):
+        """Discard a failed reply together with the user message that asked for it"""
+        self.cache_key = None
+        if self.journal is not None:
+            self.journal.reply_abort()
+        if self.messages and self.messages[-1]['role'] == 'user':
+            self.pop()
+
+    def prompt_estimate(self, draft_tokens=0):
+        """Expected prompt size of the next request, capped by the context budget"""
+        budget = self.context_budget.context_limit - self.context_budget.reserve_tokens
+        return min(self.history_tokens + draft_tokens, max(budget, 0))
+
+    def prompt_cost(self, tokens):
+        """Cost in sats of sending `tokens` prompt tokens, if the price is known"""
+        model_info = self.catalog.get(self.model) if self.catalog else None
+        if model_info and model_info['prompt_price'] is not None:
+            return tokens * model_info['prompt_price']
+        return None
+
+    def reply_cost(self, content, tokens):
+        """Sats paid for the reply just received (prompt and completion), if prices are known"""
+        model_info = self.catalog.get(self.model) if self.catalog else None
+        if not model_info or model_info['prompt_price'] is None or model_info['completion_price'] is None:
+            return None
+        prompt_tokens = self.cache_prompt_tokens
+        completion_tokens = tokens - prompt_tokens if tokens > prompt_tokens else token_counter.count(content)
+        return prompt_tokens * model_info['prompt_price'] + completion_tokens * model_info['completion_price']
+
+    def export(self, path):
+        """Write the conversation as one JSON document, generated from the journal"""
+        state = ConversationJournal.replay(self.journal.path)
+        conversation_data = {
+            "model": state['model'],
+            "timestamp": datetime.now().isoformat(),
+            "messages": state['messages'],
+            "total_tokens": state['total_tokens'],
+            "used_tor": state['used_tor']
+        }
+
+        with open(path, 'w') as f:
+            json.dump(conversation_data, f, indent=2)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.conversation_id = None
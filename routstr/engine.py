@@ -0,0 +1,102 @@
+"""One asyncio event loop for streaming network work, and a bridge back to the UI thread"""
+import asyncio
+import queue
+import threading
+
+from .transport import connection_manager
+
+class NetworkEngine:
+    """An asyncio loop on a daemon thread driving async httpx clients
+
+    Any number of streams run as tasks on the one loop, so parallel replies,
+    hedged races and wallet calls cost no extra threads. submit() may be
+    called from any thread and returns a concurrent.futures.Future;
+    cancelling that future cancels the task, which closes its stream.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="network-engine", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def http_client(self, use_tor=False):
+        """The engine's pooled async client for a route; use it only from engine tasks"""
+        route = 'tor' if use_tor else 'clearnet'
+        with self.lock:
+            if route not in self.clients:
+                self.clients[route] = connection_manager.create_client(use_tor, asynchronous=True)
+            return self.clients[route]
+
+    async def close_clients(self):
+        with self.lock:
+            clients, self.clients = list(self.clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+    def close(self, timeout=2.0):
+        """Cancel every task, close the clients and stop the loop"""
+        with self.lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.close_clients()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        self.thread.join(timeout)
+
+class CallbackBridge:
+    """Hands callbacks from engine tasks (or any thread) to the UI thread
+
+    `wake(drain)` must make the UI thread call drain() soon, e.g.
+    ``lambda drain: root.after(0, drain)``. Posts that arrive before the
+    UI thread gets to it are run together by a single wake-up.
+    """
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.calls = queue.SimpleQueue()
+        self.scheduled = False
+        self.lock = threading.Lock()
+
+    def post(self, callback, *args):
+        self.calls.put((callback, args))
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.wake(self.drain)
+
+    def drain(self):
+        with self.lock:
+            self.scheduled = False
+        while True:
+            try:
+                callback, args = self.calls.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+# Shared by every front end in the process; the loop starts on first use
+engine = NetworkEngine()
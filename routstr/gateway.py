@@ -0,0 +1,263 @@
+"""Local OpenAI-compatible gateway: many local tools, one upstream pool and one API key
+
+    python -m routstr serve [--port 8787] [--tor]
+
+Tools point their OpenAI base URL at http://127.0.0.1:8787/v1 and send any
+bearer token; the token only names the client in the usage report
+(GET /usage). Requests are forwarded with the stored ROUTSTR_API_KEY over
+the shared connection pool, so all tools reuse the same keep-alive
+connections and Tor circuit. Streaming responses are relayed event by
+event as they arrive.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import ROUTSTR_BASE_URL
+from .transport import connection_manager
+
+class UsageTracker:
+    """Per-client request and token counters"""
+
+    FIELDS = ('requests', 'errors', 'aborted', 'prompt_tokens', 'completion_tokens', 'total_tokens')
+
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def record(self, client, usage=None, error=False, aborted=False):
+        with self.lock:
+            counters = self.clients.setdefault(client, dict.fromkeys(self.FIELDS, 0))
+            counters['requests'] += 1
+            counters['errors'] += bool(error)
+            counters['aborted'] += bool(aborted)
+            for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+                counters[key] += (usage or {}).get(key) or 0
+
+    def snapshot(self):
+        with self.lock:
+            return {client: dict(counters) for client, counters in self.clients.items()}
+
+class Gateway:
+    """Forwards chat completions upstream and accounts usage per client"""
+
+    def __init__(self, api_key, use_tor=False, base_url=ROUTSTR_BASE_URL, client_keys=None):
+        self.api_key = api_key
+        self.use_tor = use_tor
+        self.base_url = base_url.rstrip('/')
+        self.client_keys = client_keys
+        self.usage = UsageTracker()
+        self.started = time.time()
+
+    def upstream(self):
+        return connection_manager.client(self.use_tor)
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'pyRoutstr-gateway'
+
+    @property
+    def gateway(self):
+        return self.server.gateway
+
+    def client_name(self):
+        auth = self.headers.get('Authorization', '')
+        return auth[7:].strip() if auth.lower().startswith('bearer ') else 'anonymous'
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": {"message": message, "type": "gateway_error"}})
+
+    def authorized(self):
+        keys = self.gateway.client_keys
+        if keys and self.client_name() not in keys:
+            self.send_error_json(401, "Unknown client key")
+            return False
+        return True
+
+    def do_GET(self):
+        if self.path == '/usage':
+            self.send_json(200, {
+                "uptime_seconds": round(time.time() - self.gateway.started),
+                "clients": self.gateway.usage.snapshot()
+            })
+        elif self.path == '/v1/models':
+            if not self.authorized():
+                return
+            try:
+                response = self.gateway.upstream().get(f"{self.gateway.base_url}/models",
+                                                       headers=self.gateway.headers())
+            except Exception as e:
+                self.send_error_json(502, f"Upstream error: {e}")
+                return
+            self.send_response(response.status_code)
+            self.send_header('Content-Type', response.headers.get('Content-Type', 'application/json'))
+            self.send_header('Content-Length', str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+        else:
+            self.send_error_json(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        if self.path != '/v1/chat/completions':
+            self.send_error_json(404, f"Unknown path {self.path}")
+            return
+        if not self.authorized():
+            return
+
+        client = self.client_name()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self.send_error_json(400, "Request body is not valid JSON")
+            return
+
+        # Ask upstream for usage so it can be accounted; hidden again if the client did not ask
+        injected_usage = False
+        if request.get('stream'):
+            stream_options = request.setdefault('stream_options', {})
+            if not stream_options.get('include_usage'):
+                stream_options['include_usage'] = True
+                injected_usage = True
+
+        self.streaming = False
+        try:
+            with self.gateway.upstream().stream(
+                'POST', f"{self.gateway.base_url}/chat/completions",
+                headers=self.gateway.headers(), content=json.dumps(request)
+            ) as response:
+                if response.status_code != 200 or not request.get('stream'):
+                    self.relay_body(client, response)
+                else:
+                    self.relay_stream(client, response, injected_usage)
+        except (BrokenPipeError, ConnectionResetError):
+            # The local client went away; closing the upstream response stops generation
+            self.gateway.usage.record(client, aborted=True)
+            self.close_connection = True
+        except Exception as e:
+            self.gateway.usage.record(client, error=True)
+            if self.streaming:
+                # Headers are already out; all that can be done is to end the stream
+                return
+            self.send_error_json(502, f"Upstream error: {e}")
+
+    def relay_body(self, client, response):
+        body = response.read()
+        usage = None
+        if response.status_code == 200:
+            try:
+                usage = json.loads(body).get('usage')
+            except ValueError:
+                pass
+        self.gateway.usage.record(client, usage, error=response.status_code != 200)
+
+        self.send_response(response.status_code)
+        self.send_header('Content-Type', response.headers.get('Content-Type', 'application/json'))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def relay_stream(self, client, response, injected_usage):
+        """Forward SSE events as they arrive, picking the usage out of the last ones"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.streaming = True
+        self.close_connection = True
+
+        usage = None
+        buffer = b""
+        for chunk in response.iter_bytes():
+            buffer += chunk
+            *events, buffer = buffer.split(b"\n\n")
+            out = []
+            for event in events:
+                if b'"usage"' in event and event.startswith(b"data: {"):
+                    try:
+                        data = json.loads(event[6:])
+                    except ValueError:
+                        data = {}
+                    if data.get('usage'):
+                        usage = data['usage']
+                        if injected_usage and not data.get('choices'):
+                            continue
+                out.append(event + b"\n\n")
+            if out:
+                self.wfile.write(b"".join(out))
+                self.wfile.flush()
+        if buffer:
+            self.wfile.write(buffer)
+            self.wfile.flush()
+        self.gateway.usage.record(client, usage)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class GatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of many local clients connecting at once
+    request_queue_size = 128
+
+    def __init__(self, address, gateway, verbose=False):
+        super().__init__(address, GatewayHandler)
+        self.gateway = gateway
+        self.verbose = verbose
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pyroutstr serve",
+        description="Serve an OpenAI-compatible /v1/chat/completions endpoint on localhost",
+        epilog=__doc__.split("\n\n", 2)[2],
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv('GATEWAY_PORT', '8787')))
+    parser.add_argument('--tor', action='store_true', help="route upstream traffic through Tor (localhost:9050)")
+    parser.add_argument('--upstream-connections', type=int, default=100,
+                        help="size of the upstream connection pool (default 100)")
+    parser.add_argument('--api-key', default=os.getenv('ROUTSTR_API_KEY', ''),
+                        help="Routstr API key (default: ROUTSTR_API_KEY)")
+    parser.add_argument('--base-url', default=ROUTSTR_BASE_URL, help="upstream API base URL")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log every request")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("no API key; set ROUTSTR_API_KEY in .env or pass --api-key")
+
+    # Optional allowlist of client bearer tokens
+    client_keys = {key.strip() for key in os.getenv('GATEWAY_CLIENT_KEYS', '').split(',') if key.strip()}
+
+    connection_manager.max_connections = args.upstream_connections
+    connection_manager.max_keepalive = max(connection_manager.max_keepalive, args.upstream_connections)
+    gateway = Gateway(args.api_key, args.tor, args.base_url, client_keys or None)
+    server = GatewayServer((args.host, args.port), gateway, verbose=args.verbose)
+
+    route = " via Tor" if args.tor else ""
+    print(f"Serving http://{args.host}:{args.port}/v1 -> {args.base_url}{route} (usage: /usage, Ctrl+C to stop)",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        connection_manager.close()
+        print(json.dumps(gateway.usage.snapshot(), indent=2), file=sys.stderr)
+    return 0
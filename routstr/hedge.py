@@ -0,0 +1,294 @@
+"""Hedged streaming: race a fallback model when the first token is slow"""
+import asyncio
+import json
+import os
+import queue
+import statistics
+import threading
+import time
+from datetime import datetime
+
+from .config import DATA_DIR
+from .transport import abort_stream
+
+END = object()
+
+class HedgePolicy:
+    """When to hedge, and a log of every hedged request's outcome for tuning
+
+    Hedging is off unless a fallback model is set (HEDGE_FALLBACK_MODEL).
+    Outcomes are appended to `log_path` as JSON lines; the primary models'
+    recent time-to-first-token is kept in memory to estimate time saved.
+    """
+
+    def __init__(self, fallback_model=None, deadline=8.0, log_path=None):
+        self.fallback_model = fallback_model
+        self.deadline = deadline
+        self.log_path = log_path or os.path.join(DATA_DIR, 'hedging.jsonl')
+        self.lock = threading.Lock()
+        self.ttft_history = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            fallback_model=os.getenv('HEDGE_FALLBACK_MODEL') or None,
+            deadline=float(os.getenv('HEDGE_DEADLINE', '8'))
+        )
+
+    def applies(self, model):
+        return bool(self.fallback_model) and self.fallback_model != model
+
+    def load_history(self):
+        self.ttft_history = {}
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self.remember(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+
+    def remember(self, outcome):
+        if outcome['winner'] == outcome['primary'] and outcome['ttft_ms'] is not None:
+            history = self.ttft_history.setdefault(outcome['primary'], [])
+            history.append(outcome['ttft_ms'])
+            del history[:-50]
+
+    def typical_ttft(self, model):
+        """Median time to first token of the model's recent wins, in ms"""
+        with self.lock:
+            if self.ttft_history is None:
+                self.load_history()
+            history = self.ttft_history.get(model)
+        return statistics.median(history) if history else None
+
+    def record(self, outcome):
+        line = json.dumps(outcome) + "\n"
+        with self.lock:
+            if self.ttft_history is None:
+                self.load_history()
+            self.remember(outcome)
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+class HedgedStream:
+    """Chunks of whichever of the primary or fallback model produces content first
+
+    The primary request starts immediately. If no content delta arrives
+    within the policy deadline (or the primary fails first), the same
+    messages are sent to the fallback model; the first stream to produce
+    content is kept and the other is aborted. `model` names the winner and
+    `outcome` holds the recorded result once the race is decided.
+    """
+
+    queue_class = queue.Queue
+
+    def __init__(self, open_stream, model, policy, prompt_tokens=0, catalog=None):
+        self.open_stream = open_stream
+        self.primary = model
+        self.policy = policy
+        self.prompt_tokens = prompt_tokens
+        self.catalog = catalog
+        self.model = model
+        self.outcome = None
+        self.events = self.queue_class()
+        self.streams = {}
+        self.launched = {}
+        self.cancelled = set()
+        self.lock = threading.Lock()
+
+        # Race state
+        self.buffered = {model: [], policy.fallback_model: []}
+        self.errors = {}
+        self.winner = None
+        self.first_content = None
+        self.finished = False
+
+        self.started = time.perf_counter()
+        self.launch(model)
+
+    def launch(self, model):
+        self.launched[model] = time.perf_counter()
+        threading.Thread(target=self.read, args=(model,), daemon=True).start()
+
+    def read(self, model):
+        try:
+            stream = self.open_stream(model)
+            with self.lock:
+                self.streams[model] = stream
+                cancelled = model in self.cancelled
+            if cancelled:
+                abort_stream(stream)
+                return
+            for chunk in stream:
+                self.events.put((model, chunk))
+            self.events.put((model, END))
+        except Exception as e:
+            self.events.put((model, e))
+
+    def cancel(self, model):
+        with self.lock:
+            self.cancelled.add(model)
+            stream = self.streams.get(model)
+        if stream is not None:
+            abort_stream(stream)
+
+    def abort(self):
+        for model in list(self.launched):
+            self.cancel(model)
+        # Wake the consumer even if no request was open yet
+        self.events.put_nowait((None, ConnectionAbortedError("Stream aborted")))
+
+    close = abort
+
+    def race_timeout(self):
+        """Seconds until the fallback is due, or None once it is launched"""
+        if self.policy.fallback_model in self.launched:
+            return None
+        return max(self.started + self.policy.deadline - time.perf_counter(), 0)
+
+    def take(self, model, item):
+        """Account one event of the race; sets `winner` once it is decided"""
+        if model is None:
+            raise item
+        if isinstance(item, Exception):
+            self.errors[model] = item
+            if self.policy.fallback_model not in self.launched:
+                self.launch(self.policy.fallback_model)
+            elif len(self.errors) == len(self.launched):
+                self.record(None, None, self.errors)
+                raise self.errors[self.primary]
+        elif item is END:
+            # Finished without any content; nothing left to race for
+            self.winner, self.finished = model, True
+        else:
+            self.buffered[model].append(item)
+            if item.choices and item.choices[0].delta.content:
+                self.winner, self.first_content = model, time.perf_counter()
+
+    def settle(self):
+        """Cancel the loser, record the outcome and return the winner's buffered chunks"""
+        for model in self.launched:
+            if model != self.winner:
+                self.cancel(model)
+        self.model = self.winner
+        self.record(self.winner, self.first_content, self.errors)
+        return self.buffered[self.winner]
+
+    def winner_chunk(self, model, item):
+        """The winner's next chunk, or None to skip the event; sets `finished` at its end"""
+        if model is None or (model == self.winner and isinstance(item, Exception)):
+            raise item
+        if model != self.winner:
+            return None
+        if item is END:
+            self.finished = True
+            return None
+        return item
+
+    def __iter__(self):
+        while self.winner is None:
+            try:
+                model, item = self.events.get(timeout=self.race_timeout())
+            except queue.Empty:
+                self.launch(self.policy.fallback_model)
+                continue
+            self.take(model, item)
+
+        yield from self.settle()
+        while not self.finished:
+            chunk = self.winner_chunk(*self.events.get())
+            if chunk is not None:
+                yield chunk
+
+    def record(self, winner, first_content, errors):
+        fallback = self.policy.fallback_model
+        hedged = fallback in self.launched
+        ttft_ms = (first_content - self.started) * 1000 if first_content else None
+
+        # Time saved is estimated from the primary's typical time to first token
+        time_saved_ms = None
+        if winner == fallback and ttft_ms is not None:
+            typical = self.policy.typical_ttft(self.primary)
+            if typical is not None:
+                time_saved_ms = round(max(typical - ttft_ms, 0.0), 1)
+        elif winner == self.primary and hedged:
+            time_saved_ms = 0.0
+
+        # A losing request that did not fail is billed at least for its prompt
+        extra_cost = None
+        loser = next((model for model in self.launched if model != winner and model not in errors), None)
+        model_info = self.catalog.get(loser) if loser and self.catalog else None
+        if model_info and model_info['prompt_price'] is not None:
+            extra_cost = round(self.prompt_tokens * model_info['prompt_price'], 3)
+
+        self.outcome = {
+            'timestamp': datetime.now().isoformat(),
+            'primary': self.primary,
+            'fallback': fallback,
+            'deadline_s': self.policy.deadline,
+            'hedged': hedged,
+            'winner': winner,
+            'ttft_ms': round(ttft_ms, 1) if ttft_ms is not None else None,
+            'time_saved_ms': time_saved_ms,
+            'extra_prompt_tokens': self.prompt_tokens if loser else 0,
+            'extra_cost_sats': extra_cost if loser else 0
+        }
+        self.policy.record(self.outcome)
+
+class AsyncHedgedStream(HedgedStream):
+    """HedgedStream racing as tasks on the network engine's event loop
+
+    `open_stream(model)` is a coroutine returning an async stream; iterate
+    with ``async for``.
+    """
+
+    queue_class = asyncio.Queue
+
+    def __init__(self, *args, **kwargs):
+        self.tasks = {}
+        super().__init__(*args, **kwargs)
+
+    def launch(self, model):
+        self.launched[model] = time.perf_counter()
+        self.tasks[model] = asyncio.ensure_future(self.read(model))
+
+    async def read(self, model):
+        stream = None
+        try:
+            stream = await self.open_stream(model)
+            async for chunk in stream:
+                self.events.put_nowait((model, chunk))
+            self.events.put_nowait((model, END))
+        except Exception as e:
+            self.events.put_nowait((model, e))
+        finally:
+            if stream is not None:
+                await stream.close()
+
+    def cancel(self, model):
+        self.tasks[model].cancel()
+
+    async def close(self):
+        self.abort()
+
+    async def __aiter__(self):
+        while self.winner is None:
+            try:
+                model, item = await asyncio.wait_for(self.events.get(), self.race_timeout())
+            except asyncio.TimeoutError:
+                self.launch(self.policy.fallback_model)
+                continue
+            self.take(model, item)
+
+        for chunk in self.settle():
+            yield chunk
+        while not self.finished:
+            chunk = self.winner_chunk(*await self.events.get())
+            if chunk is not None:
+                yield chunk
+
+# Shared by every conversation in the process
+hedge_policy = HedgePolicy.from_env()
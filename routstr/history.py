@@ -0,0 +1,470 @@
+"""Conversation persistence: crash-safe journal, saved JSON exports and the SQLite store"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from .config import DATA_DIR
+
+class ConversationJournal:
+    """Append-only JSONL log of a conversation that can be replayed after a crash
+
+    Records: start, message, reply_start, delta (one per rendered batch),
+    reply_end, reply_abort, pop and close. Every record is flushed to the
+    OS immediately; fsync happens on message boundaries and at most every
+    `fsync_interval` seconds while a reply is streaming.
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.last_sync = time.monotonic()
+        self.terminate_torn_line(self.file)
+
+    @staticmethod
+    def terminate_torn_line(f):
+        """Start a fresh line if a crash left a partial record at the end"""
+        if f.tell() > 0:
+            with open(f.name, 'rb') as check:
+                check.seek(-1, os.SEEK_END)
+                if check.read(1) != b'\n':
+                    f.write('\n')
+                    f.flush()
+
+    @staticmethod
+    def directory():
+        return os.path.join(DATA_DIR, 'journal')
+
+    @classmethod
+    def create(cls, model, used_tor):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        path = os.path.join(cls.directory(), f"chat_{model.replace('/', '_')}_{timestamp}.jsonl")
+        journal = cls(path, fsync_interval=float(os.getenv('JOURNAL_FSYNC_INTERVAL', '1.0')))
+        journal.write({
+            'type': 'start',
+            'model': model,
+            'used_tor': used_tor,
+            'timestamp': datetime.now().isoformat()
+        }, sync=True)
+        return journal
+
+    def write(self, record, sync=False):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line)
+            self.file.flush()
+            now = time.monotonic()
+            if sync or now - self.last_sync >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.last_sync = now
+
+    def message(self, message):
+        self.write({'type': 'message', 'role': message['role'], 'content': message['content']}, sync=True)
+
+    def messages(self, messages):
+        """Append many messages with a single write and fsync"""
+        lines = "".join(
+            json.dumps({'type': 'message', 'role': m['role'], 'content': m['content']}, ensure_ascii=False) + '\n'
+            for m in messages
+        )
+        with self.lock:
+            self.file.write(lines)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.last_sync = time.monotonic()
+
+    def pop(self):
+        self.write({'type': 'pop'}, sync=True)
+
+    def reply_start(self):
+        self.write({'type': 'reply_start'})
+
+    def delta(self, text):
+        self.write({'type': 'delta', 'text': text})
+
+    def reply_end(self, tokens, total_tokens, truncated=False):
+        record = {'type': 'reply_end', 'tokens': tokens, 'total_tokens': total_tokens}
+        if truncated:
+            record['truncated'] = True
+        self.write(record, sync=True)
+
+    def reply_abort(self):
+        self.write({'type': 'reply_abort'}, sync=True)
+
+    def close(self):
+        self.write({'type': 'close'}, sync=True)
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    @staticmethod
+    def replay(path):
+        """Rebuild the conversation state recorded in a journal file
+
+        A reply that was still streaming when the log ends (or when the next
+        message starts) is kept as an assistant message marked truncated.
+        """
+        state = {
+            'path': path,
+            'model': None,
+            'used_tor': False,
+            'timestamp': None,
+            'messages': [],
+            'total_tokens': 0,
+            'closed': False
+        }
+        reply = None
+
+        def commit_partial():
+            if reply:
+                state['messages'].append({'role': 'assistant', 'content': "".join(reply), 'truncated': True})
+
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write left by a crash
+                    continue
+
+                kind = record.get('type')
+                if kind == 'start':
+                    state['model'] = record.get('model')
+                    state['used_tor'] = record.get('used_tor', False)
+                    state['timestamp'] = record.get('timestamp')
+                elif kind == 'message':
+                    commit_partial()
+                    reply = None
+                    state['messages'].append({'role': record['role'], 'content': record['content']})
+                elif kind == 'reply_start':
+                    commit_partial()
+                    reply = []
+                elif kind == 'delta' and reply is not None:
+                    reply.append(record['text'])
+                elif kind == 'reply_end' and reply is not None:
+                    message = {'role': 'assistant', 'content': "".join(reply)}
+                    if record.get('truncated'):
+                        message['truncated'] = True
+                    state['messages'].append(message)
+                    state['total_tokens'] = record.get('total_tokens', state['total_tokens'])
+                    reply = None
+                elif kind == 'reply_abort':
+                    reply = None
+                elif kind == 'pop' and state['messages']:
+                    state['messages'].pop()
+                elif kind == 'close':
+                    state['closed'] = True
+
+        commit_partial()
+        return state
+
+    @staticmethod
+    def is_closed(path):
+        """Check the last record without reading the whole journal"""
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 4096, 0))
+            lines = f.read().splitlines()
+        return bool(lines) and lines[-1].strip() == b'{"type": "close"}'
+
+    @classmethod
+    def find_unfinished(cls):
+        """Journals that were never closed and hold at least one user message, newest first"""
+        try:
+            paths = [os.path.join(cls.directory(), name) for name in os.listdir(cls.directory())
+                     if name.endswith('.jsonl')]
+        except OSError:
+            return []
+
+        unfinished = []
+        for path in sorted(paths, key=os.path.getmtime, reverse=True):
+            try:
+                if cls.is_closed(path):
+                    continue
+                state = cls.replay(path)
+            except OSError:
+                continue
+            if any(m['role'] == 'user' for m in state['messages']):
+                unfinished.append(state)
+            else:
+                # Nothing worth restoring
+                cls.mark_closed(path)
+        return unfinished
+
+    @classmethod
+    def mark_closed(cls, path):
+        with open(path, 'a', encoding='utf-8') as f:
+            cls.terminate_torn_line(f)
+            f.write(json.dumps({'type': 'close'}) + '\n')
+
+class SavedConversationReader:
+    """Incremental parser for the JSON written by Save Conversation
+
+    Top-level fields other than "messages" are collected in `meta`; the
+    messages array is yielded in batches so large files are never held in
+    memory as a whole document.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.meta = {}
+        self.decoder = json.JSONDecoder()
+        self.file = None
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def fill(self):
+        # Read at least as much as is buffered so long values are rescanned a bounded number of times
+        chunk = self.file.read(max(self.CHUNK_SIZE, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.bytes_read += len(chunk)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.buf):
+            raise ValueError("Unexpected end of file")
+        return self.buf[self.pos]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} near offset {self.bytes_read - len(self.buf) + self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number can continue in the next chunk
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def batches(self):
+        with open(self.path, encoding='utf-8') as self.file:
+            self.expect('{')
+            if self.peek() == '}':
+                return
+            while True:
+                key = self.value()
+                self.expect(':')
+                if key == 'messages':
+                    yield from self.message_batches()
+                else:
+                    self.meta[key] = self.value()
+                if self.peek() == ',':
+                    self.pos += 1
+                    continue
+                self.expect('}')
+                return
+
+    def message_batches(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        batch = []
+        while True:
+            batch.append(self.value())
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            break
+        if batch:
+            yield batch
+
+class ConversationStore:
+    """SQLite database of all conversations with an FTS5 index over message text"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY,
+            model TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            total_tokens INTEGER NOT NULL DEFAULT 0,
+            used_tor INTEGER NOT NULL DEFAULT 0,
+            source TEXT UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages(conversation_id, position);
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, content='messages', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END;
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, 'conversations.db')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(self.SCHEMA)
+
+    def create_conversation(self, model, used_tor, source=None, started_at=None):
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                "INSERT INTO conversations (model, started_at, used_tor, source) VALUES (?, ?, ?, ?)",
+                (model, started_at or datetime.now().isoformat(), int(bool(used_tor)), source)
+            )
+            return cursor.lastrowid
+
+    def find_by_source(self, source):
+        with self.lock:
+            row = self.db.execute("SELECT id FROM conversations WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def add_message(self, conversation_id, role, content, tokens=None):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO messages (conversation_id, position, role, content, tokens, created_at) "
+                "VALUES (?, (SELECT COUNT(*) FROM messages WHERE conversation_id = ?), ?, ?, ?, ?)",
+                (conversation_id, conversation_id, role, content, tokens, datetime.now().isoformat())
+            )
+
+    def add_messages(self, conversation_id, messages):
+        now = datetime.now().isoformat()
+        with self.lock, self.db:
+            offset = self.db.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+            self.db.executemany(
+                "INSERT INTO messages (conversation_id, position, role, content, tokens, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(conversation_id, offset + i, m['role'], m['content'], m.get('tokens'), now)
+                 for i, m in enumerate(messages)]
+            )
+
+    def delete_last_message(self, conversation_id):
+        with self.lock, self.db:
+            self.db.execute(
+                "DELETE FROM messages WHERE id = (SELECT MAX(id) FROM messages WHERE conversation_id = ?)",
+                (conversation_id,)
+            )
+
+    def set_total_tokens(self, conversation_id, total_tokens):
+        with self.lock, self.db:
+            self.db.execute("UPDATE conversations SET total_tokens = ? WHERE id = ?", (total_tokens, conversation_id))
+
+    def messages(self, conversation_id):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY position",
+                (conversation_id,)
+            ).fetchall()
+        return [{'role': role, 'content': content} for role, content in rows]
+
+    def search(self, query, limit=200):
+        """Full-text search; every word must match, the last one as a prefix
+
+        Returns dicts with message_id, conversation_id, model, started_at, role, snippet.
+        """
+        words = query.split()
+        if not words:
+            return []
+        terms = ['"' + word.replace('"', '""') + '"' for word in words]
+        terms[-1] += '*'
+
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT m.id, m.conversation_id, c.model, c.started_at, m.role, "
+                "snippet(messages_fts, 0, '[', ']', '…', 16) "
+                "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+                (" ".join(terms), limit)
+            ).fetchall()
+        keys = ('message_id', 'conversation_id', 'model', 'started_at', 'role', 'snippet')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def import_files(self, paths):
+        """Bulk import saved JSON exports and journals; returns the number imported
+
+        Files already in the store (by path) are skipped.
+        """
+        imported = 0
+        for path in paths:
+            source = os.path.abspath(path)
+            if self.find_by_source(source) is not None:
+                continue
+            try:
+                if path.endswith('.jsonl'):
+                    data = ConversationJournal.replay(path)
+                else:
+                    with open(path, encoding='utf-8') as f:
+                        data = json.load(f)
+                messages = [m for m in data.get('messages', []) if m.get('content') is not None]
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Warning: skipping {path}: {e}")
+                continue
+
+            started_at = data.get('timestamp') or datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            with self.lock, self.db:
+                cursor = self.db.execute(
+                    "INSERT INTO conversations (model, started_at, total_tokens, used_tor, source) VALUES (?, ?, ?, ?, ?)",
+                    (data.get('model') or 'unknown', started_at, data.get('total_tokens', 0),
+                     int(bool(data.get('used_tor'))), source)
+                )
+                conversation_id = cursor.lastrowid
+                self.db.executemany(
+                    "INSERT INTO messages (conversation_id, position, role, content, tokens, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(conversation_id, position, m['role'], m['content'], m.get('tokens'), started_at)
+                     for position, m in enumerate(messages)]
+                )
+            imported += 1
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.db.close()
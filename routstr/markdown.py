@@ -0,0 +1,185 @@
+"""Incremental Markdown for streamed replies, as text/tag segments for a Tk Text widget
+
+Only the current line is ever reparsed. feed() returns operations for
+the display:
+
+    ('append', text, tags)   show the text now, styled only by its block
+                             (e.g. inside a code fence)
+    ('replace', segments)    the current line is complete: replace it with
+                             fully styled segments and start a new line
+
+so the cost per delta is its own length plus one pass over each line as
+it ends, however long the reply grows. render() styles a whole text the
+same way, for replies drawn from history. Markers (#, **, `, fences) are
+kept and dimmed rather than removed, so the shown text is the reply.
+"""
+import re
+
+FENCE = re.compile(r' {0,3}(`{3,}|~{3,})\s*([\w+#.-]*)')
+HEADING = re.compile(r'(#{1,6})[ \t]+')
+RULE = re.compile(r' {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+QUOTE = re.compile(r'(?:[ \t]*>)+[ \t]?')
+BULLET = re.compile(r'[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]+')
+
+CODE_SPAN = re.compile(r'(`+)(.+?)\1')
+LINK = re.compile(r'\[([^\]\n]+)\]\(([^)\s]+)\)')
+BOLD = re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1')
+ITALIC = re.compile(r'(?<![\w*])(\*|_)(?=[^\s*_])(.+?)(?<=[^\s*_])\1(?![\w*])')
+
+KEYWORDS = frozenset("""
+    and as assert async await break case catch class const continue def default defer del do elif else enum
+    except export extends false fn for from func function go if impl import in interface is lambda let loop
+    match mod mut new nil none not null or package pass pub raise return select self static struct super
+    switch this throw trait true try type typeof use var void where while with yield
+""".split())
+HASH_COMMENTS = frozenset(('python', 'py', 'sh', 'bash', 'shell', 'zsh', 'console', 'ruby', 'rb', 'yaml', 'yml',
+                           'toml', 'perl', 'r', 'dockerfile', 'makefile', 'ini', 'conf', 'nix'))
+DASH_COMMENTS = frozenset(('sql', 'lua', 'haskell', 'hs', 'elm'))
+CODE_TOKENS = {}
+
+def code_pattern(language):
+    """Token pattern with the comment syntax of a fence's language (C-style unless known)"""
+    if language in HASH_COMMENTS:
+        comment = r'#.*'
+    elif language in DASH_COMMENTS:
+        comment = r'--.*'
+    elif not language:
+        comment = r'//.*|#.*'
+    else:
+        comment = r'//.*'
+    if comment not in CODE_TOKENS:
+        CODE_TOKENS[comment] = re.compile(
+            rf'(?P<comment>{comment})'
+            r'|(?P<string>"(?:\\.|[^"\\])*"?|\'(?:\\.|[^\'\\])*\'?|`[^`]*`?)'
+            r'|(?P<number>\b\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?\b|\b0[xX][0-9a-fA-F]+\b)'
+            r'|(?P<word>\b[A-Za-z_]\w*\b)'
+        )
+    return CODE_TOKENS[comment]
+
+def inline_spans(line, start=0):
+    """(start, end, tag) spans for code, links and emphasis in line[start:]"""
+    spans = []
+    text = " " * start + line[start:]
+    for pattern, tag in ((CODE_SPAN, 'md_code_inline'), (LINK, 'md_link'), (BOLD, 'md_bold'), (ITALIC, 'md_italic')):
+        # Handled ranges are blanked so later patterns cannot match inside them
+        chars = None
+        for m in pattern.finditer(text):
+            group = 1 if pattern is LINK else 2
+            spans += [(m.start(), m.start(group), 'md_marker'), (m.start(group), m.end(group), tag),
+                      (m.end(group), m.end(), 'md_marker')]
+            chars = chars or list(text)
+            if pattern in (BOLD, ITALIC):
+                # Keep the inner text so italics inside bold still match
+                chars[m.start():m.start(group)] = " " * (m.start(group) - m.start())
+                chars[m.end(group):m.end()] = " " * (m.end() - m.end(group))
+            else:
+                chars[m.start():m.end()] = " " * (m.end() - m.start())
+        if chars:
+            text = "".join(chars)
+    return spans
+
+def code_spans(line, language):
+    """Simple syntax highlighting: comments, strings, numbers and keywords"""
+    spans = []
+    for m in code_pattern(language).finditer(line):
+        kind = m.lastgroup
+        if kind == 'word':
+            word = m.group()
+            if word in KEYWORDS or (language == 'sql' and word.lower() in KEYWORDS):
+                spans.append((m.start(), m.end(), 'md_keyword'))
+        else:
+            spans.append((m.start(), m.end(), f'md_{kind}'))
+    return spans
+
+def segments(line, ending, block_tags, spans):
+    """Split a line into [text, tags, ...] where the set of tags changes"""
+    text = line + ending
+    starts, ends = {}, {}
+    for start, end, tag in spans:
+        if start < end:
+            starts.setdefault(start, []).append(tag)
+            ends.setdefault(end, []).append(tag)
+    cuts = sorted({0, len(text), *starts, *ends})
+    active = {}
+    result = []
+    for start, end in zip(cuts, cuts[1:]):
+        for tag in ends.get(start, ()):
+            active[tag] -= 1
+        for tag in starts.get(start, ()):
+            active[tag] = active.get(tag, 0) + 1
+        result += [text[start:end], block_tags + tuple(tag for tag, count in active.items() if count)]
+    return result
+
+class MarkdownStream:
+    """Tokenizer state carried between deltas: the open code fence and the current line"""
+
+    def __init__(self):
+        self.fence = None
+        self.language = ''
+        self.line = []
+
+    def block_tags(self):
+        return ('md_code',) if self.fence else ()
+
+    def feed(self, text):
+        ops = []
+        start = 0
+        while start < len(text):
+            newline = text.find('\n', start)
+            end = len(text) if newline < 0 else newline + 1
+            ops.append(('append', text[start:end], self.block_tags()))
+            if newline < 0:
+                self.line.append(text[start:])
+            else:
+                self.line.append(text[start:newline])
+                ops.append(('replace', self.end_line("\n")))
+            start = end
+        return ops
+
+    def finish(self):
+        """Style the last line of a finished (or stopped) reply"""
+        if not self.line:
+            return []
+        return [('replace', self.end_line(""))]
+
+    def end_line(self, ending):
+        line = "".join(self.line)
+        self.line = []
+
+        fence = FENCE.match(line)
+        if self.fence:
+            if fence and fence.group(1)[0] == self.fence[0] and len(fence.group(1)) >= len(self.fence) \
+                    and not fence.group(2) and not line[fence.end():].strip():
+                self.fence = None
+                return segments(line, ending, ('md_code',), [(0, len(line), 'md_marker')])
+            return segments(line, ending, ('md_code',), code_spans(line, self.language))
+        if fence:
+            self.fence, self.language = fence.group(1), fence.group(2).lower()
+            return segments(line, ending, ('md_code',), [(0, len(line), 'md_marker')])
+        return segments(line, ending, (), self.line_spans(line))
+
+    @staticmethod
+    def line_spans(line):
+        if RULE.match(line):
+            return [(0, len(line), 'md_marker')]
+        heading = HEADING.match(line)
+        if heading:
+            level = min(len(heading.group(1)), 3)
+            return [(0, len(line), f'md_h{level}'), (0, heading.end(), 'md_marker')] + \
+                inline_spans(line, heading.end())
+        quote = QUOTE.match(line)
+        if quote:
+            return [(0, len(line), 'md_quote'), (0, quote.end(), 'md_marker')] + inline_spans(line, quote.end())
+        bullet = BULLET.match(line)
+        if bullet:
+            return [(0, bullet.end(), 'md_bullet')] + inline_spans(line, bullet.end())
+        return inline_spans(line)
+
+def render(text):
+    """Styled [text, tags, ...] segments for a whole reply, as streaming would end up"""
+    stream = MarkdownStream()
+    result = []
+    for op in stream.feed(text) + stream.finish():
+        if op[0] == 'replace':
+            result += op[1]
+    return result
@@ -0,0 +1,252 @@
+"""Local stand-in for the Routstr API, for benchmarks and offline development
+
+    python -m routstr mock [--port 8790] [--tokens-per-second 50] [--stall-every 0]
+
+Point any client at it with ROUTSTR_BASE_URL=http://127.0.0.1:8790/v1 (or
+--base-url for batch and serve). It serves /v1/chat/completions (streamed as SSE at the
+configured token rate, with optional jitter and stalls), /v1/models,
+/v1/wallet/info and /v1/wallet/topup. The model mock/fast skips every
+delay, to measure client-side cost alone. Any bearer key works; each key
+starts with --balance msats and pays --price sats per token. A cashu token
+("cashu...") used as the key gets an sk-mock-... API key, as on the
+real service. Replies are deterministic for a given --seed.
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .tokens import estimate_tokens
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog while lightning payments settle instantly "
+    "and cashu tokens stay private behind tor circuits across independent providers"
+).split()
+
+class MockSettings:
+    """Shape of the simulated stream"""
+
+    def __init__(self, ttft_ms=300.0, tokens_per_second=50.0, jitter=0.0, stall_every=0, stall_ms=2000.0,
+                 reply_tokens=200, balance=1_000_000, price=0.001, token_value=100_000, seed=0):
+        self.ttft = ttft_ms / 1000
+        self.interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.jitter = jitter
+        self.stall_every = stall_every
+        self.stall = stall_ms / 1000
+        self.reply_tokens = reply_tokens
+        self.balance = balance
+        self.price = price
+        self.token_value = token_value
+        self.seed = seed
+
+class MockRoutstr:
+    """Balances per key and request counters shared by the handler threads"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.balances = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def balance(self, key):
+        with self.lock:
+            return self.balances.setdefault(key, self.settings.balance)
+
+    def charge(self, key, tokens):
+        with self.lock:
+            self.balances[key] = self.balances.setdefault(key, self.settings.balance) - tokens * self.settings.price * 1000
+
+    def top_up(self, key, amount):
+        with self.lock:
+            self.balances[key] = self.balances.setdefault(key, self.settings.balance) + amount
+
+    def next_random(self):
+        with self.lock:
+            self.requests += 1
+            return random.Random(self.settings.seed * 1_000_003 + self.requests)
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'routstr-mock'
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def api_key(self):
+        auth = self.headers.get('Authorization', '')
+        key = auth[7:].strip() if auth.lower().startswith('bearer ') else ''
+        if key.startswith('cashu'):
+            # A token spent as a key becomes an API key holding its value
+            api_key = 'sk-mock-' + hashlib.sha256(key.encode()).hexdigest()[:24]
+            if api_key not in self.mock.balances:
+                self.mock.top_up(api_key, self.mock.settings.token_value - self.mock.settings.balance)
+            return api_key
+        return key
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": {"message": message, "type": "mock_error"}})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/v1/models':
+            self.send_json(200, {"data": [
+                {"id": model, "name": model, "context_length": 128000,
+                 "sats_pricing": {"prompt": self.mock.settings.price, "completion": self.mock.settings.price}}
+                for model in ('mock/fast', 'mock/model')
+            ]})
+        elif path == '/v1/wallet/info':
+            key = self.api_key()
+            if not key:
+                self.send_error_json(401, "Missing API key")
+                return
+            self.send_json(200, {"api_key": key, "balance": round(self.mock.balance(key))})
+        else:
+            self.send_error_json(404, f"Unknown path {path}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/v1/wallet/topup':
+            token = parse_qs(url.query).get('cashu_token', [''])[0]
+            if not token.startswith('cashu'):
+                self.send_error_json(400, "Invalid cashu token")
+                return
+            self.mock.top_up(self.api_key(), self.mock.settings.token_value)
+            self.send_json(200, {"msats": self.mock.settings.token_value})
+        elif url.path == '/v1/chat/completions':
+            try:
+                request = json.loads(body)
+                messages = request['messages']
+            except (ValueError, KeyError, TypeError):
+                self.send_error_json(400, "Request needs a JSON body with messages")
+                return
+            self.complete(request, messages)
+        else:
+            self.send_error_json(404, f"Unknown path {url.path}")
+
+    def complete(self, request, messages):
+        key = self.api_key()
+        if not key:
+            self.send_error_json(401, "Missing API key")
+            return
+        if self.mock.balance(key) <= 0:
+            self.send_error_json(402, "Insufficient balance")
+            return
+
+        settings = self.mock.settings
+        rng = self.mock.next_random()
+        model = request.get('model', 'mock/model')
+        count = min(settings.reply_tokens, request.get('max_tokens') or settings.reply_tokens)
+        words = [(" " if i else "") + rng.choice(WORDS) for i in range(count)]
+        prompt_tokens = sum(estimate_tokens(str(m.get('content', ''))) + 4 for m in messages)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": count, "total_tokens": prompt_tokens + count}
+        self.mock.charge(key, usage['total_tokens'])
+
+        ttft, interval, stall = settings.ttft, settings.interval, settings.stall_every
+        if model == 'mock/fast':
+            ttft = interval = stall = 0
+
+        if not request.get('stream'):
+            time.sleep(ttft + interval * count)
+            self.send_json(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(choices, extra=None):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": choices, **(extra or {})}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        try:
+            time.sleep(ttft)
+            for i, word in enumerate(words):
+                if i and interval:
+                    delay = interval * (1 + rng.uniform(-settings.jitter, settings.jitter))
+                    if stall and i % stall == 0:
+                        delay += settings.stall
+                    time.sleep(max(delay, 0))
+                event([{"index": 0, "delta": {"content": word}, "finish_reason": None}])
+            event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (request.get('stream_options') or {}).get('include_usage'):
+                event([], {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away (Stop button, cancelled hedge)
+            pass
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, mock, verbose=False):
+        super().__init__(address, MockHandler)
+        self.mock = mock
+        self.verbose = verbose
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pyroutstr mock",
+        description="Serve a local mock of the Routstr API",
+        epilog=__doc__.split("\n\n", 2)[2],
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8790, help="0 picks a free port")
+    parser.add_argument('--ttft-ms', type=float, default=300, help="delay before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=50, help="0 streams as fast as possible")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random +/- fraction of each token interval")
+    parser.add_argument('--stall-every', type=int, default=0, help="pause every N tokens (0: never)")
+    parser.add_argument('--stall-ms', type=float, default=2000, help="length of each pause")
+    parser.add_argument('--reply-tokens', type=int, default=200, help="tokens per reply (capped by max_tokens)")
+    parser.add_argument('--balance', type=float, default=1_000_000, help="starting msats of every key")
+    parser.add_argument('--price', type=float, default=0.001, help="sats per token")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-v', '--verbose', action='store_true', help="log every request")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(
+        ttft_ms=args.ttft_ms, tokens_per_second=args.tokens_per_second, jitter=args.jitter,
+        stall_every=args.stall_every, stall_ms=args.stall_ms, reply_tokens=args.reply_tokens,
+        balance=args.balance, price=args.price, seed=args.seed
+    )
+    server = MockServer((args.host, args.port), MockRoutstr(settings), verbose=args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Mock Routstr API on http://{host}:{port}/v1 (Ctrl+C to stop)", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
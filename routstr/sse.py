@@ -0,0 +1,117 @@
+"""Lean decoder for chat completion streams: SSE frames straight to (content, total_tokens)
+
+The SDK builds and validates a full ChatCompletionChunk model for every
+token. Front ends only need the content delta and the final usage, so
+this path reads the event stream with plain httpx and json.loads. Any
+answer other than a 200 event stream is left to the SDK (open_* return
+None), which keeps its retries and typed errors.
+"""
+import json
+
+DONE = object()
+
+class StreamError(Exception):
+    """An error event inside an otherwise successful stream"""
+
+def decode_event(data):
+    """(content, total_tokens) of one event's data, or DONE"""
+    if data.startswith('[DONE]'):
+        return DONE
+    chunk = json.loads(data)
+    if chunk.get('error'):
+        error = chunk['error']
+        message = error.get('message') if isinstance(error, dict) else None
+        raise StreamError(message or "An error occurred during streaming")
+    choices = chunk.get('choices')
+    content = (choices[0].get('delta') or {}).get('content') if choices else None
+    usage = chunk.get('usage')
+    return content, usage.get('total_tokens') if usage else None
+
+class EventDecoder:
+    """Assembles SSE lines into events (data lines joined, dispatched on a blank line)"""
+
+    def __init__(self):
+        self.data = []
+
+    def feed(self, line):
+        """The decoded event completed by `line`, or None"""
+        if line.startswith('data:'):
+            self.data.append(line[6:] if line.startswith('data: ') else line[5:])
+            return None
+        if line or not self.data:
+            # event:, id:, retry: and comment lines carry nothing we use
+            return None
+        data = "\n".join(self.data)
+        self.data = []
+        return decode_event(data)
+
+def request_body(model, messages):
+    return {"model": model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}}
+
+def request_headers(api_key):
+    return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json", "Accept": "text/event-stream"}
+
+def is_event_stream(response):
+    return response.status_code == 200 and response.headers.get('content-type', '').startswith('text/event-stream')
+
+class RawStream:
+    """Iterates (content, total_tokens) pairs like iter_stream(); `response` allows abort_stream()"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def __iter__(self):
+        decoder = EventDecoder()
+        try:
+            for line in self.response.iter_lines():
+                event = decoder.feed(line)
+                if event is DONE:
+                    break
+                if event is not None:
+                    yield event
+        finally:
+            self.response.close()
+
+    def close(self):
+        self.response.close()
+
+class AsyncRawStream:
+    """RawStream for the network engine"""
+
+    def __init__(self, response):
+        self.response = response
+
+    async def __aiter__(self):
+        decoder = EventDecoder()
+        try:
+            async for line in self.response.aiter_lines():
+                event = decoder.feed(line)
+                if event is DONE:
+                    break
+                if event is not None:
+                    yield event
+        finally:
+            await self.response.aclose()
+
+    async def close(self):
+        await self.response.aclose()
+
+def open_raw_stream(client, base_url, api_key, model, messages):
+    """Start a streaming completion on an httpx.Client; None if the SDK should handle the answer"""
+    request = client.build_request('POST', f"{base_url}/chat/completions",
+                                   headers=request_headers(api_key), json=request_body(model, messages))
+    response = client.send(request, stream=True)
+    if not is_event_stream(response):
+        response.close()
+        return None
+    return RawStream(response)
+
+async def open_raw_stream_async(client, base_url, api_key, model, messages):
+    """open_raw_stream() on an httpx.AsyncClient"""
+    request = client.build_request('POST', f"{base_url}/chat/completions",
+                                   headers=request_headers(api_key), json=request_body(model, messages))
+    response = await client.send(request, stream=True)
+    if not is_event_stream(response):
+        await response.aclose()
+        return None
+    return AsyncRawStream(response)
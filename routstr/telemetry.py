@@ -0,0 +1,200 @@
+"""Per-request streaming latency: time to first token, gaps between chunks, throughput"""
+import csv
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .tokens import token_counter
+
+FIELDS = ('timestamp', 'model', 'route', 'outcome', 'ttft_ms', 'total_ms', 'chunks', 'completion_tokens',
+          'tokens_per_second', 'max_gap_ms', 'stalls')
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..100) of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+class RequestTimer:
+    """Timestamps of one streaming request; use as a context manager around the streaming loop
+
+    Call delta(text) for every content chunk as it arrives. On exit the
+    request is recorded with outcome 'ok' (or `outcome` if set, e.g.
+    'cached'), 'stopped' when cancelled or interrupted, or 'error'.
+    """
+
+    def __init__(self, telemetry, model, use_tor):
+        self.telemetry = telemetry
+        self.model = model
+        self.route = 'tor' if use_tor else 'clearnet'
+        self.outcome = 'ok'
+        self.parts = []
+        self.started = None
+        self.first = None
+        self.last = None
+        self.max_gap = 0.0
+        self.stalls = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def delta(self, text):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        else:
+            gap = now - self.last
+            self.max_gap = max(self.max_gap, gap)
+            if gap >= self.telemetry.stall_threshold:
+                self.stalls += 1
+        self.last = now
+        self.parts.append(text)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # CancelledError and KeyboardInterrupt are not Exceptions
+            self.outcome = 'error' if issubclass(exc_type, Exception) else 'stopped'
+        self.telemetry.record(self.result(time.perf_counter()))
+        return False
+
+    def result(self, finished):
+        completion_tokens = token_counter.count("".join(self.parts)) if self.parts else 0
+        generating = self.last - self.first if self.first is not None else 0
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'model': self.model,
+            'route': self.route,
+            'outcome': self.outcome,
+            'ttft_ms': round((self.first - self.started) * 1000, 1) if self.first is not None else None,
+            'total_ms': round((finished - self.started) * 1000, 1),
+            'chunks': len(self.parts),
+            'completion_tokens': completion_tokens,
+            'tokens_per_second': round(completion_tokens / generating, 1) if generating > 0 else None,
+            'max_gap_ms': round(self.max_gap * 1000, 1),
+            'stalls': self.stalls
+        }
+
+class LatencyTelemetry:
+    """Ring buffer of the last `capacity` requests with rolling percentiles and exports
+
+    Set `csv_path` to also append every request to a CSV file, and
+    `prometheus_path` to rewrite a Prometheus text file (for node_exporter's
+    textfile collector) after every request, so performance can be tracked
+    over weeks.
+    """
+
+    def __init__(self, capacity=1000, stall_threshold=2.0, csv_path=None, prometheus_path=None):
+        self.records = deque(maxlen=capacity)
+        self.stall_threshold = stall_threshold
+        self.csv_path = csv_path
+        self.prometheus_path = prometheus_path
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            capacity=int(os.getenv('TELEMETRY_CAPACITY', '1000')),
+            stall_threshold=float(os.getenv('TELEMETRY_STALL_MS', '2000')) / 1000,
+            csv_path=os.getenv('TELEMETRY_CSV') or None,
+            prometheus_path=os.getenv('TELEMETRY_PROMETHEUS') or None
+        )
+
+    def request(self, model, use_tor=False):
+        return RequestTimer(self, model, use_tor)
+
+    def record(self, result):
+        with self.lock:
+            self.records.append(result)
+        try:
+            if self.csv_path:
+                self.append_csv(self.csv_path, result)
+            if self.prometheus_path:
+                self.export_prometheus(self.prometheus_path)
+        except OSError as e:
+            print(f"Warning: could not write latency telemetry: {e}")
+
+    def snapshot(self, model=None, route=None):
+        with self.lock:
+            return [r for r in self.records
+                    if (model is None or r['model'] == model) and (route is None or r['route'] == route)]
+
+    def summary(self, model=None, route=None):
+        """p50/p90/p99 of TTFT, throughput and worst gap over successful network requests"""
+        records = [r for r in self.snapshot(model, route) if r['outcome'] == 'ok']
+        summary = {'requests': len(records)}
+        for field in ('ttft_ms', 'tokens_per_second', 'max_gap_ms'):
+            values = [r[field] for r in records if r[field] is not None]
+            for q in (50, 90, 99):
+                summary[f'{field}_p{q}'] = percentile(values, q) if values else None
+        return summary
+
+    @staticmethod
+    def append_csv(path, result):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            if new:
+                writer.writeheader()
+            writer.writerow(result)
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(self.snapshot())
+
+    def prometheus_text(self):
+        records = self.snapshot()
+        groups = {}
+        for r in records:
+            groups.setdefault((r['model'], r['route']), []).append(r)
+
+        lines = []
+        summaries = (
+            ('ttft_seconds', 'Time to first token', 'ttft_ms', 1000),
+            ('tokens_per_second', 'Completion tokens per second while generating', 'tokens_per_second', 1),
+            ('max_gap_seconds', 'Longest gap between chunks', 'max_gap_ms', 1000)
+        )
+        for name, help_text, field, scale in summaries:
+            lines += [f"# HELP pyroutstr_{name} {help_text}", f"# TYPE pyroutstr_{name} summary"]
+            for (model, route), group in sorted(groups.items()):
+                values = [r[field] / scale for r in group if r['outcome'] == 'ok' and r[field] is not None]
+                if not values:
+                    continue
+                labels = f'model="{label(model)}",route="{route}"'
+                for q in (50, 90, 99):
+                    lines.append(f'pyroutstr_{name}{{{labels},quantile="{q / 100:g}"}} {percentile(values, q):g}')
+                lines.append(f"pyroutstr_{name}_sum{{{labels}}} {sum(values):g}")
+                lines.append(f"pyroutstr_{name}_count{{{labels}}} {len(values)}")
+
+        lines += ["# HELP pyroutstr_requests Streaming requests in the buffer by outcome",
+                  "# TYPE pyroutstr_requests gauge"]
+        counts = {}
+        for r in records:
+            key = (r['model'], r['route'], r['outcome'])
+            counts[key] = counts.get(key, 0) + 1
+        for (model, route, outcome), count in sorted(counts.items()):
+            lines.append(f'pyroutstr_requests{{model="{label(model)}",route="{route}",outcome="{outcome}"}} {count}')
+
+        lines += ["# HELP pyroutstr_stalls Gaps between chunks over the stall threshold",
+                  "# TYPE pyroutstr_stalls gauge"]
+        for (model, route), group in sorted(groups.items()):
+            stalls = sum(r['stalls'] for r in group)
+            lines.append(f'pyroutstr_stalls{{model="{label(model)}",route="{route}"}} {stalls}')
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path):
+        # Written whole then renamed, so a scraper never reads half a file
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+# Shared by every front end in the process
+telemetry = LatencyTelemetry.from_env()
@@ -0,0 +1,63 @@
+"""Offline token counting"""
+import os
+import re
+
+# Pre-tokenizer close to the BPE splits used by GPT/Claude-style tokenizers:
+# words, 1-3 digit groups, punctuation runs and newlines
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]+|\n+")
+
+def estimate_tokens(text):
+    """Offline token estimate from the pre-tokenizer pieces"""
+    tokens = 0
+    for piece in TOKEN_PATTERN.findall(text):
+        if not piece.isascii():
+            # Non-Latin scripts are roughly one token per character
+            tokens += len(piece)
+        elif len(piece) <= 6:
+            tokens += 1
+        elif piece[0].isalpha():
+            tokens += (len(piece) + 5) // 6
+        else:
+            tokens += (len(piece) + 1) // 2
+    return tokens
+
+class TokenCounter:
+    """Counts tokens offline
+
+    Uses the built-in estimator by default. With TOKENIZER=tiktoken the
+    tiktoken encoding is used instead when it is installed and available
+    locally, falling back to the estimator otherwise.
+    """
+
+    def __init__(self, backend='estimate', encoding_name='o200k_base'):
+        self.backend = backend
+        self.encoding_name = encoding_name
+        self.encoding = None
+
+    def load(self):
+        """Load the tiktoken encoding; call from a background thread"""
+        if self.backend != 'tiktoken' or self.encoding is not None:
+            return
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            print(f"Warning: tiktoken unavailable, using the built-in token estimator: {e}")
+            self.backend = 'estimate'
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+token_counter = TokenCounter(
+    backend=os.getenv('TOKENIZER', 'estimate'),
+    encoding_name=os.getenv('TIKTOKEN_ENCODING', 'o200k_base')
+)
+
+def message_tokens(message):
+    """Token count of a chat message, memoized on the message under 'tokens'"""
+    if 'tokens' not in message:
+        # Every message carries a few tokens of role/formatting overhead
+        message['tokens'] = token_counter.count(message.get('content') or '') + 4
+    return message['tokens']
@@ -0,0 +1,149 @@
+"""Pooled HTTP clients for all Routstr traffic"""
+import os
+import socket
+import threading
+from concurrent.futures import Future
+
+from .config import TOR_PROXY
+
+class ConnectionManager:
+    """Process-wide keep-alive httpx clients, one pool per route (clearnet or Tor)"""
+
+    def __init__(self, max_connections=20, max_keepalive=10, keepalive_expiry=60.0, http2=False, timeout=30.0,
+                 cassette_path=None):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.timeout = timeout
+        self.cassette_path = cassette_path
+        self.cassette = None
+        self.cassette_lock = threading.Lock()
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', '20')),
+            max_keepalive=int(os.getenv('HTTP_MAX_KEEPALIVE', '10')),
+            keepalive_expiry=float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60')),
+            http2=os.getenv('HTTP2', '0').lower() in ('1', 'true', 'yes'),
+            cassette_path=os.getenv('CASSETTE') or None
+        )
+
+    def client(self, use_tor=False):
+        """Return the shared client for a route, creating it on first use"""
+        route = 'tor' if use_tor else 'clearnet'
+        with self.lock:
+            if route not in self.clients:
+                self.clients[route] = self.create_client(use_tor)
+            return self.clients[route]
+
+    def get_cassette(self):
+        """The record/replay cassette (see routstr.cassette), loaded on first use"""
+        # Called from client() with self.lock held
+        with self.cassette_lock:
+            if self.cassette is None:
+                from .cassette import Cassette
+                self.cassette = Cassette.from_env(self.cassette_path)
+            return self.cassette
+
+    def create_client(self, use_tor, asynchronous=False):
+        """A new client with this manager's pool settings; `asynchronous` for the network engine"""
+        import httpx
+
+        transport_class, client_class = (
+            (httpx.AsyncHTTPTransport, httpx.AsyncClient) if asynchronous else (httpx.HTTPTransport, httpx.Client)
+        )
+        cassette = self.get_cassette() if self.cassette_path else None
+        if cassette is not None and cassette.mode == 'replay':
+            # Offline: no pool, proxy or Tor needed
+            return client_class(transport=cassette.wrap(None, asynchronous), timeout=self.timeout)
+
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("Warning: HTTP/2 requested but h2 is not installed. Install with: pip install httpx[http2]")
+                self.http2 = False
+
+        transport = transport_class(
+            proxy=TOR_PROXY if use_tor else None,
+            limits=limits,
+            http2=self.http2
+        )
+        if cassette is not None:
+            transport = cassette.wrap(transport, asynchronous)
+        return client_class(transport=transport, timeout=self.timeout)
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients = {}
+
+def abort_stream(stream):
+    """Close a streaming response now, even while another thread is blocked reading it
+
+    Closing the response alone only takes effect when the next chunk
+    arrives; shutting the socket down wakes the reader immediately and
+    tells the server to stop generating. HTTP/2 connections carry other
+    streams, so those are only closed.
+    """
+    if hasattr(stream, 'abort'):
+        # Composite streams (HedgedStream) abort their own parts
+        stream.abort()
+        return
+    if isinstance(stream, Future):
+        # A coroutine on the network engine; cancelling it closes its stream
+        stream.cancel()
+        return
+
+    response = getattr(stream, 'response', stream)
+    network_stream = response.extensions.get('network_stream')
+    if network_stream is not None and response.http_version != 'HTTP/2':
+        sock = network_stream.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    response.close()
+
+class CancelToken:
+    """Lets another thread stop one streaming request
+
+    The worker attaches its stream once the request is open; cancel()
+    aborts it right away, or as soon as it is attached.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.stream = None
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def attach(self, stream):
+        with self.lock:
+            self.stream = stream
+        if self.cancelled:
+            abort_stream(stream)
+
+    def cancel(self):
+        self.event.set()
+        with self.lock:
+            stream = self.stream
+        if stream is not None:
+            abort_stream(stream)
+
+# Shared by every Routstr call in the process
+connection_manager = ConnectionManager.from_env()
@@ -0,0 +1,114 @@
+"""Routstr wallet calls (balance, API keys, top-ups)"""
+import threading
+import time
+
+from .config import ROUTSTR_BASE_URL
+from .engine import engine
+from .transport import connection_manager
+
+class WalletError(Exception):
+    """Non-200 answer from a Routstr wallet endpoint"""
+
+    def __init__(self, status_code, text):
+        super().__init__(text)
+        self.status_code = status_code
+        self.text = text
+
+class WalletService:
+    """Wallet calls: blocking for scripts, or as tasks on the network engine for UIs
+
+    get_info() and top_up() deliver results through `schedule`, which must
+    run the callback on the UI thread, e.g. a CallbackBridge's post().
+    """
+
+    def __init__(self, schedule, balance_ttl=60.0):
+        self.schedule = schedule
+        self.balance_ttl = balance_ttl
+        self.balances = {}
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def submit(self, coro, on_success, on_error):
+        def done(future):
+            with self.lock:
+                self.pending.discard(future)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                self.schedule(on_error, error)
+            else:
+                self.schedule(on_success, future.result())
+
+        future = engine.submit(coro)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(done)
+
+    @staticmethod
+    def headers(api_key):
+        return {"Authorization": f"Bearer {api_key}"}
+
+    def read_info(self, api_key, response):
+        if response.status_code != 200:
+            raise WalletError(response.status_code, response.text)
+
+        data = response.json()
+        with self.lock:
+            self.balances[api_key] = (data.get('balance', 0), time.monotonic())
+        return data
+
+    def read_top_up(self, api_key, response):
+        if response.status_code != 200:
+            raise WalletError(response.status_code, response.text)
+
+        # The stored balance is no longer accurate
+        with self.lock:
+            self.balances.pop(api_key, None)
+        return response.json() if response.content else {}
+
+    def fetch_info(self, api_key, use_tor):
+        client = connection_manager.client(use_tor)
+        response = client.get(f"{ROUTSTR_BASE_URL}/wallet/info", headers=self.headers(api_key))
+        return self.read_info(api_key, response)
+
+    async def fetch_info_async(self, api_key, use_tor):
+        client = engine.http_client(use_tor)
+        response = await client.get(f"{ROUTSTR_BASE_URL}/wallet/info", headers=self.headers(api_key))
+        return self.read_info(api_key, response)
+
+    def post_top_up(self, api_key, token, use_tor):
+        client = connection_manager.client(use_tor)
+        response = client.post(
+            f"{ROUTSTR_BASE_URL}/wallet/topup", params={"cashu_token": token}, headers=self.headers(api_key)
+        )
+        return self.read_top_up(api_key, response)
+
+    async def post_top_up_async(self, api_key, token, use_tor):
+        client = engine.http_client(use_tor)
+        response = await client.post(
+            f"{ROUTSTR_BASE_URL}/wallet/topup", params={"cashu_token": token}, headers=self.headers(api_key)
+        )
+        return self.read_top_up(api_key, response)
+
+    def get_info(self, api_key, use_tor, on_success, on_error):
+        """Fetch /wallet/info (balance, api_key) for a key or cashu token"""
+        self.submit(self.fetch_info_async(api_key, use_tor), on_success, on_error)
+
+    def top_up(self, api_key, token, use_tor, on_success, on_error):
+        self.submit(self.post_top_up_async(api_key, token, use_tor), on_success, on_error)
+
+    def cached_balance(self, api_key):
+        """Return (balance, is_fresh) from the last successful lookup, or None"""
+        with self.lock:
+            cached = self.balances.get(api_key)
+        if cached is None:
+            return None
+        balance, fetched_at = cached
+        return balance, time.monotonic() - fetched_at < self.balance_ttl
+
+    def shutdown(self):
+        with self.lock:
+            pending, self.pending = self.pending, set()
+        for future in pending:
+            future.cancel()